@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiohttp
+
+from typing import Dict
+from typing import List
+
+from IBClient import IDEMPOTENT_POST_ENDPOINTS
+from IBClient import json_loads
+from Metrics import Metrics
+from RequestScheduler import RequestScheduler
+from SecdefCache import SecdefCache
+
+logger = logging.getLogger(__name__)
+
+class AsyncIBClient:
+    """
+        asyncio version of IBClient with the same endpoint surface. All requests share one
+        aiohttp connection pool, so independent calls can be awaited concurrently.
+        Use it as an async context manager, which opens the pool and authenticates:
+
+            async with AsyncIBClient() as client:
+                accounts = await client.portfolio_accounts()
+    """
+
+    def __init__(self,
+                 base_url: str = "https://localhost:5000/v1/portal/",
+                 pool_size: int = 10,
+                 max_retries: int = 3,
+                 backoff_factor: float = 0.3,
+                 timeout: float = 30,
+                 secdef_cache: SecdefCache = None,
+                 scheduler: RequestScheduler = None,
+                 metrics: Metrics = None):
+        self.baseUrl = base_url
+        self.secdef_cache = secdef_cache
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.authenticated = False
+
+    async def __aenter__(self):
+        await self.open()
+        self.authenticated = await self._authenticate()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ssl=False)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=self.timeout,
+                                                 headers={'Content-Type': 'application/json'})
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _authenticate(self) -> bool:
+        max_retries = 4
+
+        for _ in range(max_retries):
+            auth_response = await self.authentication_status()
+            if auth_response is None:
+                return False
+
+            if 'statusCode' in auth_response.keys() and auth_response['statusCode'] == 401:
+                print("Server isn't connected. Authentication Failed")
+                return False
+
+            elif 'authenticated' in auth_response.keys() and auth_response['authenticated'] is True:
+                return True
+
+            elif 'authenticated' in auth_response.keys() and auth_response['authenticated'] is False:
+                await self.validate_SSO()
+                await self.reauthenticate()
+                await self.brokerage_accounts()
+
+        return False
+
+    def _build_url(self, endpoint):
+        return self.baseUrl + endpoint
+
+    def _is_retryable(self, endpoint: str, req_type: str) -> bool:
+        return req_type == 'GET' or (req_type == 'POST' and endpoint in IDEMPOTENT_POST_ENDPOINTS)
+
+    async def _make_request(self, endpoint: str, req_type: str, params: Dict = None) -> Dict:
+        """Handles the request to the client.
+        Same contract as IBClient._make_request: 'GET' params are sent as the query string,
+        'POST' params as the json payload, and None is returned for a failed request.
+        The retry policy mirrors IBClient as well: GETs and read-only POSTs are retried with
+        backoff on connection errors and 429/5xx, order endpoints are never replayed.
+        """
+
+        url = self._build_url(endpoint=endpoint)
+        kwargs = {}
+        if params is not None:
+            kwargs['params' if req_type == 'GET' else 'json'] = params
+
+        retryable = self._is_retryable(endpoint, req_type)
+        attempt = 0
+        while True:
+            if self.scheduler is not None:
+                await self.scheduler.acquire_async(endpoint, req_type)
+            start = time.perf_counter()
+            try:
+                async with self.session.request(req_type, url, **kwargs) as response:
+                    if self.metrics is not None and self.metrics.enabled:
+                        body = await response.read()
+                        self.metrics.record_request(endpoint, req_type, response.status, time.perf_counter() - start,
+                                                    request_bytes=len(json.dumps(params)) if 'json' in kwargs else 0,
+                                                    response_bytes=len(body),
+                                                    retries=1 if attempt else 0)
+                    # a 429 was turned away before the gateway acted on it, with a scheduler any
+                    # request goes again once the scheduler has backed off for Retry-After
+                    paced_retry = response.status == 429 and self.scheduler is not None
+                    if paced_retry:
+                        self.scheduler.penalize(endpoint, req_type, float(response.headers.get('Retry-After', 1)))
+                    retry_status = paced_retry or (retryable and response.status in (429, 500, 502, 503, 504))
+                    if response.ok:
+                        return json_loads(await response.read())
+                    elif not retry_status or attempt >= self.max_retries:
+                        if self.metrics is not None:
+                            self.metrics.record_error(endpoint, req_type, response.status)
+                        logger.warning("BAD REQUEST - STATUS CODE: %s URL: %s TEXT: %s",
+                                       response.status, response.url, await response.text())
+                        return None
+            except aiohttp.ClientConnectionError:
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                paced_retry = False
+
+            if not paced_retry:  # after a 429 the scheduler's acquire waits out the penalty
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    """
+        PORTFOLIO ACCOUNTS ENDPOINTS
+    """
+
+    async def portfolio_accounts(self):
+        """See IBClient.portfolio_accounts."""
+
+        endpoint = 'portfolio/accounts'
+        req_type = 'GET'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def portfolio_subaccounts(self):
+        """See IBClient.portfolio_subaccounts."""
+
+        endpoint = 'portfolio/subaccounts'
+        req_type = 'GET'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def brokerage_accounts(self):
+        """See IBClient.brokerage_accounts."""
+
+        endpoint = r'iserver/accounts'
+        req_type = 'GET'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def portfolio_account_positions(self, account_id: str, page_id: int = 0) -> Dict:
+        """See IBClient.portfolio_account_positions."""
+
+        endpoint = r'portfolio/{}/positions/{}'.format(account_id, page_id)
+        req_type = 'GET'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def market_data(self, conids: List[int], since: str = None, fields: List[str] = ['31']) -> Dict:
+        """See IBClient.market_data."""
+
+        endpoint = r'iserver/marketdata/snapshot'
+        req_type = 'GET'
+
+        params = {}
+        params['conids'] = ",".join(str(conid) for conid in conids)
+        params['fields'] = ",".join(str(field) for field in fields)
+        if since is not None:
+            params['since'] = since
+
+        content = await self._make_request(endpoint=endpoint, req_type=req_type, params=params)
+        # the first request for a conid often comes back without all fields,
+        # SnapshotFetcher polls again for the incomplete conids
+        return content
+
+    async def reauthenticate(self) -> Dict:
+        """See IBClient.reauthenticate."""
+
+        endpoint = r'iserver/reauthenticate'
+        req_type = 'POST'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def authentication_status(self) -> Dict:
+        """See IBClient.authentication_status."""
+
+        endpoint = r'iserver/auth/status'
+        req_type = 'POST'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def validate_SSO(self) -> Dict:
+        """See IBClient.validate_SSO."""
+
+        endpoint = r'sso/validate'
+        req_type = 'GET'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def tickle(self) -> Dict:
+        """See IBClient.tickle."""
+
+        endpoint = r'tickle'
+        req_type = 'POST'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def contracts_definitions(self, conids: List[int]) -> List[Dict]:
+        """See IBClient.contracts_definitions."""
+
+        cached = {}
+        if self.secdef_cache is not None:
+            cached = self.secdef_cache.get_many(conids)
+        missing = [conid for conid in conids if conid not in cached]
+        if not missing:
+            return list(cached.values())
+
+        endpoint = '/trsrv/secdef'
+        req_type = 'POST'
+        payload = {
+            'conids': missing
+            }
+        content = await self._make_request(endpoint=endpoint, req_type=req_type, params=payload)
+
+        fetched = content['secdef']
+        if self.secdef_cache is not None:
+            self.secdef_cache.put_many(fetched)
+        return list(cached.values()) + fetched
+
+    async def place_order(self, account_id: str, order: Dict, confirm=True) -> Dict:
+        """See IBClient.place_order."""
+
+        endpoint = r'iserver/account/{}/order'.format(account_id)
+        req_type = 'POST'
+        return await self._make_request(endpoint=endpoint, req_type=req_type, params=order)
+
+    async def place_orders(self, account_id: str, orders: List[Dict]) -> List[Dict]:
+        """See IBClient.place_orders."""
+
+        endpoint = r'iserver/account/{}/orders'.format(account_id)
+        req_type = 'POST'
+        payload = orders if isinstance(orders, dict) else {'orders': orders}
+        return await self._make_request(endpoint=endpoint, req_type=req_type, params=payload)
+
+    async def place_order_reply(self, reply_id: str = None, reply: bool = True):
+        """See IBClient.place_order_reply."""
+
+        endpoint = r'iserver/reply/{}'.format(reply_id)
+        req_type = 'POST'
+        reply = {'confirmed': reply}
+        return await self._make_request(endpoint=endpoint, req_type=req_type, params=reply)
+
+    async def get_live_orders(self):
+        """See IBClient.get_live_orders."""
+
+        endpoint = r'iserver/account/orders'
+        req_type = 'GET'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def delete_order(self, account_id: str, order_id: str) -> Dict:
+        """See IBClient.delete_order."""
+
+        endpoint = r'iserver/account/{}/order/{}'.format(account_id, order_id)
+        req_type = 'DELETE'
+        return await self._make_request(endpoint=endpoint, req_type=req_type)
+
+    async def modify_order(self, account_id: str, local_order_id: str, order: Dict) -> Dict:
+        """See IBClient.modify_order."""
+
+        endpoint = r'iserver/account/{}/order/{}'.format(account_id, local_order_id)
+        req_type = 'POST'
+        return await self._make_request(endpoint=endpoint, req_type=req_type, params=order)
@@ -1,6 +1,16 @@
+from collections import Counter
 from typing import Dict
 from typing import List
 
+# campaign type for each combination of position types, a single position type names the campaign itself
+COMBINED_TYPES = {
+    frozenset({"SHORT PUT", "SHORT CALL"}): "SHORT PUT&CALL",  # TODO: distinguish straddle, swamp, strangle by strike price of call and put
+    frozenset({"LONG CALL", "SHORT CALL"}): "PMCC",
+    frozenset({"LONG STK", "SHORT CALL"}): "CC",
+    frozenset({"SHORT PUT", "SHORT CALL", "LONG CALL"}): "PMCC & SHORT PUT",
+}
+
+
 class Campaign:
     def __init__(self, und_conid, ticker, currency):
         self.und_conid = und_conid
@@ -12,42 +22,77 @@ class Campaign:
         self.type = None # stock, short_put, short_call, short_put&short_call, poor_man_covered_call, pmcc&short_put
         self.margin = None
         self.implied_capital = None
+        self.worst_loss = None  # set with margin and implied_capital by a RiskGrid, None until revalued
+
+        # running aggregates, kept up to date on every add/remove/resize
+        self._type_counts = Counter()
 
     def add_position(self, position):
-        # TODO: for the existing conid, adjust the size.
-        self.positions[position.contract.conid] = position
+        """
+            Adds a position, or nets its size into the position already held for the same conid.
+            Adding the position object that is already held is a no-op.
+        """
+        conid = position.contract.conid
+        if self.positions.get(conid) is position:
+            return
+        if conid in self.positions:
+            self.resize_position(conid, self.positions[conid].size + position.size)
+            return
+        self.positions[conid] = position
+        self._add_contribution(position)
+        self._update_attributes()
+
+    def remove_position(self, conid):
+        position = self.positions.pop(conid, None)
+        if position is not None:
+            self._remove_contribution(position)
+            self._update_attributes()
+        return position
+
+    def resize_position(self, conid, size):
+        """Sets the size of a held position, e.g. after a fill. A size of 0 removes it."""
+        position = self.positions[conid]
+        if size == 0:
+            self.remove_position(conid)
+            return
+        self._remove_contribution(position)
+        position.size = size
+        position.set_type()
+        self._add_contribution(position)
         self._update_attributes()
 
+    def _add_contribution(self, position):
+        self._type_counts[position.type] += 1
+
+    def _remove_contribution(self, position):
+        self._type_counts[position.type] -= 1
+        if self._type_counts[position.type] <= 0:
+            del self._type_counts[position.type]
+
     def _update_attributes(self):
         self.type = self._get_type()
         self._update_implied_capital()
         self._update_margin()
 
     def _get_type(self):
-        type_set = set()
-        for conid in self.positions.keys():
-            pos = self.positions[conid]
-            type_set.add(pos.type)
+        type_set = frozenset(self._type_counts.keys())
         if len(type_set) == 1:
-            return type_set.pop()
-        elif len(type_set) == 2:
-            if type_set == {"SHORT PUT", "SHORT CALL"}:
-                return "SHORT PUT&CALL" # TODO: distinguish straddle, swamp, strangle by strike price of call and put
-            elif type_set == {"LONG CALL", "SHORT CALL"}:
-                return "PMCC"
-            elif type_set == {"LONG STK", "SHORT CALL"}:
-                return "CC"
-        elif len(type_set) ==3:
-            if type_set == {"SHORT PUT", "SHORT CALL", "LONG CALL"}:
-                return "PMCC & SHORT PUT"
-
-        return "others"
+            return next(iter(type_set))
+        return COMBINED_TYPES.get(type_set, "others")
 
+    # scenario losses don't add up across legs that hedge each other, so margin and implied capital
+    # come from revaluing the whole campaign (see RiskGrid) and go stale when its positions change
     def _update_margin(self):
-        pass
+        self.margin = None
 
     def _update_implied_capital(self):
-        pass
+        self.implied_capital = None
+        self.worst_loss = None
+
+    def set_risk(self, margin: float, implied_capital: float, worst_loss: float):
+        self.margin = margin
+        self.implied_capital = implied_capital
+        self.worst_loss = worst_loss
 
     def get_target_orders(self) -> List[Dict]:
         orders = []
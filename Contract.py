@@ -1,19 +1,26 @@
 from datetime import datetime
 
+from TargetPricer import DEFAULT_CURVE
+
 
 class Contract:
+    __slots__ = ('conid', 'asset_class', 'currency', 'mkt_price', 'last_update', 'und_conid',
+                 'ticker', 'expiry', 'expiry_date', 'strike', 'put_or_call', 'multiplier', 'und_price',
+                 'dte', 'intrinsic', 'extrinsic', 'ann_extrinsic', 'target', 'target_priced',
+                 'iv', 'delta', 'gamma', 'theta', 'vega')
 
-    def __init__(self, conid, asset_class, currency, mkt_price):
+    def __init__(self, conid, asset_class, currency, mkt_price, last_update=None):
         self.conid = conid
         self.asset_class = asset_class
         self.currency = currency
         self.mkt_price = mkt_price
-        self.last_update = self._date_and_time()
+        self.last_update = last_update or self._date_and_time()
         self.und_conid = conid  # und means underlying, default for STK
 
         # for option contract
         self.ticker = None
         self.expiry = None
+        self.expiry_date = None  # expiry parsed once, as a datetime
         self.strike = None
         self.put_or_call = None
         self.multiplier = None
@@ -25,6 +32,14 @@ class Contract:
         self.extrinsic = None
         self.ann_extrinsic = None
         self.target = None
+        self.target_priced = False  # set by TargetPricer, whose target moneyness updates leave alone
+
+        # greeks, per share, see GreeksBook
+        self.iv = None
+        self.delta = None
+        self.gamma = None
+        self.theta = None
+        self.vega = None
 
     @staticmethod
     def _date_and_time():
@@ -33,12 +48,11 @@ class Contract:
 
     @staticmethod
     def _get_ann_target(dte):
-        # TODO: adjust ann_target by dte
-        return 0.1
+        # the default curve; curves per underlying or campaign type are applied by TargetPricer
+        return DEFAULT_CURVE.ann_target(dte)
 
     def _set_moneyness(self):
-        expiry = datetime.strptime(self.expiry, "%Y%m%d")
-        self.dte = (expiry - datetime.now()).days
+        self.dte = (self.expiry_date - datetime.now()).days
         if self.put_or_call == "P":
             self.intrinsic = max(0, -self.und_price+self.strike)
         else:
@@ -46,20 +60,33 @@ class Contract:
         self.extrinsic = self.mkt_price - self.intrinsic
         self.ann_extrinsic = self.extrinsic/self.strike * (365/self.dte)
 
+        if self.target_priced:  # priced on the curve and tick of its campaign, see TargetPricer
+            return
         ann_target = self._get_ann_target(self.dte)
         self.target = ann_target * self.strike * self.dte/365
         self.target = round(self.target, 2)
 
+    def _can_set_moneyness(self):
+        return self.asset_class == "OPT" and self.mkt_price is not None and self.und_price is not None
+
     def set_mkt_price(self, mkt_price):
         self.last_update = self._date_and_time()
         self.mkt_price = mkt_price
-        if self.asset_class == "OPT" and self.mkt_price is not None and self.und_price is not None:
+        if self._can_set_moneyness():
             self._set_moneyness()
 
     def set_und_price(self, und_price):
         self.last_update = self._date_and_time()
         self.und_price = und_price
-        if self.asset_class == "OPT" and self.mkt_price is not None and self.und_price is not None:
+        if self._can_set_moneyness():
+            self._set_moneyness()
+
+    def set_prices(self, mkt_price, und_price, update_moneyness=True):
+        """Sets both prices with one moneyness update, or none when the caller runs MoneynessBook."""
+        self.last_update = self._date_and_time()
+        self.mkt_price = mkt_price
+        self.und_price = und_price
+        if update_moneyness and self._can_set_moneyness():
             self._set_moneyness()
 
     def set_detail(self, detail):
@@ -67,6 +94,7 @@ class Contract:
 
         if self.asset_class == "OPT":
             self.expiry = detail['expiry']
+            self.expiry_date = datetime.strptime(self.expiry, "%Y%m%d")
             self.strike = detail['strike']
             self.put_or_call = detail['putOrCall']
             self.multiplier = detail['multiplier']
@@ -0,0 +1,67 @@
+from gspread.utils import a1_to_rowcol
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+
+
+class FakeWorksheet:
+    """
+        In-memory stand-in for the part of the gspread Worksheet interface SheetSync uses, so a
+        sync can be run and checked without Google credentials. Cells are kept as text, the way
+        get_all_values returns them.
+
+            sheet = FakeWorksheet([["conid", "mktPrice", "undPrice"]])
+            SheetSync(worksheet=sheet).sync(positions)
+            sheet.get_all_values(), sheet.calls
+    """
+
+    def __init__(self, values: List[List[str]] = None, rows: int = 1000, cols: int = 26):
+        self.row_count = rows
+        self.col_count = cols
+        self.cells = {}  # (row, col) -> text, 1-based like the sheet
+        self.calls = {'get_all_values': 0, 'row_values': 0, 'batch_update': 0, 'add_rows': 0}
+        self.cells_written = 0
+        for row_number, row in enumerate(values or [], start=1):
+            for col, value in enumerate(row, start=1):
+                if value != "":
+                    self.cells[(row_number, col)] = str(value)
+
+    def _check(self, row: int, col: int):
+        if row > self.row_count or col > self.col_count:
+            raise ValueError("Range exceeds grid limits. Max rows: {}, max columns: {}".format(
+                self.row_count, self.col_count))
+
+    def row_values(self, row: int) -> List[str]:
+        self.calls['row_values'] += 1
+        width = max((c for r, c in self.cells if r == row), default=0)
+        return [self.cells.get((row, col), "") for col in range(1, width + 1)]
+
+    def get_all_values(self) -> List[List[str]]:
+        self.calls['get_all_values'] += 1
+        if not self.cells:
+            return []
+        height = max(r for r, _ in self.cells)
+        width = max(c for _, c in self.cells)
+        return [[self.cells.get((row, col), "") for col in range(1, width + 1)] for row in range(1, height + 1)]
+
+    def add_rows(self, rows: int):
+        self.calls['add_rows'] += 1
+        self.row_count += rows
+
+    def batch_update(self, data: Iterable[Dict], value_input_option=None) -> Dict:
+        self.calls['batch_update'] += 1
+        for item in data:
+            start, _, end = item['range'].partition(':')
+            first_row, first_col = a1_to_rowcol(start)
+            last_row, last_col = a1_to_rowcol(end or start)
+            self._check(last_row, last_col)
+            for row_offset, row in enumerate(item['values']):
+                for col_offset, value in enumerate(row):
+                    key = (first_row + row_offset, first_col + col_offset)
+                    if value == "" or value is None:
+                        self.cells.pop(key, None)
+                    else:
+                        self.cells[key] = str(value)
+                    self.cells_written += 1
+        return {'totalUpdatedCells': self.cells_written}
@@ -0,0 +1,345 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from typing import Dict
+from typing import List
+
+
+class SyntheticPortfolio:
+    """
+        A made-up book of option legs spread over a number of underlyings, in the shapes the
+        gateway returns them: position rows, secdefs and prices keyed by conid.
+        Underlyings get conids 1..n_underlyings, option legs start at 1000000. The legs are dealt
+        out over the accounts, or with shared_legs every account holds every leg, as sub-accounts
+        of an advisor following the same strategy do.
+    """
+
+    def __init__(self, n_legs: int, n_underlyings: int = None, accounts: List[str] = ('U1000000',),
+                 shared_legs: bool = False, seed: int = 0):
+        rng = random.Random(seed)
+        n_underlyings = n_underlyings or max(1, n_legs // 10)
+        today = datetime.now()
+        expiries = [(today + timedelta(days=days)).strftime("%Y%m%d") for days in (7, 14, 30, 45, 60, 90, 180, 365)]
+
+        self.accounts = list(accounts)
+        self.positions = {account: [] for account in self.accounts}  # account -> position rows
+        self.secdefs = {}  # conid -> secdef
+        self.prices = {}  # conid -> last price
+
+        # each underlying follows one strategy, which decides the kind of legs it gets
+        strategies = {}
+        for und in range(1, n_underlyings + 1):
+            strategies[und] = rng.choice(("SHORT PUT", "SHORT CALL", "SHORT PUT&CALL", "PMCC"))
+            self.prices[und] = round(rng.uniform(20, 400), 2)
+            self.secdefs[und] = {'conid': und, 'ticker': 'SYM{}'.format(und), 'assetClass': 'STK',
+                                 'currency': 'USD', 'undConid': und}
+
+        for i in range(n_legs):
+            conid = 1000000 + i
+            und = rng.randint(1, n_underlyings)
+            und_price = self.prices[und]
+            strategy = strategies[und]
+            put_or_call = "P" if strategy == "SHORT PUT" else "C" if strategy != "SHORT PUT&CALL" else rng.choice('PC')
+            strike = round(und_price * rng.uniform(0.8, 1.2))
+            price = round(max(0.05, rng.gauss(0.03, 0.02) * und_price), 2)
+            self.prices[conid] = price
+            self.secdefs[conid] = {'conid': conid, 'ticker': 'SYM{}'.format(und), 'assetClass': 'OPT',
+                                   'currency': 'USD', 'expiry': rng.choice(expiries), 'strike': float(strike),
+                                   'putOrCall': put_or_call, 'multiplier': '100', 'undConid': und}
+            short = strategy != "PMCC" or rng.random() < 0.7
+            for account in self.accounts if shared_legs else [self.accounts[i % len(self.accounts)]]:
+                size = -rng.randint(1, 10) if short else rng.randint(1, 5)
+                self.positions[account].append({'acctId': account, 'conid': conid, 'position': size,
+                                                'assetClass': 'OPT', 'currency': 'USD', 'mktPrice': price,
+                                                'avgPrice': round(price * rng.uniform(0.8, 1.5), 2),
+                                                'contractDesc': 'SYM{} {} {}'.format(und, strike, put_or_call)})
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class GatewaySimulator:
+    """
+        Local stand-in for the Client Portal gateway, serving the endpoints IBClient uses from a
+        SyntheticPortfolio: auth status, tickle, portfolio accounts/subaccounts, paged positions,
+        secdef, snapshots whose fields only fill in after `fill_after` requests, and orders with
+        a confirmation question per order, replies, live orders, modify and cancel.
+
+            sim = GatewaySimulator(SyntheticPortfolio(1000), latency=0.002).start()
+            client = IBClient(base_url=sim.base_url)
+            ...
+            sim.stop()
+
+        `latency` (+ up to `jitter`) seconds are added to every response and, with `rate_limit`
+        set, requests beyond that many per second are answered 429.
+    """
+
+    def __init__(self, portfolio: SyntheticPortfolio, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: float = None, page_size: int = 30, fill_after: int = 1,
+                 questions_per_order: int = 1, host: str = '127.0.0.1', port: int = 0):
+        self.portfolio = portfolio
+        self.latency = latency
+        self.jitter = jitter
+        self.bucket = _TokenBucket(rate_limit) if rate_limit else None
+        self.page_size = page_size
+        self.fill_after = fill_after
+        self.questions_per_order = questions_per_order
+
+        self.requests = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._snapshot_requests = {}  # conid -> times requested
+        self._next_order_id = 1
+        self._orders = {}  # order id -> live order
+        self._replies = {}  # reply id -> (questions left, account, order payload, order id to modify)
+
+        simulator = self
+
+        class Handler(_Handler):
+            sim = simulator
+
+        self._routes = [(method, re.compile(pattern), handler) for method, pattern, handler in self.routes()]
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return "http://{}:{}/v1/portal/".format(*self.server.server_address[:2])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    """
+        ENDPOINTS
+    """
+
+    def auth_status(self, body, query):
+        return {'authenticated': True, 'connected': True, 'competing': False}
+
+    def tickle(self, body, query):
+        return {'session': 'simulated', 'iserver': {'authStatus': {'authenticated': True, 'connected': True}}}
+
+    def ok(self, body, query):
+        return {}
+
+    def brokerage_accounts(self, body, query):
+        return {'accounts': self.portfolio.accounts, 'selectedAccount': self.portfolio.accounts[0]}
+
+    def portfolio_accounts(self, body, query):
+        return [{'accountId': account, 'id': account} for account in self.portfolio.accounts[:1]]
+
+    def portfolio_subaccounts(self, body, query):
+        return [{'accountId': account, 'id': account} for account in self.portfolio.accounts]
+
+    def positions(self, body, query, account_id, page_id):
+        rows = self.portfolio.positions.get(account_id, [])
+        start = int(page_id) * self.page_size
+        return rows[start:start + self.page_size]
+
+    def secdef(self, body, query):
+        return {'secdef': [self.portfolio.secdefs[int(conid)] for conid in body.get('conids', [])
+                           if int(conid) in self.portfolio.secdefs]}
+
+    def snapshot(self, body, query):
+        conids = [int(conid) for conid in query.get('conids', [''])[0].split(',') if conid]
+        fields = [field for field in query.get('fields', [''])[0].split(',') if field]
+        content = []
+        with self._lock:
+            for conid in conids:
+                seen = self._snapshot_requests.get(conid, 0)
+                self._snapshot_requests[conid] = seen + 1
+                item = {'conid': conid, 'conidEx': str(conid), '_updated': int(time.time() * 1000)}
+                if seen >= self.fill_after and conid in self.portfolio.prices:
+                    for field in fields:
+                        if field == '31':
+                            # some quotes are the previous close
+                            prefix = "C" if conid % 7 == 0 else ""
+                            item[field] = "{}{}".format(prefix, self.portfolio.prices[conid])
+                content.append(item)
+        return content
+
+    def _question(self, account_id, order, modify_id=None):
+        reply_id = "{:x}".format(random.getrandbits(64))
+        self._replies[reply_id] = (self.questions_per_order, account_id, order, modify_id)
+        return {'id': reply_id, 'message': ["Are you sure you want to submit this order?"],
+                'isSuppressed': False, 'messageIds': ["o163"]}
+
+    def _accept(self, account_id, order, modify_id=None):
+        if modify_id is not None and modify_id in self._orders:
+            live = self._orders[modify_id]
+            live.update({'price': str(order.get('price')), 'remainingQuantity': order.get('quantity'),
+                         'totalSize': order.get('quantity')})
+            return {'order_id': modify_id, 'local_order_id': live.get('order_ref'), 'order_status': 'PreSubmitted'}
+        order_id = self._next_order_id
+        self._next_order_id += 1
+        self._orders[order_id] = {'acct': account_id, 'orderId': order_id, 'conid': order['conid'],
+                                  'side': order['side'], 'price': str(order.get('price')),
+                                  'remainingQuantity': order.get('quantity'), 'totalSize': order.get('quantity'),
+                                  'orderType': order.get('orderType'), 'status': 'Submitted',
+                                  'order_ref': order.get('cOID')}
+        return {'order_id': order_id, 'local_order_id': order.get('cOID'), 'order_status': 'Submitted'}
+
+    def _submit(self, account_id, order, modify_id=None):
+        if self.questions_per_order > 0:
+            return self._question(account_id, order, modify_id)
+        return self._accept(account_id, order, modify_id)
+
+    def place_order(self, body, query, account_id):
+        with self._lock:
+            return [self._submit(account_id, body)]
+
+    def place_orders(self, body, query, account_id):
+        with self._lock:
+            return [self._submit(account_id, order) for order in body.get('orders', [])]
+
+    def modify_order(self, body, query, account_id, order_id):
+        with self._lock:
+            return [self._submit(account_id, body, int(order_id))]
+
+    def reply(self, body, query, reply_id):
+        with self._lock:
+            left, account_id, order, modify_id = self._replies.pop(reply_id)
+            if left > 1:
+                reply_id = "{:x}".format(random.getrandbits(64))
+                self._replies[reply_id] = (left - 1, account_id, order, modify_id)
+                return [{'id': reply_id, 'message': ["One more confirmation."]}]
+            return [self._accept(account_id, order, modify_id)]
+
+    def live_orders(self, body, query):
+        with self._lock:
+            return {'orders': [dict(order) for order in self._orders.values()], 'snapshot': True}
+
+    def delete_order(self, body, query, account_id, order_id):
+        with self._lock:
+            order = self._orders.get(int(order_id))
+            if order is not None:
+                order['status'] = 'Cancelled'
+            return {'msg': 'Request was submitted', 'order_id': int(order_id), 'conid': -1}
+
+    def routes(self):
+        return [
+            ('POST', r'iserver/auth/status', self.auth_status),
+            ('POST', r'tickle', self.tickle),
+            ('GET', r'sso/validate', self.ok),
+            ('POST', r'iserver/reauthenticate', self.ok),
+            ('GET', r'iserver/accounts', self.brokerage_accounts),
+            ('GET', r'portfolio/accounts', self.portfolio_accounts),
+            ('GET', r'portfolio/subaccounts', self.portfolio_subaccounts),
+            ('GET', r'portfolio/([^/]+)/positions/(\d+)', self.positions),
+            ('POST', r'/?trsrv/secdef', self.secdef),
+            ('GET', r'iserver/marketdata/snapshot', self.snapshot),
+            ('GET', r'iserver/account/orders', self.live_orders),
+            ('POST', r'iserver/account/([^/]+)/orders', self.place_orders),
+            ('POST', r'iserver/account/([^/]+)/order', self.place_order),
+            ('POST', r'iserver/account/([^/]+)/order/(\d+)', self.modify_order),
+            ('DELETE', r'iserver/account/([^/]+)/order/(\d+)', self.delete_order),
+            ('POST', r'iserver/reply/([^/]+)', self.reply),
+        ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    sim = None
+
+    def _route(self, method: str):
+        url = urlparse(self.path)
+        endpoint = url.path.split('/v1/portal/', 1)[-1]
+        for route_method, pattern, handler in self.sim._routes:
+            match = pattern.fullmatch(endpoint) if route_method == method else None
+            if match:
+                return handler, match.groups(), parse_qs(url.query)
+        return None, (), {}
+
+    def _handle(self, method: str):
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length else b''
+        sim = self.sim
+        with sim._lock:
+            sim.requests += 1
+
+        if sim.latency or sim.jitter:
+            time.sleep(sim.latency + random.random() * sim.jitter)
+
+        if sim.bucket is not None and not sim.bucket.take():
+            with sim._lock:
+                sim.rejected += 1
+            return self._send(429, {'error': 'Too many requests'}, {'Retry-After': '1'})
+
+        handler, args, query = self._route(method)
+        if handler is None:
+            return self._send(404, {'error': 'no such endpoint: {} {}'.format(method, self.path)})
+        body = json.loads(raw) if raw else {}
+        self._send(200, handler(body, query, *args))
+
+    def _send(self, status: int, content, headers: Dict = None):
+        payload = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local Client Portal gateway simulator")
+    parser.add_argument('--legs', type=int, default=1000)
+    parser.add_argument('--accounts', type=int, default=1)
+    parser.add_argument('--shared-legs', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+
+    accounts = ['U{}'.format(1000000 + i) for i in range(args.accounts)]
+    sim = GatewaySimulator(SyntheticPortfolio(args.legs, accounts=accounts, shared_legs=args.shared_legs), latency=args.latency,
+                           jitter=args.jitter, rate_limit=args.rate_limit, port=args.port)
+    print("serving {} legs at {}".format(args.legs, sim.base_url))
+    sim.server.serve_forever()
@@ -0,0 +1,166 @@
+import numpy as np
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+from Contract import Contract
+
+
+# Abramowitz & Stegun 7.1.26, |error| < 1.5e-7, so no scipy is needed for the normal CDF
+_ERF_P = 0.3275911
+_ERF_A = (0.254829592, -0.284496736, 1.421413741, -1.453152027, 1.061405429)
+_SQRT_2 = np.sqrt(2.0)
+_SQRT_2PI = np.sqrt(2.0 * np.pi)
+
+MIN_VOL = 1e-4
+MAX_VOL = 5.0
+
+
+def erf(x: np.ndarray) -> np.ndarray:
+    t = 1.0 / (1.0 + _ERF_P * np.abs(x))
+    a1, a2, a3, a4, a5 = _ERF_A
+    y = 1.0 - ((((a5 * t + a4) * t + a3) * t + a2) * t + a1) * t * np.exp(-x * x)
+    return np.copysign(y, x)
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + erf(x / _SQRT_2))
+
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+
+def _d1_d2(und_price, strike, t, rate, vol):
+    vol_sqrt_t = vol * np.sqrt(t)
+    d1 = (np.log(und_price / strike) + (rate + 0.5 * vol * vol) * t) / vol_sqrt_t
+    return d1, d1 - vol_sqrt_t
+
+
+def _price(is_put, und_price, discounted, d1, d2) -> np.ndarray:
+    call = und_price * norm_cdf(d1) - discounted * norm_cdf(d2)
+    return np.where(is_put, call - und_price + discounted, call)  # put-call parity, one pair of CDFs
+
+
+def bs_price(is_put, und_price, strike, t, rate, vol) -> np.ndarray:
+    d1, d2 = _d1_d2(und_price, strike, t, rate, vol)
+    return _price(is_put, und_price, strike * np.exp(-rate * t), d1, d2)
+
+
+def implied_vol(is_put, price, und_price, strike, t, rate, tol=1e-8, max_iter=50) -> np.ndarray:
+    """
+        Vectorized Black-Scholes implied volatility. Each leg takes Newton steps on its vega and
+        keeps a bracket [lo, hi] around the root; a step that leaves the bracket, or a flat vega,
+        bisects instead, so deep in- or out-of-the-money legs still converge. Only the legs not
+        converged yet are revalued on each iteration. Prices outside the no-arbitrage bounds get NaN.
+    """
+    n = len(price)
+    discounted = strike * np.exp(-rate * t)
+    lower = np.where(is_put, np.maximum(0, discounted - und_price), np.maximum(0, und_price - discounted))
+    upper = np.where(is_put, discounted, und_price)
+    valid = (price > lower) & (price < upper) & (t > 0) & (und_price > 0) & (strike > 0)
+
+    vol = np.full(n, np.nan)
+    active = np.flatnonzero(valid)
+    # Brenner-Subrahmanyam guess, good near the money
+    guess = np.clip(np.sqrt(2 * np.pi / t[active]) * price[active] / und_price[active], 0.05, 2.0)
+    lo = np.full(len(active), MIN_VOL)
+    hi = np.full(len(active), MAX_VOL)
+    sigma = guess
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        s, k, tt, p, put = und_price[active], strike[active], t[active], price[active], is_put[active]
+        d1, d2 = _d1_d2(s, k, tt, rate, sigma)
+        discounted_k = k * np.exp(-rate * tt)
+        diff = _price(put, s, discounted_k, d1, d2) - p
+        done = np.abs(diff) < tol
+        vol[active[done]] = sigma[done]
+
+        # the price rises with vol, so the sign of diff says which side of the root sigma is on
+        hi = np.where(diff > 0, sigma, hi)
+        lo = np.where(diff < 0, sigma, lo)
+        vega = s * norm_pdf(d1) * np.sqrt(tt)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = sigma - diff / vega
+        bisect = ~((newton > lo) & (newton < hi)) | (vega < 1e-12)
+        sigma = np.where(bisect, 0.5 * (lo + hi), newton)
+
+        keep = ~done & (hi - lo > 1e-12)
+        vol[active[~done & ~keep]] = sigma[~done & ~keep]  # bracket collapsed onto the root
+        active, sigma, lo, hi = active[keep], sigma[keep], lo[keep], hi[keep]
+    return vol
+
+
+def greeks(is_put, und_price, strike, t, rate, vol) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """delta, gamma, theta per calendar day and vega per vol point (1%), per share."""
+    d1, d2 = _d1_d2(und_price, strike, t, rate, vol)
+    pdf = norm_pdf(d1)
+    sqrt_t = np.sqrt(t)
+    discounted = strike * np.exp(-rate * t)
+    delta = np.where(is_put, norm_cdf(d1) - 1, norm_cdf(d1))
+    gamma = pdf / (und_price * vol * sqrt_t)
+    decay = -und_price * pdf * vol / (2 * sqrt_t)
+    theta = np.where(is_put, decay + rate * discounted * norm_cdf(-d2),
+                     decay - rate * discounted * norm_cdf(d2)) / 365
+    vega = und_price * pdf * sqrt_t / 100
+    return delta, gamma, theta, vega
+
+
+class GreeksBook:
+    """
+        Implied volatility and greeks for a whole book of option contracts in one NumPy pass,
+        from strike, put_or_call, mkt_price, und_price and the dte set by MoneynessBook.
+
+            cache = {}  # kept by the caller across refreshes
+            GreeksBook(contracts, cache=cache).compute().write_back()
+
+        Results are cached per conid together with the inputs they came from, so a refresh only
+        solves the legs whose prices or dte moved. dte floors the time to the expiry date's
+        midnight and the option trades through that day, so time to expiry is (dte + 1) / 365.
+        Contracts that aren't options, have no detail or miss a price are ignored.
+    """
+
+    def __init__(self, contracts: List[Contract], rate: float = 0.0, cache: Dict = None):
+        self.contracts = [c for c in contracts if c.asset_class == "OPT" and c.expiry_date is not None
+                          and c.dte is not None and c.mkt_price is not None and c.und_price is not None]
+        self.rate = rate
+        self.cache = {} if cache is None else cache  # conid -> (inputs, (iv, delta, gamma, theta, vega))
+        self.solved = 0  # legs solved by the last compute, the rest came from the cache
+        self.values = None
+
+    def __len__(self):
+        return len(self.contracts)
+
+    def compute(self):
+        cache, rate = self.cache, self.rate
+        keys = [(c.mkt_price, c.und_price, c.dte, c.strike, c.put_or_call, rate) for c in self.contracts]
+        stale = [i for i, (c, key) in enumerate(zip(self.contracts, keys))
+                 if cache.get(c.conid, (None,))[0] != key]
+        self.solved = len(stale)
+
+        if stale:
+            legs = [self.contracts[i] for i in stale]
+            is_put = np.array([c.put_or_call == "P" for c in legs], dtype=bool)
+            price = np.array([c.mkt_price for c in legs], dtype=np.float64)
+            und_price = np.array([c.und_price for c in legs], dtype=np.float64)
+            strike = np.array([c.strike for c in legs], dtype=np.float64)
+            t = (np.array([c.dte for c in legs], dtype=np.float64) + 1) / 365
+
+            vol = implied_vol(is_put, price, und_price, strike, t, rate)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                delta, gamma, theta, vega = greeks(is_put, und_price, strike, t, rate, vol)
+            solved = zip(vol.tolist(), delta.tolist(), gamma.tolist(), theta.tolist(), vega.tolist())
+            for i, values in zip(stale, solved):
+                cache[self.contracts[i].conid] = (keys[i], tuple(None if v != v else v for v in values))
+
+        self.values = [cache[c.conid][1] for c in self.contracts]
+        return self
+
+    def write_back(self):
+        for contract, (iv, delta, gamma, theta, vega) in zip(self.contracts, self.values):
+            contract.iv = iv
+            contract.delta = delta
+            contract.gamma = gamma
+            contract.theta = theta
+            contract.vega = vega
@@ -1,42 +1,105 @@
+import json
+import logging
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from typing import Dict
 from typing import List
+from typing import Tuple
 from pprint import pprint
+from Metrics import Metrics
+from RequestScheduler import RequestScheduler
+from SecdefCache import SecdefCache
+from SessionManager import SessionManager
 
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:  # orjson is optional, the standard library parser is the fallback
+    json_loads = json.loads
 
-class IBClient:
-    def __init__(self):
-        self.baseUrl = "https://localhost:5000/v1/portal/"
-        self.authenticated = False
-        self.authenticated = self._authenticate()
-
-    def _authenticate(self) -> bool:
-        max_retries = 4
-        retries = 0
-
-        while max_retries > retries or self.authenticated is False:
-
-            auth_response = self.authentication_status()
+# failed requests are logged here, and counted by Metrics.record_error when the client has metrics
+logger = logging.getLogger(__name__)
 
-            if 'statusCode' in auth_response.keys() and auth_response['statusCode'] == 401:
-                print("Server isn't connected. Authentication Failed")
-                self.authenticated = False
-                return False
+# POST endpoints that only read state, so replaying them after a dropped connection is harmless.
+# Order placement, replies and modifications are deliberately not in here.
+IDEMPOTENT_POST_ENDPOINTS = (
+    r'iserver/auth/status',
+    r'tickle',
+    r'/trsrv/secdef',
+)
 
-            elif 'authenticated' in auth_response.keys() and auth_response['authenticated'] is True:
-                self.authenticated = True
-                return True
 
-            elif 'authenticated' in auth_response.keys() and auth_response['authenticated'] is False:
-                self.validate_SSO()
-                self.reauthenticate()
-                self.brokerage_accounts()
-                # self.authentication_status()
-
-            retries += 1
+class IBClient:
+    def __init__(self,
+                 base_url: str = "https://localhost:5000/v1/portal/",
+                 pool_size: int = 10,
+                 max_retries: int = 3,
+                 backoff_factor: float = 0.3,
+                 timeout: Tuple[float, float] = (3.05, 30),
+                 secdef_cache: SecdefCache = None,
+                 scheduler: RequestScheduler = None,
+                 keepalive_interval: float = 60,
+                 auth_timeout: float = 60,
+                 metrics: Metrics = None):
+        self.baseUrl = base_url
+        self.secdef_cache = secdef_cache
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.auth_timeout = auth_timeout
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.session = self._build_session(pool_size, max_retries, backoff_factor)
+        # authenticates and keeps the session alive in the background, requests wait for it as needed
+        self.session_manager = SessionManager(self, keepalive_interval=keepalive_interval)
+        self.session_manager.start()
+
+    @property
+    def authenticated(self) -> bool:
+        return self.session_manager.is_valid
 
-        return self.authenticated
+    def _authenticate(self) -> bool:
+        """Blocks until the background authentication is done and returns whether it succeeded."""
+        return self.session_manager.wait_until_valid(timeout=self.auth_timeout)
+
+    def _build_session(self, pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+        """Creates the keep-alive session shared by every request.
+        GET requests are retried with backoff on connection errors and on throttling/gateway errors.
+        POST and DELETE requests are only retried when the connection could not be established,
+        except for the read-only POST endpoints listed in IDEMPOTENT_POST_ENDPOINTS.
+        With a scheduler, 429s are not retried here but in _send, after the scheduler has backed off.
+        """
+        status_forcelist = (500, 502, 503, 504) if self.scheduler is not None else (429, 500, 502, 503, 504)
+        safe_retry = Retry(total=max_retries,
+                           backoff_factor=backoff_factor,
+                           status_forcelist=status_forcelist,
+                           allowed_methods=frozenset({'GET'}),
+                           raise_on_status=False)
+        idempotent_post_retry = Retry(total=max_retries,
+                                      backoff_factor=backoff_factor,
+                                      status_forcelist=status_forcelist,
+                                      allowed_methods=frozenset({'GET', 'POST'}),
+                                      raise_on_status=False)
+
+        session = requests.Session()
+        session.verify = False
+        session.headers.update({'Content-Type': 'application/json'})
+        session.mount(self.baseUrl, HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size,
+                                                max_retries=safe_retry))
+        # requests picks the adapter with the longest matching prefix
+        for endpoint in IDEMPOTENT_POST_ENDPOINTS:
+            session.mount(self._build_url(endpoint), HTTPAdapter(pool_connections=1,
+                                                                 pool_maxsize=pool_size,
+                                                                 max_retries=idempotent_post_retry))
+        return session
+
+    def close(self):
+        self.session_manager.stop()
+        self.session.close()
 
     def _build_url(self, endpoint):
         return self.baseUrl + endpoint
@@ -61,31 +124,58 @@ class IBClient:
         """
 
         url = self._build_url(endpoint=endpoint)
-        headers = {'Content-Type': 'application/json'}
+        in_manager = self.session_manager.in_manager_thread()
+        if not in_manager:
+            self.session_manager.wait_until_valid(timeout=self.auth_timeout)
+
+        response = self._send(url, endpoint, req_type, params)
+        if response.status_code == 401:
+            # the session went away: re-authenticate once and replay the request
+            self.session_manager.invalidate()
+            if not in_manager and self.session_manager.wait_until_valid(timeout=self.auth_timeout):
+                response = self._send(url, endpoint, req_type, params)
+
+        if response.ok:
+            return json_loads(response.content)
+        if self.metrics is not None:
+            self.metrics.record_error(endpoint, req_type, response.status_code)
+        logger.warning("BAD REQUEST - STATUS CODE: %s URL: %s TEXT: %s",
+                       response.status_code, response.url, response.text)
+
+    def _send(self, url: str, endpoint: str, req_type: str, params: Dict = None) -> requests.Response:
+        # a 429 was turned away before the gateway acted on it, so any request can go again once
+        # the scheduler has drained the endpoint's bucket for Retry-After
+        for attempt in range(self.max_retries + 1):
+            response = self._send_once(url, endpoint, req_type, params)
+            if response.status_code != 429 or self.scheduler is None:
+                break
+            self.scheduler.penalize(endpoint, req_type, float(response.headers.get('Retry-After', 1)))
+        return response
+
+    def _send_once(self, url: str, endpoint: str, req_type: str, params: Dict = None) -> requests.Response:
+        if self.scheduler is not None:
+            self.scheduler.acquire(endpoint, req_type)
 
+        start = time.perf_counter()
         response = None
         if req_type == 'POST' and params is not None:
-            response = requests.post(url, headers=headers, json=params, verify=False)
+            response = self.session.post(url, json=params, timeout=self.timeout)
         elif req_type == 'POST' and params is None:
-            response = requests.post(url, headers=headers, verify=False)
+            response = self.session.post(url, timeout=self.timeout)
         elif req_type == 'GET' and params is not None:
-            response = requests.get(url, headers=headers, params=params, verify=False)
+            response = self.session.get(url, params=params, timeout=self.timeout)
         elif req_type == 'GET' and params is None:
-            response = requests.get(url, headers=headers, verify=False)
+            response = self.session.get(url, timeout=self.timeout)
         elif req_type == 'DELETE':
-            response = requests.delete(url, headers=headers, verify=False)
+            response = self.session.delete(url, timeout=self.timeout)
 
-        if response.ok:
-            return response.json()
-        else:  # elif not response.ok and url != 'https://localhost:5000/v1/portal/iserver/account':
-            print('')
-            print('-' * 80)
-            print("BAD REQUEST - STATUS CODE: {}".format(response.status_code))
-            print("RESPONSE URL: {}".format(response.url))
-            print("RESPONSE HEADERS: {}".format(response.headers))
-            print("RESPONSE TEXT: {}".format(response.text))
-            print('-' * 80)
-            print('')
+        if self.metrics is not None and self.metrics.enabled:
+            retries = response.raw.retries if response.raw is not None else None
+            self.metrics.record_request(endpoint, req_type, response.status_code, time.perf_counter() - start,
+                                        request_bytes=len(response.request.body or b''),
+                                        response_bytes=len(response.content),
+                                        retries=len(retries.history) if retries is not None else 0)
+        return response
 
     """
         PORTFOLIO ACCOUNTS ENDPOINTS
@@ -107,6 +197,20 @@ class IBClient:
 
         return content
 
+    def portfolio_subaccounts(self):
+        """
+            Returns the subaccounts of a tiered account structure (e.g. financial advisor or
+            ibroker accounts), up to 100. Like /portfolio/accounts it must be called before the
+            other /portfolio endpoints for those accounts.
+        """
+
+        # define request components
+        endpoint = 'portfolio/subaccounts'
+        req_type = 'GET'
+        content = self._make_request(endpoint=endpoint, req_type=req_type)
+
+        return content
+
     def brokerage_accounts(self):
         """
             Returns a list of accounts the user has trading access to, their respective aliases
@@ -178,16 +282,8 @@ class IBClient:
             params['since'] = since
 
         content = self._make_request(endpoint=endpoint, req_type=req_type, params=params)
-        # retry if the field is not there
-        retry = False
-        for field in fields:
-            if field not in content[0].keys():
-                retry = True
-                break
-
-        if retry:
-            content = self._make_request(endpoint=endpoint, req_type=req_type, params=params)
-
+        # the first request for a conid often comes back without all fields,
+        # SnapshotFetcher polls again for the incomplete conids
         return content
 
     def reauthenticate(self) -> Dict:
@@ -244,22 +340,34 @@ class IBClient:
 
     def contracts_definitions(self, conids: List[int]) -> List[Dict]:
         """
-            Returns a list of security definitions for the given conids.
+            Returns a list of security definitions for the given conids. When the client has a
+            secdef_cache, only the conids missing from it are requested.
             NAME: conids
             DESC: A list of contract IDs you wish to get details for.
             TYPE: List<Integer>
             RTYPE: List<Dictionary>
         """
 
+        # only ask the gateway for the definitions we don't have cached
+        cached = {}
+        if self.secdef_cache is not None:
+            cached = self.secdef_cache.get_many(conids)
+        missing = [conid for conid in conids if conid not in cached]
+        if not missing:
+            return list(cached.values())
+
         # define the request components
         endpoint = '/trsrv/secdef'
         req_type = 'POST'
         payload = {
-            'conids': conids
+            'conids': missing
             }
         content = self._make_request(endpoint=endpoint, req_type=req_type, params=payload)
 
-        return content['secdef']  # return the list of contract definitions, instead of a dictionary
+        fetched = content['secdef']  # return the list of contract definitions, instead of a dictionary
+        if self.secdef_cache is not None:
+            self.secdef_cache.put_many(fetched)
+        return list(cached.values()) + fetched
 
     def place_order(self, account_id: str, order: Dict, confirm=True) -> Dict:
         """
@@ -285,25 +393,28 @@ class IBClient:
         )
         return content
 
-    def place_orders(self, account_id: str, orders: Dict[str, List[Dict]]) -> Dict:
+    def place_orders(self, account_id: str, orders: List[Dict]) -> List[Dict]:
         """
-            An extension of the `place_order` endpoint but allows for a list of orders. Those orders may be
-            either a list of dictionary objects or a list of IBOrder objects. SO FAR IT DOES NOT WORK
+            An extension of the `place_order` endpoint but allows for a list of orders. As with
+            `place_order`, the response may hold questions that have to be answered through
+            `place_order_reply`; OrderSubmitter takes care of that for a whole batch.
             NAME: account_id
             DESC: The account ID you wish to place an order for.
             TYPE: String
             NAME: orders
-            DESC: Either a list of IBOrder objects or a list of dictionaries with the specified payload.
-            TYPE: List<IBOrder Object> or List<Dictionary>
+            DESC: A list of order dictionaries with the specified payload, or a dictionary
+                  already in the {'orders': [...]} shape the endpoint expects.
+            TYPE: List<Dictionary> or Dictionary
         """
 
         # define request components
         endpoint = r'iserver/account/{}/orders'.format(account_id)
         req_type = 'POST'
+        payload = orders if isinstance(orders, dict) else {'orders': orders}
         content = self._make_request(
             endpoint=endpoint,
             req_type=req_type,
-            params=orders
+            params=payload
         )
 
         return content
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+
+import aiohttp
+
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from Position import Position
+from SnapshotFetcher import Price
+
+
+class MarketDataStream:
+    """
+        Streams market data over the Client Portal websocket (`smd+conid` topics) and pushes every
+        tick straight into the contracts that hold the conid, as their own price
+        (Contract.set_mkt_price) or as their underlying's price (Contract.set_und_price).
+
+        Ticks are conflated per conid: when the contracts can't keep up with the socket, only the
+        latest price of each conid waits to be applied, so memory stays bounded by the number of
+        subscriptions and no stale price is ever applied after a newer one.
+
+            stream = MarketDataStream(session_id=client.tickle()['session'])
+            stream.track_positions(positions)
+            task = asyncio.ensure_future(stream.run())
+            ...
+            await stream.stop()
+
+        Without positions to route to, track_conids() subscribes to bare conids and every batch
+        only goes to the listener; start() and close() run the stream on its own thread and event
+        loop, for synchronous callers like PortfolioDaemon.
+    """
+
+    def __init__(self,
+                 url: str = "wss://localhost:5000/v1/api/ws",
+                 session_id: str = None,
+                 fields: List[str] = ('31',),
+                 heartbeat: float = 30,
+                 reconnect_backoff: float = 1.0,
+                 max_reconnect_backoff: float = 30.0,
+                 apply_batch: int = 1000,
+                 listener: Callable[[Dict[int, float]], None] = None):
+        self.url = url
+        self.session_id = session_id
+        self.fields = list(fields)
+        self.heartbeat = heartbeat
+        self.reconnect_backoff = reconnect_backoff
+        self.max_reconnect_backoff = max_reconnect_backoff
+        self.apply_batch = apply_batch
+        self.listener = listener  # gets every batch of applied prices, e.g. PortfolioDaemon.update_prices
+
+        self._mkt_targets = {}  # conid -> contracts priced by it
+        self._und_targets = {}  # conid -> contracts whose underlying it is
+        self._wanted = set()
+        self._subscribed = set()
+        self._ws = None
+        self._pending = OrderedDict()  # conid -> latest unapplied Price
+        self._has_pending = asyncio.Event()
+        self._stopped = False
+        self._loop = None
+        self._thread = None
+
+        # counters
+        self.ticks_received = 0
+        self.ticks_applied = 0
+        self.ticks_conflated = 0
+        self.reconnects = 0
+
+    """
+        SUBSCRIPTIONS
+    """
+
+    def track_positions(self, positions: Dict[int, Position]):
+        """
+            Routes ticks to the given positions and subscribes/unsubscribes the difference.
+            Safe to call from any thread, like track_conids.
+        """
+        mkt_targets = {}
+        und_targets = {}
+        for conid in positions.keys():
+            contract = positions[conid].contract
+            mkt_targets.setdefault(contract.conid, []).append(contract)
+            if contract.und_conid != contract.conid:
+                und_targets.setdefault(contract.und_conid, []).append(contract)
+        self._mkt_targets = mkt_targets
+        self._und_targets = und_targets
+
+        # when not connected, the next (re)connect subscribes to everything wanted
+        self._wanted = set(mkt_targets.keys()) | set(und_targets.keys())
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._resync)
+
+    def track_conids(self, conids: Iterable[int]):
+        """Subscribes to exactly these conids, with no contracts to route to. Safe to call from any thread."""
+        self._mkt_targets = {}
+        self._und_targets = {}
+        self._wanted = set(conids)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._resync)
+
+    def _resync(self):
+        if self._ws is not None and not self._ws.closed:
+            asyncio.ensure_future(self._sync_subscriptions(self._wanted))
+
+    def _subscribe_message(self, conid: int) -> str:
+        return "smd+{}+{}".format(conid, json.dumps({'fields': self.fields}))
+
+    @staticmethod
+    def _unsubscribe_message(conid: int) -> str:
+        return "umd+{}+{{}}".format(conid)
+
+    async def _sync_subscriptions(self, wanted):
+        for conid in wanted - self._subscribed:
+            await self._ws.send_str(self._subscribe_message(conid))
+        for conid in self._subscribed - wanted:
+            await self._ws.send_str(self._unsubscribe_message(conid))
+            self._pending.pop(conid, None)
+        self._subscribed = set(wanted)
+
+    """
+        TICKS
+    """
+
+    def _on_message(self, message: Dict):
+        topic = message.get('topic', '')
+        if not topic.startswith('smd+') or 'conid' not in message:
+            return
+        price = Price.parse(message.get(self.fields[0]))
+        if price is None:
+            return
+        conid = int(message['conid'])
+        self.ticks_received += 1
+        if conid in self._pending:
+            self.ticks_conflated += 1
+            del self._pending[conid]
+        self._pending[conid] = price
+        self._has_pending.set()
+
+    def apply_pending(self, limit: int = None) -> int:
+        """Applies up to `limit` pending ticks to their contracts and returns how many it applied."""
+        applied = 0
+        batch = {}
+        while self._pending and (limit is None or applied < limit):
+            conid, price = self._pending.popitem(last=False)
+            for contract in self._mkt_targets.get(conid, ()):
+                contract.set_mkt_price(price.value)
+            for contract in self._und_targets.get(conid, ()):
+                contract.set_und_price(price.value)
+            batch[conid] = price.value
+            applied += 1
+        self.ticks_applied += applied
+        if batch and self.listener is not None:
+            self.listener(batch)
+        if not self._pending:
+            self._has_pending.clear()
+        return applied
+
+    async def _apply_loop(self):
+        while not self._stopped:
+            await self._has_pending.wait()
+            self.apply_pending(self.apply_batch)
+            # let the reader run between batches
+            await asyncio.sleep(0)
+
+    """
+        CONNECTION
+    """
+
+    async def _read(self, ws):
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                data = msg.data
+            elif msg.type == aiohttp.WSMsgType.BINARY:
+                data = msg.data.decode()
+            else:
+                break
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                self._on_message(message)
+
+    async def _heartbeat_loop(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(self.heartbeat)
+            await ws.send_str("tic")
+
+    async def run(self):
+        """Keeps the stream connected until stop() is called, reconnecting with backoff."""
+        backoff = self.reconnect_backoff
+        self._loop = asyncio.get_running_loop()
+        applier = asyncio.ensure_future(self._apply_loop())
+        connector = aiohttp.TCPConnector(ssl=False)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            try:
+                while not self._stopped:
+                    try:
+                        async with session.ws_connect(self.url) as ws:
+                            self._ws = ws
+                            if self.session_id is not None:
+                                await ws.send_str(json.dumps({'session': self.session_id}))
+                            self._subscribed = set()
+                            await self._sync_subscriptions(self._wanted)
+                            backoff = self.reconnect_backoff
+                            heartbeat = asyncio.ensure_future(self._heartbeat_loop(ws))
+                            try:
+                                await self._read(ws)
+                            finally:
+                                heartbeat.cancel()
+                    except (aiohttp.ClientError, ConnectionError, asyncio.TimeoutError) as e:
+                        print("MARKET DATA STREAM DISCONNECTED: {}".format(e))
+                    self._ws = None
+                    if self._stopped:
+                        break
+                    self.reconnects += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_reconnect_backoff)
+            finally:
+                self.apply_pending()
+                applier.cancel()
+
+    async def stop(self):
+        self._stopped = True
+        self._has_pending.set()
+        if self._ws is not None:
+            await self._ws.close()
+
+    def start(self) -> 'MarketDataStream':
+        """Runs the stream on a background thread with its own event loop."""
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="ib-market-data", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, timeout: float = 5):
+        """Stops a stream started with start() and waits for its thread."""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop)
+        else:
+            self._stopped = True  # not connected yet, run() returns before its first connect
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,195 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from typing import Callable
+from typing import Dict
+
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# path segments holding an id (account ids, conids, order ids, page numbers) are folded
+# so every account and every page count towards the same endpoint
+_ID_SEGMENT = re.compile(r'(?<=/)[^/]*\d[^/]*(?=/|$)')
+
+
+def endpoint_template(endpoint: str) -> str:
+    return _ID_SEGMENT.sub('{}', '/' + endpoint.lstrip('/'))[1:]
+
+
+@contextmanager
+def _no_span():
+    yield
+
+
+class _EndpointStats:
+    __slots__ = ('buckets', 'count', 'seconds', 'request_bytes', 'response_bytes', 'retries', 'errors', 'statuses')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.errors = 0
+        self.statuses = {}
+
+
+class Metrics:
+    """
+        Request and pipeline instrumentation: per-endpoint latency histograms, request/response
+        byte counts, status-code counters, retry counts and failed requests recorded by the
+        clients, and span timings for the phases of a run.
+
+            metrics = Metrics()
+            client = IBClient(metrics=metrics)
+            with metrics.span("positions"):
+                ...
+            print(metrics.to_prometheus())
+
+        Hooks registered with add_hook get every request and span as an event dict. With
+        enabled=False recording is skipped at the first check and span() hands out a no-op.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._endpoints = {}  # (method, endpoint template) -> _EndpointStats
+        self._spans = {}  # name -> [count, total seconds, last seconds]
+        self._hooks = []
+
+    def add_hook(self, hook: Callable[[Dict], None]):
+        self._hooks.append(hook)
+
+    def _emit(self, event: Dict):
+        for hook in self._hooks:
+            hook(event)
+
+    def record_request(self, endpoint: str, method: str, status: int, seconds: float,
+                       request_bytes: int = 0, response_bytes: int = 0, retries: int = 0):
+        if not self.enabled:
+            return
+        key = (method, endpoint_template(endpoint))
+        with self._lock:
+            stats = self._stats(key)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+                    break
+            stats.count += 1
+            stats.seconds += seconds
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.retries += retries
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if self._hooks:
+            self._emit({'type': 'request', 'method': method, 'endpoint': key[1], 'status': status,
+                        'seconds': seconds, 'request_bytes': request_bytes, 'response_bytes': response_bytes,
+                        'retries': retries})
+
+    def record_error(self, endpoint: str, method: str, status: int):
+        """Counts a request the client gave up on, i.e. one that returned None to its caller."""
+        if not self.enabled:
+            return
+        key = (method, endpoint_template(endpoint))
+        with self._lock:
+            self._stats(key).errors += 1
+        if self._hooks:
+            self._emit({'type': 'error', 'method': method, 'endpoint': key[1], 'status': status})
+
+    def _stats(self, key) -> _EndpointStats:
+        """The stats of an endpoint, created on first use. Holds the lock."""
+        stats = self._endpoints.get(key)
+        if stats is None:
+            stats = self._endpoints[key] = _EndpointStats()
+        return stats
+
+    def span(self, name: str):
+        """Times a block, e.g. one phase of main.main()."""
+        if not self.enabled:
+            return _no_span()
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                stats = self._spans.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = seconds
+            if self._hooks:
+                self._emit({'type': 'span', 'name': name, 'seconds': seconds})
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            endpoints = []
+            for (method, endpoint), stats in sorted(self._endpoints.items()):
+                endpoints.append({
+                    'method': method,
+                    'endpoint': endpoint,
+                    'count': stats.count,
+                    'seconds': stats.seconds,
+                    'latency_buckets': dict(zip((str(b) for b in LATENCY_BUCKETS), stats.buckets)),
+                    'request_bytes': stats.request_bytes,
+                    'response_bytes': stats.response_bytes,
+                    'retries': stats.retries,
+                    'errors': stats.errors,
+                    'statuses': {str(code): n for code, n in sorted(stats.statuses.items())},
+                })
+            spans = {name: {'count': count, 'seconds': total, 'last_seconds': last}
+                     for name, (count, total, last) in self._spans.items()}
+        return {'endpoints': endpoints, 'spans': spans}
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        data = self.to_dict()
+
+        def add(name, kind, help_text):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+
+        add("ibkr_request_seconds", "histogram", "Gateway request latency by endpoint.")
+        for e in data['endpoints']:
+            labels = 'method="{}",endpoint="{}"'.format(e['method'], e['endpoint'])
+            cumulative = 0
+            for bound, n in e['latency_buckets'].items():
+                cumulative += n
+                le = "+Inf" if bound == "inf" else bound
+                lines.append('ibkr_request_seconds_bucket{{{},le="{}"}} {}'.format(labels, le, cumulative))
+            lines.append('ibkr_request_seconds_sum{{{}}} {}'.format(labels, e['seconds']))
+            lines.append('ibkr_request_seconds_count{{{}}} {}'.format(labels, e['count']))
+
+        for metric, field, help_text in (("ibkr_request_bytes_total", 'request_bytes', "Request body bytes sent."),
+                                         ("ibkr_response_bytes_total", 'response_bytes', "Response body bytes received."),
+                                         ("ibkr_request_retries_total", 'retries', "Transport-level retries."),
+                                         ("ibkr_request_errors_total", 'errors', "Requests that failed for good.")):
+            add(metric, "counter", help_text)
+            for e in data['endpoints']:
+                lines.append('{}{{method="{}",endpoint="{}"}} {}'.format(metric, e['method'], e['endpoint'], e[field]))
+
+        add("ibkr_responses_total", "counter", "Responses by status code.")
+        for e in data['endpoints']:
+            for code, n in e['statuses'].items():
+                lines.append('ibkr_responses_total{{method="{}",endpoint="{}",status="{}"}} {}'.format(
+                    e['method'], e['endpoint'], code, n))
+
+        add("ibkr_span_seconds_total", "counter", "Time spent in each pipeline phase.")
+        for name, s in data['spans'].items():
+            lines.append('ibkr_span_seconds_total{{span="{}"}} {}'.format(name, s['seconds']))
+        add("ibkr_span_runs_total", "counter", "Runs of each pipeline phase.")
+        for name, s in data['spans'].items():
+            lines.append('ibkr_span_runs_total{{span="{}"}} {}'.format(name, s['count']))
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+
+from typing import Dict
+from typing import List
+from Contract import Contract
+from TargetPricer import DEFAULT_CURVE
+
+
+MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+
+
+class MoneynessBook:
+    """
+        Columnar moneyness engine for a whole book of option contracts. Strikes, pre-parsed
+        expiries, put/call flags and prices are kept in NumPy arrays, and dte, intrinsic,
+        extrinsic, ann_extrinsic and target are computed for every leg in one vectorized pass,
+        with the same formulas as Contract._set_moneyness. Like there, a target set by TargetPricer
+        is left as it is.
+
+            book = MoneynessBook(contracts)
+            book.compute()
+            book.write_back()
+
+        Contracts that aren't options, or that have no detail yet, are ignored.
+    """
+
+    def __init__(self, contracts: List[Contract]):
+        self.contracts = [c for c in contracts if c.asset_class == "OPT" and c.expiry_date is not None]
+        self.index = {c.conid: i for i, c in enumerate(self.contracts)}
+        self.strike = np.array([c.strike for c in self.contracts], dtype=np.float64)
+        # expiry at midnight, in epoch microseconds, so dte floors like timedelta.days
+        epoch = datetime(1970, 1, 1)
+        expiry_us = {}
+        for c in self.contracts:
+            if c.expiry not in expiry_us:
+                expiry_us[c.expiry] = (c.expiry_date - epoch) // timedelta(microseconds=1)
+        self.expiry = np.array([expiry_us[c.expiry] for c in self.contracts], dtype=np.int64)
+        self.is_put = np.array([c.put_or_call == "P" for c in self.contracts], dtype=bool)
+        self.mkt_price = np.full(len(self.contracts), np.nan)
+        self.und_price = np.full(len(self.contracts), np.nan)
+        self.refresh_prices()
+
+        self.dte = None
+        self.intrinsic = None
+        self.extrinsic = None
+        self.ann_extrinsic = None
+        self.target = None
+
+    def __len__(self):
+        return len(self.contracts)
+
+    def refresh_prices(self):
+        """Re-reads mkt_price and und_price from the contracts."""
+        self.mkt_price[:] = [np.nan if c.mkt_price is None else c.mkt_price for c in self.contracts]
+        self.und_price[:] = [np.nan if c.und_price is None else c.und_price for c in self.contracts]
+
+    def set_prices(self, prices: Dict[int, float]):
+        """Updates the price columns straight from a conid -> price map, for option and underlying conids."""
+        for i, c in enumerate(self.contracts):
+            if c.conid in prices:
+                self.mkt_price[i] = prices[c.conid]
+            if c.und_conid in prices:
+                self.und_price[i] = prices[c.und_conid]
+
+    @staticmethod
+    def _ann_target(dte: np.ndarray) -> np.ndarray:
+        # the table behind Contract._get_ann_target, looked up for every leg at once
+        return DEFAULT_CURVE.lookup(dte)
+
+    def compute(self, now: datetime = None):
+        if now is None:
+            now = datetime.now()
+        now_us = (now - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        self.dte = (self.expiry - now_us) // MICROSECONDS_PER_DAY
+
+        self.intrinsic = np.where(self.is_put,
+                                  np.maximum(0, self.strike - self.und_price),
+                                  np.maximum(0, self.und_price - self.strike))
+        self.extrinsic = self.mkt_price - self.intrinsic
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.ann_extrinsic = np.where(self.dte != 0,
+                                          self.extrinsic / self.strike * (365 / self.dte),
+                                          np.nan)
+        self.target = np.round(self._ann_target(self.dte) * self.strike * self.dte / 365, 2)
+        return self
+
+    def write_back(self):
+        """Copies the computed columns onto the contracts that have both prices."""
+        priced = ~(np.isnan(self.mkt_price) | np.isnan(self.und_price))
+        columns = zip(self.dte.tolist(), self.intrinsic.tolist(), self.extrinsic.tolist(),
+                      self.ann_extrinsic.tolist(), self.target.tolist(), priced.tolist())
+        for contract, (dte, intrinsic, extrinsic, ann_extrinsic, target, ok) in zip(self.contracts, columns):
+            if ok:
+                contract.dte = dte
+                contract.intrinsic = intrinsic
+                contract.extrinsic = extrinsic
+                contract.ann_extrinsic = ann_extrinsic
+                if not contract.target_priced:
+                    contract.target = target
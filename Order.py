@@ -1,4 +1,6 @@
 class Order:
+    __slots__ = ('contract', 'size', 'price', 'side', 'tif')
+
     def __init__(self, contract, size, price, side, tif="DAY"):
         self.contract = contract
         self.size = size
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+from OrderSubmitter import AsyncOrderSubmitter
+from OrderSubmitter import OrderSubmitter
+
+
+logger = logging.getLogger(__name__)
+
+# live orders in these states can't be modified or cancelled any more
+INACTIVE_STATUSES = {"Cancelled", "Inactive", "Filled"}
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReconcileResult:
+    def __init__(self):
+        self.kept = []  # live orders left as they are
+        self.modified = []  # (live order, target order, final response)
+        self.cancelled = []  # live orders with no target
+        self.placed = []  # (target order, OrderResult)
+        self.failed = []  # (live order, target order or None for a cancel, last response or error) not done
+        self.skipped = []  # target orders without a price, neither placed nor used to modify
+        self.api_calls = 0
+        self.reply_calls = 0
+        self.naive_api_calls = 0
+
+    @property
+    def saved_api_calls(self) -> int:
+        return self.naive_api_calls - self.api_calls
+
+    def __repr__(self):
+        return "ReconcileResult(kept={}, modified={}, cancelled={}, placed={}, skipped={}, failed={}, api_calls={}, " \
+               "saved={})".format(len(self.kept), len(self.modified), len(self.cancelled), len(self.placed),
+                                  len(self.skipped), len(self.failed), self.api_calls, self.saved_api_calls)
+
+
+class OrderReconciler:
+    """
+        Brings the live orders of an account in line with a list of target orders, touching only
+        what differs instead of cancelling everything and placing it all again:
+        - a live order with the same conid, side (and order_ref, when the target has a cOID) and
+          the same price and quantity is left alone,
+        - one whose price or quantity differs is modified in place,
+        - live orders matching no target are cancelled,
+        - targets matching no live order are placed in bulk through OrderSubmitter,
+        - a target without a price is skipped, and the live order it matches is left alone.
+        Working orders stay in the market the whole time. A modification whose request fails, or
+        whose reply chain is still asking after max_replies answers, is recorded as failed.
+
+            result = OrderReconciler(client, account_id).reconcile(target_orders)
+            print(result.saved_api_calls)
+    """
+
+    def __init__(self, client, account_id: str, submitter: OrderSubmitter = None, max_replies: int = 10):
+        self.client = client
+        self.account_id = account_id
+        self.max_replies = max_replies
+        self.submitter = submitter if submitter is not None else \
+            OrderSubmitter(client, account_id, max_replies=max_replies)
+
+    @staticmethod
+    def _key(conid, side, order_ref):
+        return int(conid), side, order_ref
+
+    def _live_key(self, live_order: Dict, with_ref: bool):
+        return self._key(live_order['conid'], live_order['side'], live_order.get('order_ref') if with_ref else None)
+
+    def _target_key(self, target: Dict):
+        return self._key(target['conid'], target['side'], target.get('cOID'))
+
+    @staticmethod
+    def _matches(live_order: Dict, target: Dict) -> bool:
+        live_price = _to_float(live_order.get('price'))
+        target_price = _to_float(target.get('price'))
+        live_quantity = _to_float(live_order.get('remainingQuantity', live_order.get('totalSize')))
+        target_quantity = _to_float(target.get('quantity'))
+        return (live_price is not None and target_price is not None and abs(live_price - target_price) < 1e-6
+                and live_quantity is not None and target_quantity is not None
+                and abs(live_quantity - target_quantity) < 1e-6)
+
+    @staticmethod
+    def _is_question(content) -> bool:
+        return bool(content) and isinstance(content, list) and isinstance(content[0], dict) and 'id' in content[0]
+
+    def _confirm(self, content, result: ReconcileResult):
+        """Answers the question replies of a submission, at most max_replies, and returns the final response."""
+        for _ in range(self.max_replies):
+            if not self._is_question(content):
+                break
+            content = self.client.place_order_reply(content[0]['id'], True)
+            result.api_calls += 1
+            result.reply_calls += 1
+        return content
+
+    def _record_modify(self, live_order: Dict, target: Dict, content, result: ReconcileResult):
+        if content is None or self._is_question(content):
+            result.failed.append((live_order, target, content))
+        else:
+            result.modified.append((live_order, target, content))
+
+    def _plan(self, target_orders: List[Dict], live_orders: Dict, result: ReconcileResult) -> Tuple:
+        """
+            Matches the targets to this account's active live orders. Fills in kept and skipped
+            and returns the active orders, the (live order, target) pairs to modify, the live
+            orders to cancel and the targets to place.
+        """
+        # the live orders of every account come back together, keep this account's
+        active = [order for order in (live_orders or {}).get('orders', [])
+                  if order.get('status') not in INACTIVE_STATUSES
+                  and order.get('acct', self.account_id) == self.account_id]
+
+        # live orders are grouped both with and without their order_ref,
+        # so targets with and without a cOID can find them
+        by_key = {}
+        for order in active:
+            by_key.setdefault(self._live_key(order, with_ref=False), []).append(order)
+            if order.get('order_ref'):
+                by_key.setdefault(self._live_key(order, with_ref=True), []).append(order)
+        claimed = set()
+
+        modifications = []
+        unmatched_targets = []
+        for target in target_orders:
+            live_order = None
+            for candidate in by_key.get(self._target_key(target), []):
+                if candidate['orderId'] not in claimed:
+                    live_order = candidate
+                    break
+            priced = target.get('price') is not None
+            if not priced:
+                result.skipped.append(target)
+            if live_order is None:
+                if priced:
+                    unmatched_targets.append(target)
+                continue
+
+            claimed.add(live_order['orderId'])
+            if not priced or self._matches(live_order, target):
+                result.kept.append(live_order)
+            else:
+                modifications.append((live_order, target))
+
+        cancels = [order for order in active if order['orderId'] not in claimed]
+        return active, modifications, cancels, unmatched_targets
+
+    @staticmethod
+    def _add_placed(result: ReconcileResult, unmatched_targets: List[Dict], order_results: List,
+                    submitter: OrderSubmitter, calls: int, replies: int):
+        for target, order_result in zip(unmatched_targets, order_results):
+            result.placed.append((target, order_result))
+        result.api_calls += submitter.api_calls - calls
+        result.reply_calls += submitter.reply_calls - replies
+
+    @staticmethod
+    def _count_naive(result: ReconcileResult, target_orders: List[Dict], active: List[Dict], fetch_calls: int):
+        # cancel-all-then-replace: one cancel per active order, then one placement per target
+        # followed by as many reply round trips as the submissions above needed on average
+        submissions = len(result.modified) + len(result.failed) + len(result.placed)
+        replies_per_submission = result.reply_calls / submissions if submissions else 0
+        placeable = len(target_orders) - len(result.skipped)
+        result.naive_api_calls = fetch_calls + len(active) + round(placeable * (1 + replies_per_submission))
+
+    def reconcile(self, target_orders: List[Dict], live_orders: Dict = None) -> ReconcileResult:
+        result = ReconcileResult()
+        fetch_calls = 0
+        if live_orders is None:
+            live_orders = self.client.get_live_orders()
+            fetch_calls = 1
+            result.api_calls += 1
+        active, modifications, cancels, unmatched_targets = self._plan(target_orders, live_orders, result)
+
+        for live_order, target in modifications:
+            content = self.client.modify_order(account_id=self.account_id,
+                                               local_order_id=live_order['orderId'],
+                                               order=target)
+            result.api_calls += 1
+            self._record_modify(live_order, target, self._confirm(content, result), result)
+
+        for order in cancels:
+            self.client.delete_order(account_id=self.account_id, order_id=order['orderId'])
+            result.api_calls += 1
+            result.cancelled.append(order)
+
+        if unmatched_targets:
+            calls, replies = self.submitter.api_calls, self.submitter.reply_calls
+            self._add_placed(result, unmatched_targets, self.submitter.submit(unmatched_targets),
+                             self.submitter, calls, replies)
+
+        self._count_naive(result, target_orders, active, fetch_calls)
+        return result
+
+
+class AsyncOrderReconciler(OrderReconciler):
+    """
+        OrderReconciler for AsyncIBClient. The modifications, each with its reply chain, and the
+        cancels go out concurrently, and the new targets are placed through AsyncOrderSubmitter.
+        A modification or cancel that raises, e.g. on a dropped connection, is recorded as failed
+        without stopping the others.
+
+            result = await AsyncOrderReconciler(client, account_id).reconcile(target_orders, live_orders)
+    """
+
+    def __init__(self, client, account_id: str, submitter: AsyncOrderSubmitter = None, max_replies: int = 10):
+        submitter = submitter if submitter is not None else \
+            AsyncOrderSubmitter(client, account_id, max_replies=max_replies)
+        super().__init__(client, account_id, submitter=submitter, max_replies=max_replies)
+
+    async def _confirm(self, content, result: ReconcileResult):
+        for _ in range(self.max_replies):
+            if not self._is_question(content):
+                break
+            content = await self.client.place_order_reply(content[0]['id'], True)
+            result.api_calls += 1
+            result.reply_calls += 1
+        return content
+
+    async def _modify(self, live_order: Dict, target: Dict, result: ReconcileResult):
+        try:
+            result.api_calls += 1
+            content = await self.client.modify_order(account_id=self.account_id,
+                                                     local_order_id=live_order['orderId'],
+                                                     order=target)
+            content = await self._confirm(content, result)
+        except Exception as e:  # order requests aren't replayed, the other modifications go on
+            logger.warning("MODIFY OF ORDER %s FAILED: %s", live_order['orderId'], e)
+            result.failed.append((live_order, target, e))
+            return
+        self._record_modify(live_order, target, content, result)
+
+    async def _cancel(self, order: Dict, result: ReconcileResult):
+        try:
+            result.api_calls += 1
+            await self.client.delete_order(account_id=self.account_id, order_id=order['orderId'])
+        except Exception as e:
+            logger.warning("CANCEL OF ORDER %s FAILED: %s", order['orderId'], e)
+            result.failed.append((order, None, e))
+            return
+        result.cancelled.append(order)
+
+    async def reconcile(self, target_orders: List[Dict], live_orders: Dict = None) -> ReconcileResult:
+        result = ReconcileResult()
+        fetch_calls = 0
+        if live_orders is None:
+            live_orders = await self.client.get_live_orders()
+            fetch_calls = 1
+            result.api_calls += 1
+        active, modifications, cancels, unmatched_targets = self._plan(target_orders, live_orders, result)
+
+        await asyncio.gather(*[self._modify(live_order, target, result) for live_order, target in modifications],
+                             *[self._cancel(order, result) for order in cancels])
+
+        if unmatched_targets:
+            calls, replies = self.submitter.api_calls, self.submitter.reply_calls
+            self._add_placed(result, unmatched_targets, await self.submitter.submit(unmatched_targets),
+                             self.submitter, calls, replies)
+
+        self._count_naive(result, target_orders, active, fetch_calls)
+        return result
@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Dict
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+
+class OrderResult:
+    def __init__(self, order: Dict):
+        self.order = order
+        self.status = "unknown"  # submitted, rejected or unknown
+        self.order_id = None
+        self.order_status = None
+        self.error = None
+        self.response = None
+
+    def __repr__(self):
+        return "OrderResult(cOID={}, status={}, order_id={}, order_status={}, error={})".format(
+            self.order.get('cOID'), self.status, self.order_id, self.order_status, self.error)
+
+
+class OrderSubmitter:
+    """
+        Places many orders at once. Orders are posted in batches to iserver/account/{id}/orders,
+        the batches go out concurrently, and the question/reply chains that come back are answered
+        concurrently too. Every order is tagged with a cOID (unless it already has one) so the
+        final responses, which carry it back as local_order_id, can be matched to the order they
+        belong to. Orders no response could be matched to are looked up among the live orders by
+        their cOID; one that isn't there either stays unknown.
+
+            results = OrderSubmitter(client, account_id).submit(orders)
+
+        One OrderResult is returned per order, in order, rather than raising on an odd response.
+    """
+
+    _sequence = itertools.count()
+
+    def __init__(self, client, account_id: str, batch_size: int = 20, max_workers: int = 8,
+                 max_replies: int = 10):
+        self.client = client
+        self.account_id = account_id
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_replies = max_replies
+        self.api_calls = 0
+        self.reply_calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self, replies: int = 0):
+        with self._lock:
+            self.api_calls += 1
+            self.reply_calls += replies
+
+    @classmethod
+    def _new_coid(cls) -> str:
+        return "B{}-{}".format(int(time.time() * 1000), next(cls._sequence))
+
+    @staticmethod
+    def _is_question(item) -> bool:
+        return isinstance(item, dict) and 'id' in item and 'order_id' not in item
+
+    def _answer(self, question: Dict) -> List:
+        """Walks one reply chain and returns the items it ends with."""
+        content = [question]
+        for _ in range(self.max_replies):
+            questions = [item for item in content if self._is_question(item)]
+            if not questions:
+                return content
+            content = self.client.place_order_reply(questions[0]['id'], True)
+            self._count(replies=1)
+            if not isinstance(content, list):
+                return [content] if content else []
+        return content
+
+    def _resolve(self, results: Dict[str, OrderResult], items: List):
+        """Fills in results from the final items that name their order."""
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            result = results.get(item.get('local_order_id'))
+            if result is not None and 'order_id' in item:
+                result.status = "submitted"
+                result.order_id = item['order_id']
+                result.order_status = item.get('order_status')
+                result.response = item
+
+    @staticmethod
+    def _reject_batch(results: Dict[str, OrderResult], content) -> List[OrderResult]:
+        """A failed request (None) or an error object applies to the whole batch."""
+        error = content.get('error') if isinstance(content, dict) else "request failed"
+        for result in results.values():
+            result.status = "rejected"
+            result.error = error
+            result.response = content
+        return list(results.values())
+
+    def _submit_batch(self, batch: List[Dict], executor: ThreadPoolExecutor):
+        results = {order['cOID']: OrderResult(order) for order in batch}
+        content = self.client.place_orders(self.account_id, batch)
+        self._count()
+        if not isinstance(content, list):
+            return self._reject_batch(results, content)
+
+        # each question starts a reply chain, the chains run concurrently
+        questions = [item for item in content if self._is_question(item)]
+        self._resolve(results, [item for item in content if not self._is_question(item)])
+        chains = [executor.submit(self._answer, question) for question in questions]
+        for chain in chains:
+            self._resolve(results, chain.result())
+        return self._finish_batch(results, batch, content)
+
+    @staticmethod
+    def _finish_batch(results: Dict[str, OrderResult], batch: List[Dict], content: List) -> List[OrderResult]:
+        # orders no final item named: fall back to the response in the same position,
+        # the rest are looked up among the live orders once every batch is in
+        unresolved = [result for result in results.values() if result.status == "unknown"]
+        if len(content) == len(batch):
+            positional = dict(zip((order['cOID'] for order in batch), content))
+        else:
+            positional = {}
+        for result in unresolved:
+            item = positional.get(result.order['cOID'])
+            result.response = item
+            if isinstance(item, dict) and 'error' in item:
+                result.status = "rejected"
+                result.error = item['error']
+        return [results[order['cOID']] for order in batch]
+
+    @staticmethod
+    def _unknown(results: List[OrderResult]) -> Dict[str, OrderResult]:
+        return {result.order['cOID']: result for result in results if result.status == "unknown"}
+
+    def _apply_live_orders(self, unknown: Dict[str, OrderResult], live_orders: Dict):
+        """Marks the unknown orders found among the live orders, by order_ref, as submitted."""
+        for live_order in (live_orders or {}).get('orders', []):
+            result = unknown.get(live_order.get('order_ref'))
+            if result is not None and live_order.get('acct', self.account_id) == self.account_id:
+                result.status = "submitted"
+                result.order_id = live_order.get('orderId')
+                result.order_status = live_order.get('status')
+
+    def _batches(self, orders: List[Dict]) -> List[List[Dict]]:
+        """Copies of the orders, tagged with a cOID, in batches of batch_size."""
+        orders = [dict(order) for order in orders]
+        for order in orders:
+            if not order.get('cOID'):
+                order['cOID'] = self._new_coid()
+        return [orders[start:start + self.batch_size] for start in range(0, len(orders), self.batch_size)]
+
+    def submit(self, orders: List[Dict]) -> List[OrderResult]:
+        batches = self._batches(orders)
+        # a batch waits on its reply chains, so batches get their own pool and can never starve the chains
+        with ThreadPoolExecutor(max_workers=self.max_workers) as chain_executor, \
+                ThreadPoolExecutor(max_workers=max(1, min(len(batches), self.max_workers))) as batch_executor:
+            futures = [batch_executor.submit(self._submit_batch, batch, chain_executor) for batch in batches]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+
+        unknown = self._unknown(results)
+        if unknown:
+            self._apply_live_orders(unknown, self.client.get_live_orders())
+            self._count()
+        return results
+
+
+class AsyncOrderSubmitter(OrderSubmitter):
+    """
+        OrderSubmitter for AsyncIBClient: the batches and their reply chains run concurrently on
+        the event loop instead of on thread pools. A batch or reply chain that raises, e.g. on a
+        dropped connection, leaves its orders unknown, to be looked up among the live orders,
+        without stopping the others.
+
+            results = await AsyncOrderSubmitter(client, account_id).submit(orders)
+    """
+
+    async def _answer(self, question: Dict) -> List:
+        content = [question]
+        for _ in range(self.max_replies):
+            questions = [item for item in content if self._is_question(item)]
+            if not questions:
+                return content
+            try:
+                content = await self.client.place_order_reply(questions[0]['id'], True)
+            except Exception as e:  # order requests aren't replayed, the other chains go on
+                logger.warning("REPLY %s FAILED: %s", questions[0]['id'], e)
+                return []
+            finally:
+                self._count(replies=1)
+            if not isinstance(content, list):
+                return [content] if content else []
+        return content
+
+    async def _submit_batch(self, batch: List[Dict]):
+        results = {order['cOID']: OrderResult(order) for order in batch}
+        try:
+            content = await self.client.place_orders(self.account_id, batch)
+        except Exception as e:  # the orders may still have reached the gateway, so they stay unknown
+            logger.warning("PLACING ORDERS %s FAILED: %s", [order['cOID'] for order in batch], e)
+            for result in results.values():
+                result.error = str(e)
+            return list(results.values())
+        finally:
+            self._count()
+        if not isinstance(content, list):
+            return self._reject_batch(results, content)
+
+        questions = [item for item in content if self._is_question(item)]
+        self._resolve(results, [item for item in content if not self._is_question(item)])
+        for items in await asyncio.gather(*[self._answer(question) for question in questions]):
+            self._resolve(results, items)
+        return self._finish_batch(results, batch, content)
+
+    async def submit(self, orders: List[Dict]) -> List[OrderResult]:
+        batches = self._batches(orders)
+        results = []
+        for batch_results in await asyncio.gather(*[self._submit_batch(batch) for batch in batches]):
+            results.extend(batch_results)
+
+        unknown = self._unknown(results)
+        if unknown:
+            try:
+                self._apply_live_orders(unknown, await self.client.get_live_orders())
+            except Exception as e:
+                logger.warning("LIVE ORDERS FAILED: %s", e)
+            finally:
+                self._count()
+        for result in results:
+            if result.status != "submitted":
+                logger.warning("ORDER %s NOT PLACED: %s %s", result.order['cOID'], result.status, result.error)
+        return results
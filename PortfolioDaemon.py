@@ -0,0 +1,378 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+from Campaign import Campaign
+from GreeksBook import GreeksBook
+from MarketDataStream import MarketDataStream
+from Metrics import Metrics
+from MoneynessBook import MoneynessBook
+from OrderReconciler import INACTIVE_STATUSES
+from OrderReconciler import OrderReconciler
+from Position import Position
+from PositionPager import PositionPager
+from RiskGrid import RiskGrid
+from SnapshotFetcher import SnapshotFetcher
+from SnapshotFetcher import parse_prices
+from SnapshotStore import SnapshotStore
+from TargetPricer import TargetPricer
+
+
+class _AccountState:
+    __slots__ = ('account_id', 'positions', 'campaigns', 'targets', 'order_signatures')
+
+    def __init__(self, account_id: str):
+        self.account_id = account_id
+        self.positions = {}  # conid -> Position
+        self.campaigns = {}  # und_conid -> Campaign
+        self.targets = {}  # und_conid -> target orders last reconciled
+        self.order_signatures = {}  # und_conid -> live orders as last seen
+
+
+class PortfolioDaemon:
+    """
+        Keeps the portfolio of every account in memory and works on it in cycles, every `interval`
+        seconds, instead of rebuilding everything on each run. Whatever changed since the last
+        cycle marks its underlying dirty:
+        - a price, polled or pushed in through update_prices (e.g. by a MarketDataStream),
+        - a position opened, closed or resized, checked every `positions_every` cycles,
+        - the live orders on the underlying's contracts, e.g. a fill or a cancel from elsewhere.
+        Only the dirty underlyings get their moneyness recomputed, their Campaign updated and
+        their target orders rebuilt, and only those whose targets or live orders changed are
+        reconciled, against just their own live orders.
+
+            daemon = PortfolioDaemon(client, get_account_ids(client), interval=60)
+            daemon.run()  # or daemon.cycle() for a single pass
+
+        With poll_prices=False prices come in through update_prices, and a snapshot is only
+        requested for a held conid that has no price yet, so the API calls of a cycle follow what
+        changed, not the size of the book. A MarketDataStream passed in as `stream` is kept
+        subscribed to every held conid and underlying and feeds update_prices.
+        With a SnapshotStore every `snapshot_every`-th cycle is appended to it, and hydrate()
+        starts the daemon from the last snapshot instead of from nothing.
+    """
+
+    def __init__(self, client, account_ids: List[str], interval: float = 60, positions_every: int = 5,
+                 poll_prices: bool = True, max_workers: int = 4, metrics: Metrics = None,
+                 store: SnapshotStore = None, snapshot_every: int = 10, target_pricer: TargetPricer = None,
+                 stream: MarketDataStream = None):
+        self.client = client
+        self.account_ids = account_ids
+        self.interval = interval
+        self.positions_every = max(1, positions_every)
+        self.poll_prices = poll_prices
+        self.max_workers = max_workers
+        self.metrics = metrics or getattr(client, 'metrics', None) or Metrics(enabled=False)
+        self.store = store
+        self.snapshot_every = max(1, snapshot_every)
+        self.target_pricer = target_pricer or TargetPricer()
+        self.stream = stream
+        if stream is not None:
+            stream.listener = self.update_prices
+
+        self.accounts = {}  # account_id -> _AccountState
+        self._holders = {}  # conid -> contracts priced by it, across accounts
+        self._und_holders = {}  # und_conid -> contracts whose underlying it is
+        self._und_of = {}  # conid -> und_conid, kept after a position closes so its orders still map
+        self._prices = {}  # conid -> price last applied
+        self._greeks = {}  # GreeksBook cache, so legs whose inputs didn't move aren't solved again
+        self._pushed = {}  # conid -> price pushed in by update_prices, applied at the next cycle
+        self._pushed_lock = threading.Lock()
+        self._dirty = set()  # und_conids to recompute
+        self._day = None
+        self._stopped = threading.Event()
+
+        self.cycles = 0
+        self.last_cycle = {}
+
+    """
+        CHANGES
+    """
+
+    def update_prices(self, prices: Dict[int, float]):
+        """Queues prices (conid -> price) for the next cycle, safe to call from any thread."""
+        with self._pushed_lock:
+            self._pushed.update(prices)
+
+    def _apply_prices(self, prices: Dict[int, float]) -> int:
+        changed = 0
+        for conid, price in prices.items():
+            if price is None or self._prices.get(conid) == price:
+                continue
+            self._prices[conid] = price
+            changed += 1
+            for contract in self._holders.get(conid, ()):
+                contract.mkt_price = price
+                self._dirty.add(contract.und_conid)
+            contracts = self._und_holders.get(conid, ())
+            for contract in contracts:
+                contract.und_price = price
+            if contracts:
+                self._dirty.add(conid)
+        return changed
+
+    def _track(self, pos):
+        contract = pos.contract
+        self._holders.setdefault(contract.conid, []).append(contract)
+        self._und_holders.setdefault(contract.und_conid, []).append(contract)
+        self._und_of[contract.conid] = contract.und_conid
+
+    def _untrack(self, pos):
+        contract = pos.contract
+        for holders, key in ((self._holders, contract.conid), (self._und_holders, contract.und_conid)):
+            contracts = holders.get(key, [])
+            for i, held in enumerate(contracts):
+                if held is contract:
+                    del contracts[i]
+                    break
+            if not contracts:
+                holders.pop(key, None)
+
+    def _campaign_for(self, state: _AccountState, pos) -> Campaign:
+        und_conid = pos.contract.und_conid
+        campaign = state.campaigns.get(und_conid)
+        if campaign is None:
+            campaign = state.campaigns[und_conid] = Campaign(und_conid=und_conid, ticker=pos.contract.ticker,
+                                                              currency=pos.contract.currency)
+        return campaign
+
+    def hydrate(self, accounts: Dict[str, Dict[int, Position]]):
+        """
+            Seeds the daemon with positions carrying their details, prices and moneyness, e.g.
+            SnapshotStore.latest(). Their targets count as reconciled, so the first cycle only
+            acts on what differs from the snapshot.
+        """
+        for account_id, positions in accounts.items():
+            if account_id not in self.account_ids:
+                continue
+            state = self.accounts.setdefault(account_id, _AccountState(account_id))
+            for conid, pos in positions.items():
+                state.positions[conid] = pos
+                self._track(pos)
+                self._campaign_for(state, pos).add_position(pos)
+                if pos.contract.mkt_price is not None:
+                    self._prices[conid] = pos.contract.mkt_price
+                if pos.contract.und_price is not None:
+                    self._prices[pos.contract.und_conid] = pos.contract.und_price
+            for und_conid, campaign in state.campaigns.items():
+                targets = campaign.get_target_orders()
+                if targets and not any(order.get('price') is None for order in targets):
+                    state.targets[und_conid] = targets
+        self._sync_stream()
+
+    def _sync_stream(self):
+        if self.stream is not None:
+            self.stream.track_conids(set(self._holders.keys()) | set(self._und_holders.keys()))
+
+    def refresh_positions(self) -> int:
+        """Pages every account's positions in and applies the difference, returns how many changed."""
+        for account_id in self.account_ids:
+            self.accounts.setdefault(account_id, _AccountState(account_id))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(self.account_ids)))) as executor:
+            pages = executor.map(lambda account_id: {pos.contract.conid: pos
+                                                     for pos in PositionPager(self.client, account_id)},
+                                 self.account_ids)
+            fresh = dict(zip(self.account_ids, pages))
+
+        # contract details only for conids nobody held yet
+        new_conids = {conid for positions in fresh.values() for conid in positions if conid not in self._holders}
+        details = {}
+        if new_conids:
+            for detail in self.client.contracts_definitions(sorted(new_conids)) or []:
+                details[detail['conid']] = detail
+
+        changed = 0
+        for account_id, positions in fresh.items():
+            state = self.accounts[account_id]
+            for conid in [conid for conid in state.positions if conid not in positions]:
+                pos = state.positions.pop(conid)
+                self._untrack(pos)
+                campaign = state.campaigns.get(pos.contract.und_conid)
+                if campaign is not None:
+                    campaign.remove_position(conid)
+                    if not campaign.positions:
+                        del state.campaigns[pos.contract.und_conid]
+                self._dirty.add(pos.contract.und_conid)
+                changed += 1
+
+            for conid, pos in positions.items():
+                held = state.positions.get(conid)
+                if held is not None:
+                    if held.size != pos.size:
+                        self._campaign_for(state, held).resize_position(conid, pos.size)
+                        self._dirty.add(held.contract.und_conid)
+                        changed += 1
+                    continue
+                detail = details.get(conid)
+                if detail is None and conid in self._holders:
+                    # another account holds the conid already, copy its detail over
+                    other = self._holders[conid][0]
+                    for name in ('ticker', 'expiry', 'expiry_date', 'strike', 'put_or_call', 'multiplier',
+                                 'und_conid'):
+                        setattr(pos.contract, name, getattr(other, name))
+                elif detail is not None:
+                    pos.contract.set_detail(detail)
+                else:
+                    print("NO CONTRACT DETAIL FOR CONID: {}".format(conid))
+                    continue
+                pos.set_type()
+                pos.contract.und_price = self._prices.get(pos.contract.und_conid)
+                if conid in self._prices:
+                    pos.contract.mkt_price = self._prices[conid]
+                state.positions[conid] = pos
+                self._track(pos)
+                self._campaign_for(state, pos).add_position(pos)
+                self._dirty.add(pos.contract.und_conid)
+                changed += 1
+        return changed
+
+    def refresh_prices(self, missing_only: bool = False) -> int:
+        """
+            Polls snapshots for every held conid and underlying, or with missing_only just for
+            those no price came in for yet, returns how many prices changed.
+        """
+        conids = list(self._holders.keys()) + list(self._und_holders.keys())
+        if missing_only:
+            conids = [conid for conid in conids if conid not in self._prices]
+            if not conids:
+                return 0
+        snapshots, missing = SnapshotFetcher(self.client).fetch(conids)
+        if missing:
+            print("NO MARKET DATA FOR CONIDS: {}".format(missing))
+        return self._apply_prices({conid: price.value for conid, price in parse_prices(snapshots, '31').items()})
+
+    def _order_signatures(self, orders: Iterable[Dict]) -> Dict[int, tuple]:
+        grouped = {}
+        for order in orders:
+            und_conid = self._und_of.get(int(order['conid']), int(order['conid']))
+            grouped.setdefault(und_conid, []).append(
+                (order['orderId'], order.get('status'), str(order.get('price')), str(order.get('remainingQuantity'))))
+        return {und_conid: tuple(sorted(items)) for und_conid, items in grouped.items()}
+
+    def _active_orders(self, live_orders: Dict, account_id: str) -> List[Dict]:
+        return [order for order in (live_orders or {}).get('orders', [])
+                if order.get('status') not in INACTIVE_STATUSES and order.get('acct', account_id) == account_id]
+
+    """
+        CYCLE
+    """
+
+    def _reprice(self, und_conids) -> int:
+        contracts = [contract for und_conid in und_conids for contract in self._und_holders.get(und_conid, ())
+                     if contract.mkt_price is not None and contract.und_price is not None]
+        if contracts:
+            MoneynessBook(contracts).compute().write_back()
+            GreeksBook(contracts, cache=self._greeks).compute().write_back()
+        return len(contracts)
+
+    def _campaigns(self, und_conids) -> List[Campaign]:
+        return [state.campaigns[und_conid] for state in self.accounts.values()
+                for und_conid in und_conids if und_conid in state.campaigns]
+
+    def _revalue(self, und_conids) -> int:
+        """Margin and implied capital of the campaigns on the dirty underlyings, in every account."""
+        campaigns = self._campaigns(und_conids)
+        if campaigns:
+            RiskGrid(campaigns).compute().write_back()
+        return len(campaigns)
+
+    def _reconcile(self, state: _AccountState, und_conids, live_orders: Dict, orders_changed) -> Dict:
+        """Rebuilds the targets of the dirty underlyings and reconciles those that changed."""
+        reconcile = set()
+        for und_conid in und_conids:
+            campaign = state.campaigns.get(und_conid)
+            targets = campaign.get_target_orders() if campaign is not None else []
+            if any(order.get('price') is None for order in targets):
+                continue  # not priced yet, the prices arriving will mark it dirty again
+            if targets != state.targets.get(und_conid, []) or und_conid in orders_changed:
+                reconcile.add(und_conid)
+            if targets:
+                state.targets[und_conid] = targets
+            else:
+                state.targets.pop(und_conid, None)
+        if not reconcile:
+            return {'underlyings': 0, 'api_calls': 0}
+
+        targets = [order for und_conid in reconcile for order in state.targets.get(und_conid, [])]
+        active = [order for order in self._active_orders(live_orders, state.account_id)
+                  if self._und_of.get(int(order['conid']), int(order['conid'])) in reconcile]
+        result = OrderReconciler(self.client, state.account_id).reconcile(targets, {'orders': active})
+        return {'underlyings': len(reconcile), 'api_calls': result.api_calls}
+
+    def cycle(self) -> Dict:
+        """Runs one pass: refresh what is due, then recompute and reconcile what got dirty."""
+        stats = {'positions_changed': 0, 'prices_changed': 0, 'orders_changed': 0}
+        with self.metrics.span("daemon_cycle"):
+            if self.cycles % self.positions_every == 0:
+                with self.metrics.span("daemon_positions"):
+                    stats['positions_changed'] = self.refresh_positions()
+                self._sync_stream()
+            with self._pushed_lock:
+                pushed, self._pushed = self._pushed, {}
+            stats['prices_changed'] = self._apply_prices(pushed)
+            with self.metrics.span("daemon_prices"):
+                # streamed prices leave only what the stream hasn't covered yet to poll
+                stats['prices_changed'] += self.refresh_prices(missing_only=not self.poll_prices)
+
+            # dte, and with it every target, moves on at midnight
+            today = date.today()
+            if today != self._day:
+                self._day = today
+                self._dirty.update(self._und_holders.keys())
+
+            live_orders = self.client.get_live_orders()
+            orders_changed = {}
+            for account_id, state in self.accounts.items():
+                signatures = self._order_signatures(self._active_orders(live_orders, account_id))
+                changed = {und_conid for und_conid in set(signatures) | set(state.order_signatures)
+                           if signatures.get(und_conid) != state.order_signatures.get(und_conid)}
+                state.order_signatures = signatures
+                orders_changed[account_id] = changed
+                stats['orders_changed'] += len(changed)
+
+            dirty, self._dirty = self._dirty, set()
+            try:
+                with self.metrics.span("daemon_recompute"):
+                    stats['contracts_repriced'] = self._reprice(dirty)
+                    stats['targets_priced'] = self.target_pricer.price(self._campaigns(dirty))
+                    stats['campaigns_revalued'] = self._revalue(dirty)
+                    stats['dirty_underlyings'] = len(dirty)
+                    stats['reconciled_underlyings'] = 0
+                    stats['order_api_calls'] = 0
+                    for account_id, state in self.accounts.items():
+                        result = self._reconcile(state, dirty | orders_changed[account_id], live_orders,
+                                                 orders_changed[account_id])
+                        stats['reconciled_underlyings'] += result['underlyings']
+                        stats['order_api_calls'] += result['api_calls']
+            except Exception:
+                self._dirty |= dirty  # try them again next cycle
+                raise
+
+        if self.store is not None and self.cycles % self.snapshot_every == 0:
+            with self.metrics.span("daemon_snapshot"):
+                self.store.append({account_id: state.positions for account_id, state in self.accounts.items()})
+
+        self.cycles += 1
+        self.last_cycle = stats
+        return stats
+
+    def run(self, cycles: int = None):
+        """Runs cycles every `interval` seconds until stop(), or until `cycles` have run."""
+        ran = 0
+        while not self._stopped.is_set() and (cycles is None or ran < cycles):
+            start = time.monotonic()
+            try:
+                print("CYCLE {}: {}".format(self.cycles, self.cycle()))
+            except Exception as e:  # a failed cycle must not end the daemon, the next one retries
+                print("CYCLE {} FAILED: {}".format(self.cycles, e))
+            ran += 1
+            if cycles is None or ran < cycles:
+                self._stopped.wait(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def stop(self):
+        self._stopped.set()
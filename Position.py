@@ -1,9 +1,66 @@
+from functools import lru_cache
+
+from typing import Callable
 from typing import Dict
 from typing import List
+from typing import Tuple
 from Contract import Contract
 
 
+# fields every position row from portfolio/{accountId}/positions/{pageId} must carry
+REQUIRED_FIELDS = frozenset(('conid', 'position', 'assetClass', 'currency', 'mktPrice', 'avgPrice'))
+
+
+class ExportField:
+    """
+        A column of the export. `accessor` reads the value off a Position (or a PositionView);
+        `column` names the PositionBook column holding the same value, so a whole book can be
+        exported column by column without a view per row.
+    """
+    __slots__ = ('name', 'accessor', 'column')
+
+    def __init__(self, name: str, accessor: Callable, column: str = None):
+        self.name = name
+        self.accessor = accessor
+        self.column = column
+
+
+# header name (as in the sheet and to_json_dict) -> ExportField
+EXPORT_FIELDS = {}
+
+
+@lru_cache(maxsize=64)
+def compile_header(header: Tuple[str, ...]) -> Tuple[Tuple[str, ExportField], ...]:
+    """The registered fields of a header, in order. Unknown names are left out."""
+    return tuple((name, EXPORT_FIELDS[name]) for name in header if name in EXPORT_FIELDS)
+
+
+def register_export_field(name: str, accessor: Callable, column: str = None):
+    """Adds (or replaces) an export column, e.g. a greek or a campaign field."""
+    EXPORT_FIELDS[name] = ExportField(name, accessor, column)
+    compile_header.cache_clear()
+
+
+def _contract_field(name: str, attribute: str):
+    register_export_field(name, lambda pos: getattr(pos.contract, attribute), column=attribute)
+
+
+for _name, _attribute in (("lastUpdate", 'last_update'), ("conid", 'conid'), ("ticker", 'ticker'),
+                          ("undConid", 'und_conid'), ("expiry", 'expiry'), ("putOrCall", 'put_or_call'),
+                          ("strike", 'strike'), ("multiplier", 'multiplier'), ("currency", 'currency'),
+                          ("mktPrice", 'mkt_price'), ("undPrice", 'und_price'), ("dte", 'dte'),
+                          ("extrinsic", 'extrinsic'), ("intrinsic", 'intrinsic'),
+                          ("ann_extrinsic", 'ann_extrinsic'), ("target", 'target'), ("iv", 'iv'),
+                          ("delta", 'delta'), ("gamma", 'gamma'), ("theta", 'theta'), ("vega", 'vega')):
+    _contract_field(_name, _attribute)
+register_export_field("size", lambda pos: pos.size, column='size')
+register_export_field("avgPrice", lambda pos: pos.avg_price, column='avg_price')
+register_export_field("type", lambda pos: pos.type, column='type')
+
+
 class Position:
+    __slots__ = ('contract', 'size', 'avg_price', 'type')
+
     def __init__(self, contract, size, avg_price):
         self.contract = contract
         self.size = size
@@ -11,8 +68,8 @@ class Position:
         self.type = None
 
     @staticmethod
-    def parse_json_dict(json_dict: Dict):
-        # todo add check if field is there
+    def parse_json_dict(json_dict: Dict, last_update=None):
+        # the REQUIRED_FIELDS are checked by the caller, see PositionPager.valid_rows
         # todo check it's option or stock
         size = json_dict["position"]
         if size == 0:
@@ -25,9 +82,9 @@ class Position:
         contract = Contract(conid=conid,
                             asset_class=asset_class,
                             currency=currency,
-                            mkt_price=mkt_price)
+                            mkt_price=mkt_price,
+                            last_update=last_update)
 
-        size = json_dict["position"]
         avg_price = json_dict["avgPrice"]
         position = Position(contract=contract, size=size, avg_price=avg_price)
 
@@ -36,46 +93,7 @@ class Position:
     def to_json_dict(self, header=None):
         if header is None:
             header = ['conid', 'mktPrice', 'undPrice']
-        json_dict = {}
-        for field in header:
-            if field == "lastUpdate":
-                json_dict[field] = self.contract.last_update
-            elif field == "conid":
-                json_dict[field] = self.contract.conid
-            elif field == "ticker":
-                json_dict[field] = self.contract.ticker
-            elif field == "undConid":
-                json_dict[field] = self.contract.und_conid
-            elif field == "expiry":
-                json_dict[field] = self.contract.expiry
-            elif field == "putOrCall":
-                json_dict[field] = self.contract.put_or_call
-            elif field == "strike":
-                json_dict[field] = self.contract.strike
-            elif field == "multiplier":
-                json_dict[field] = self.contract.multiplier
-            elif field == 'currency':
-                json_dict[field] = self.contract.currency
-            elif field == "mktPrice":
-                json_dict[field] = self.contract.mkt_price
-            elif field == "undPrice":
-                json_dict[field] = self.contract.und_price
-            elif field == "size":
-                json_dict[field] = self.size
-            elif field == "avgPrice":
-                json_dict[field] = self.avg_price
-            elif field == "dte":
-                json_dict[field] = self.contract.dte
-            elif field == "extrinsic":
-                json_dict[field] = self.contract.extrinsic
-            elif field == "intrinsic":
-                json_dict[field] = self.contract.intrinsic
-            elif field == "ann_extrinsic":
-                json_dict[field] = self.contract.ann_extrinsic
-            elif field == "target":
-                json_dict[field] = self.contract.target
-
-        return json_dict
+        return {name: field.accessor(self) for name, field in compile_header(tuple(header))}
 
     def set_type(self):
         self.type = self._get_type()
@@ -0,0 +1,258 @@
+from array import array
+
+from typing import Dict
+from typing import Iterable
+from Contract import Contract
+from Position import Position
+
+
+NAN = float('nan')
+NO_INT = -2 ** 63  # stands for None in integer columns
+
+# column name -> kind: 'q' int, 'd' float, 'o' any python object (interned)
+CONTRACT_COLUMNS = {
+    'conid': 'q',
+    'asset_class': 'o',
+    'currency': 'o',
+    'mkt_price': 'd',
+    'last_update': 'o',
+    'und_conid': 'q',
+    'ticker': 'o',
+    'expiry': 'o',
+    'expiry_date': 'o',
+    'strike': 'd',
+    'put_or_call': 'o',
+    'multiplier': 'o',
+    'und_price': 'd',
+    'dte': 'q',
+    'intrinsic': 'd',
+    'extrinsic': 'd',
+    'ann_extrinsic': 'd',
+    'target': 'd',
+    'target_priced': 'o',
+    'iv': 'd',
+    'delta': 'd',
+    'gamma': 'd',
+    'theta': 'd',
+    'vega': 'd',
+}
+
+# float columns whose whole values read back as int, sizes are whole but may be fractional (shares)
+INTEGRAL_COLUMNS = frozenset(('size',))
+
+POSITION_COLUMNS = {
+    'size': 'd',
+    'avg_price': 'd',
+    'type': 'o',
+}
+
+
+def as_integral(value: float):
+    """A whole float as int, e.g. a size of -5.0 as -5, so orders and the sheet show it as it came in."""
+    return int(value) if value.is_integer() else value
+
+
+def _column_property(name: str, kind: str):
+    if kind == 'd' and name in INTEGRAL_COLUMNS:
+        def fget(self):
+            value = self._book.columns[name][self._index]
+            return None if value != value else as_integral(value)  # NaN is None
+
+        def fset(self, value):
+            self._book.columns[name][self._index] = NAN if value is None else value
+    elif kind == 'd':
+        def fget(self):
+            value = self._book.columns[name][self._index]
+            return None if value != value else value  # NaN is None
+
+        def fset(self, value):
+            self._book.columns[name][self._index] = NAN if value is None else value
+    elif kind == 'q':
+        def fget(self):
+            value = self._book.columns[name][self._index]
+            return None if value == NO_INT else value
+
+        def fset(self, value):
+            self._book.columns[name][self._index] = NO_INT if value is None else value
+    else:
+        def fget(self):
+            return self._book.columns[name][self._index]
+
+        def fset(self, value):
+            self._book.columns[name][self._index] = self._book.intern(value)
+
+    return property(fget, fset)
+
+
+class ContractView:
+    """A row of a PositionBook seen through the Contract attribute and method API."""
+    __slots__ = ('_book', '_index')
+
+    def __init__(self, book, index):
+        self._book = book
+        self._index = index
+
+    _date_and_time = staticmethod(Contract._date_and_time)
+    _get_ann_target = staticmethod(Contract._get_ann_target)
+    _set_moneyness = Contract._set_moneyness
+    _can_set_moneyness = Contract._can_set_moneyness
+    set_mkt_price = Contract.set_mkt_price
+    set_und_price = Contract.set_und_price
+    set_prices = Contract.set_prices
+    set_detail = Contract.set_detail
+
+
+class PositionView:
+    """A row of a PositionBook seen through the Position attribute and method API."""
+    __slots__ = ('_book', '_index')
+
+    def __init__(self, book, index):
+        self._book = book
+        self._index = index
+
+    @property
+    def contract(self):
+        return ContractView(self._book, self._index)
+
+    to_json_dict = Position.to_json_dict
+    set_type = Position.set_type
+    _get_type = Position._get_type
+    get_close_order_json = Position.get_close_order_json
+
+
+for _name, _kind in CONTRACT_COLUMNS.items():
+    setattr(ContractView, _name, _column_property(_name, _kind))
+for _name, _kind in POSITION_COLUMNS.items():
+    setattr(PositionView, _name, _column_property(_name, _kind))
+
+
+class PositionBook:
+    """
+        Column-wise store of positions. Every Contract and Position field lives in one array (or
+        one list of interned objects for strings), and rows are handed out as lightweight views
+        that keep the usual attribute API:
+
+            book = PositionBook.from_positions(positions)
+            pos = book.get(conid)
+            pos.contract.strike, pos.size
+
+        Views are created on access and hold nothing but the row index, so they are cheap to make
+        and to throw away.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        for name, kind in list(CONTRACT_COLUMNS.items()) + list(POSITION_COLUMNS.items()):
+            self.columns[name] = [] if kind == 'o' else array(kind)
+        self._kinds = dict(CONTRACT_COLUMNS, **POSITION_COLUMNS)
+        self._interned = {}
+        self._rows = {}  # conid -> row index
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, conid):
+        return conid in self._rows
+
+    def __iter__(self):
+        for index in range(len(self.columns['conid'])):
+            yield PositionView(self, index)
+
+    def intern(self, value):
+        try:
+            return self._interned.setdefault(value, value)
+        except TypeError:  # unhashable
+            return value
+
+    def _append_value(self, name: str, value):
+        kind = self._kinds[name]
+        if kind == 'd':
+            value = NAN if value is None else value
+        elif kind == 'q':
+            value = NO_INT if value is None else value
+        else:
+            value = self.intern(value)
+        self.columns[name].append(value)
+
+    def add(self, position) -> PositionView:
+        """Copies a Position (or a view from another book) in as a new row, or over the row of its conid."""
+        conid = position.contract.conid
+        if conid in self._rows:
+            view = PositionView(self, self._rows[conid])
+            for name in CONTRACT_COLUMNS.keys():
+                setattr(view.contract, name, getattr(position.contract, name))
+            for name in POSITION_COLUMNS.keys():
+                setattr(view, name, getattr(position, name))
+            return view
+
+        for name in CONTRACT_COLUMNS.keys():
+            self._append_value(name, getattr(position.contract, name))
+        for name in POSITION_COLUMNS.keys():
+            self._append_value(name, getattr(position, name))
+        index = len(self.columns['conid']) - 1
+        self._rows[conid] = index
+        return PositionView(self, index)
+
+    def add_json_rows(self, rows: Iterable[Dict], last_update: str):
+        """
+            Appends position rows as returned by the gateway straight into the columns, without
+            building a Position or Contract per row. The rows must carry the REQUIRED_FIELDS;
+            closed positions (size 0) are skipped and a conid already in the book is overwritten.
+        """
+        columns = self.columns
+        conids, sizes, avg_prices = columns['conid'], columns['size'], columns['avg_price']
+        asset_classes, currencies, mkt_prices = columns['asset_class'], columns['currency'], columns['mkt_price']
+        last_update = self.intern(last_update)
+        # columns the gateway doesn't fill in, with their empty value
+        blank = [(columns[name], None if kind == 'o' else NAN if kind == 'd' else NO_INT)
+                 for name, kind in self._kinds.items()
+                 if name not in ('conid', 'asset_class', 'currency', 'mkt_price', 'last_update', 'und_conid',
+                                 'size', 'avg_price')]
+        intern = self.intern
+        for row in rows:
+            size = row['position']
+            if size == 0:
+                continue
+            conid = row['conid']
+            mkt_price = row['mktPrice']
+            if conid in self._rows:
+                view = PositionView(self, self._rows[conid])
+                view.contract.asset_class = row['assetClass']
+                view.contract.currency = row['currency']
+                view.contract.mkt_price = mkt_price
+                view.contract.last_update = last_update
+                view.size = size
+                view.avg_price = row['avgPrice']
+                continue
+
+            self._rows[conid] = len(conids)
+            conids.append(conid)
+            columns['und_conid'].append(conid)  # und means underlying, default for STK
+            asset_classes.append(intern(row['assetClass']))
+            currencies.append(intern(row['currency']))
+            mkt_prices.append(NAN if mkt_price is None else mkt_price)
+            columns['last_update'].append(last_update)
+            sizes.append(size)
+            avg_price = row['avgPrice']
+            avg_prices.append(NAN if avg_price is None else avg_price)
+            for column, value in blank:
+                column.append(value)
+
+    @staticmethod
+    def from_positions(positions: Iterable) -> 'PositionBook':
+        book = PositionBook()
+        for pos in positions:
+            book.add(pos)
+        return book
+
+    def get(self, conid: int) -> PositionView:
+        index = self._rows.get(conid)
+        return None if index is None else PositionView(self, index)
+
+    def to_dict(self) -> Dict[int, PositionView]:
+        """conid -> view, the shape main.py passes positions around in."""
+        return {conid: PositionView(self, index) for conid, index in self._rows.items()}
+
+    def column(self, name: str):
+        """The raw column, an array for numeric fields (NaN / -2**63 for None) or a list."""
+        return self.columns[name]
@@ -0,0 +1,67 @@
+from typing import Iterable
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from Position import ExportField
+from Position import compile_header
+from PositionBook import INTEGRAL_COLUMNS
+from PositionBook import NO_INT
+from PositionBook import PositionBook
+from PositionBook import PositionView
+from PositionBook import as_integral
+
+
+def _column_text(book: PositionBook, field: ExportField, indexes: Sequence[int]) -> List[str]:
+    if field.column is None:
+        return [str(field.accessor(PositionView(book, index))) for index in indexes]
+    column = book.columns[field.column]
+    values = column if len(indexes) == len(column) and indexes == range(len(column)) \
+        else map(column.__getitem__, indexes)
+    kind = book._kinds[field.column]
+    if kind == 'd' and field.column in INTEGRAL_COLUMNS:
+        return ["None" if value != value else str(as_integral(value)) for value in values]
+    elif kind == 'd':
+        return ["None" if value != value else str(value) for value in values]
+    elif kind == 'q':
+        return ["None" if value == NO_INT else str(value) for value in values]
+    return list(map(str, values))
+
+
+def _book_rows(positions) -> Tuple[PositionBook, Sequence[int]]:
+    """The book and row indexes behind positions, or (None, None) if they aren't all rows of one book."""
+    if isinstance(positions, PositionBook):
+        return positions, range(len(positions.columns['conid']))
+    positions = list(positions)
+    if not positions or not isinstance(positions[0], PositionView):
+        return None, None
+    book = positions[0]._book
+    indexes = []
+    for pos in positions:
+        if not isinstance(pos, PositionView) or pos._book is not book:
+            return None, None
+        indexes.append(pos._index)
+    if indexes == list(range(len(book.columns['conid']))):
+        indexes = range(len(indexes))  # the whole book in order, read the columns straight through
+    return book, indexes
+
+
+def export_rows(positions: Iterable, header: List[str]) -> List[Sequence[str]]:
+    """
+        Rows of text for the sheet, one per position with a cell per header field ("" for fields
+        that aren't registered). A PositionBook, or rows of one, is exported column by column and
+        its rows come back as tuples.
+    """
+    if isinstance(positions, dict):
+        positions = positions.values()
+    if not isinstance(positions, PositionBook):
+        positions = list(positions)
+    fields = dict(compile_header(tuple(header)))
+
+    book, indexes = _book_rows(positions)
+    if book is not None:
+        blank = [""] * len(indexes)
+        columns = [_column_text(book, fields[name], indexes) if name in fields else blank for name in header]
+        return list(zip(*columns))
+
+    getters = [fields[name].accessor if name in fields else None for name in header]
+    return [["" if get is None else str(get(pos)) for get in getters] for pos in positions]
@@ -0,0 +1,171 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Dict
+from typing import List
+from Contract import Contract
+from Position import Position
+from Position import REQUIRED_FIELDS
+from PositionBook import PositionBook
+
+
+def valid_rows(page: List[Dict]) -> List[Dict]:
+    """The rows of a page that carry every required field; the others are reported once per page."""
+    rows = [row for row in page if row.keys() >= REQUIRED_FIELDS]
+    if len(rows) < len(page):
+        bad = [row for row in page if not row.keys() >= REQUIRED_FIELDS]
+        missing = set().union(*(REQUIRED_FIELDS - row.keys() for row in bad))
+        print("SKIPPED {} POSITIONS MISSING {}: {}".format(
+            len(bad), sorted(missing), [row.get('conid') for row in bad]))
+    return rows
+
+
+def parse_positions_page(page: List[Dict]) -> List[Position]:
+    last_update = Contract._date_and_time()
+    positions = []
+    for pos_json in valid_rows(page):
+        pos = Position.parse_json_dict(pos_json, last_update=last_update)
+        if pos is not None:
+            positions.append(pos)
+    return positions
+
+
+class _PageWindow:
+    """
+        Paging state shared by the sync and async pagers.
+        The page size is learned from the largest page seen so far rather than assumed, so the
+        first page always counts as full. Paging stops at the first page that is empty or shorter
+        than the learned size.
+    """
+
+    def __init__(self, prefetch: int):
+        self.prefetch = max(1, prefetch)
+        self.page_size = None
+        self.next_page = 0
+        self.done = False
+
+    def take_page_id(self) -> int:
+        page_id = self.next_page
+        self.next_page += 1
+        return page_id
+
+    def accept(self, page_id: int, page: List[Dict]) -> List[Dict]:
+        if page is None:
+            raise RuntimeError("failed to fetch positions page {}".format(page_id))
+        if self.page_size is None or len(page) > self.page_size:
+            self.page_size = len(page)
+        if len(page) == 0 or len(page) < self.page_size:
+            self.done = True
+        return page
+
+
+class PositionPager:
+    """
+        Streams the positions of an account page by page. After the first page arrives, the next
+        `prefetch` pages are requested in parallel and handed out in page order, so the caller can
+        start working on a page while the following ones are still in flight.
+
+            for pos in PositionPager(client, account_id):
+                ...
+    """
+
+    def __init__(self, client, account_id: str, prefetch: int = 4):
+        self.client = client
+        self.account_id = account_id
+        self.prefetch = prefetch
+
+    def _fetch(self, page_id: int) -> List[Dict]:
+        return self.client.portfolio_account_positions(account_id=self.account_id, page_id=page_id)
+
+    def raw_pages(self):
+        window = _PageWindow(self.prefetch)
+        page_id = window.take_page_id()
+        yield window.accept(page_id, self._fetch(page_id))
+        if window.done:
+            return
+
+        with ThreadPoolExecutor(max_workers=window.prefetch) as executor:
+            in_flight = deque()
+            for _ in range(window.prefetch):
+                page_id = window.take_page_id()
+                in_flight.append((page_id, executor.submit(self._fetch, page_id)))
+
+            while in_flight and not window.done:
+                page_id, future = in_flight.popleft()
+                page = window.accept(page_id, future.result())
+                if not window.done:
+                    next_id = window.take_page_id()
+                    in_flight.append((next_id, executor.submit(self._fetch, next_id)))
+                if page:
+                    yield page
+
+            for _, future in in_flight:
+                future.cancel()
+
+    def pages(self):
+        for page in self.raw_pages():
+            yield parse_positions_page(page)
+
+    def book(self, book: PositionBook = None) -> PositionBook:
+        """Loads every page straight into a PositionBook, dropping each page once it is in."""
+        book = PositionBook() if book is None else book
+        for page in self.raw_pages():
+            book.add_json_rows(valid_rows(page), Contract._date_and_time())
+        return book
+
+    def __iter__(self):
+        for positions in self.pages():
+            yield from positions
+
+
+class AsyncPositionPager(PositionPager):
+    """
+        asyncio counterpart of PositionPager for AsyncIBClient.
+
+            async for pos in AsyncPositionPager(client, account_id):
+                ...
+    """
+
+    async def raw_pages(self):
+        window = _PageWindow(self.prefetch)
+        page_id = window.take_page_id()
+        yield window.accept(page_id, await self._fetch(page_id))
+        if window.done:
+            return
+
+        in_flight = deque()
+        try:
+            for _ in range(window.prefetch):
+                page_id = window.take_page_id()
+                in_flight.append((page_id, asyncio.ensure_future(self._fetch(page_id))))
+
+            while in_flight and not window.done:
+                page_id, task = in_flight.popleft()
+                page = window.accept(page_id, await task)
+                if not window.done:
+                    next_id = window.take_page_id()
+                    in_flight.append((next_id, asyncio.ensure_future(self._fetch(next_id))))
+                if page:
+                    yield page
+        finally:
+            for _, task in in_flight:
+                task.cancel()
+
+    async def pages(self):
+        async for page in self.raw_pages():
+            yield parse_positions_page(page)
+
+    async def book(self, book: PositionBook = None) -> PositionBook:
+        book = PositionBook() if book is None else book
+        async for page in self.raw_pages():
+            book.add_json_rows(valid_rows(page), Contract._date_and_time())
+        return book
+
+    async def __aiter__(self):
+        async for positions in self.pages():
+            for pos in positions:
+                yield pos
+
+    def __iter__(self):
+        raise TypeError("use 'async for' with AsyncPositionPager")
@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import itertools
+import re
+import threading
+import time
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+
+# (method or None for any, endpoint pattern, requests per second, burst)
+# per-endpoint pacing of the Client Portal gateway, stricter than the global limit
+DEFAULT_LIMITS = [
+    ('GET', r'^iserver/marketdata/snapshot', 10, 10),
+    ('GET', r'^iserver/account/orders$', 1 / 5, 1),
+    ('GET', r'^iserver/trades', 1 / 5, 1),
+    ('GET', r'^portfolio/accounts', 1 / 5, 1),
+    ('GET', r'^portfolio/subaccounts', 1 / 5, 1),
+    ('POST', r'^tickle', 1, 1),
+    ('GET', r'^sso/validate', 1 / 60, 1),
+]
+
+# (method or None for any, endpoint pattern, priority class), first match wins, lower goes first
+DEFAULT_PRIORITIES = [
+    ('POST', r'^iserver/account/[^/]+/orders?(/|$)', 'orders'),
+    ('DELETE', r'^iserver/account/[^/]+/order/', 'orders'),
+    ('POST', r'^iserver/reply/', 'orders'),
+    (None, r'^iserver/marketdata/', 'market_data'),
+    (None, r'^(portfolio/|/?trsrv/)', 'portfolio'),
+]
+PRIORITY_CLASSES = {'orders': 0, 'market_data': 1, 'other': 1, 'portfolio': 2}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until_token(self) -> float:
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def drain(self, seconds: float):
+        """Holds the bucket empty for `seconds`, e.g. after the gateway answered 429.
+        Concurrent 429s of the same burst don't add up, the bucket is held empty once."""
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'bucket', 'name', 'enqueued')
+
+    def __init__(self, priority, seq, bucket, name):
+        self.priority = priority
+        self.seq = seq
+        self.bucket = bucket
+        self.name = name
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RequestScheduler:
+    """
+        Paces the requests of IBClient so they stay under the gateway's throttling limits, which
+        otherwise answers 429 and puts the session in a penalty box.
+        Every request takes a token from a global bucket and from its endpoint's bucket, if the
+        endpoint has its own limit. Requests waiting for a token are served by priority: order
+        placement, cancels and replies, then market data, then portfolio and secdef. A request
+        held back by its own endpoint's limit never blocks requests for other endpoints.
+
+            client = IBClient(scheduler=RequestScheduler())
+            client.scheduler.metrics()
+    """
+
+    def __init__(self, global_rate: float = 10, global_burst: float = 10,
+                 limits: List[Tuple] = DEFAULT_LIMITS, priorities: List[Tuple] = DEFAULT_PRIORITIES):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._limits = [(method, re.compile(pattern), TokenBucket(rate, burst))
+                        for method, pattern, rate, burst in limits]
+        self._priorities = [(method, re.compile(pattern), name) for method, pattern, name in priorities]
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._waiters = []
+        self._seq = itertools.count()
+
+        # metrics
+        self.max_queue_depth = 0
+        self._waits = {name: [0, 0.0, 0.0] for name in PRIORITY_CLASSES.keys()}  # count, total, max
+
+    def _bucket_for(self, endpoint: str, req_type: str):
+        for method, pattern, bucket in self._limits:
+            if (method is None or method == req_type) and pattern.search(endpoint):
+                return bucket
+        return None
+
+    def _class_for(self, endpoint: str, req_type: str) -> str:
+        for method, pattern, name in self._priorities:
+            if (method is None or method == req_type) and pattern.search(endpoint):
+                return name
+        return 'other'
+
+    def _enqueue(self, endpoint: str, req_type: str) -> _Waiter:
+        name = self._class_for(endpoint, req_type)
+        waiter = _Waiter(PRIORITY_CLASSES[name], next(self._seq), self._bucket_for(endpoint, req_type), name)
+        heapq.heappush(self._waiters, waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        return waiter
+
+    def _try_take(self, waiter: _Waiter) -> float:
+        """Takes the tokens for waiter if it is its turn, returns 0, or else how long to wait. Holds the lock."""
+        now = time.monotonic()
+        self.global_bucket.refill(now)
+        for waiter_ in self._waiters:
+            if waiter_.bucket is not None:
+                waiter_.bucket.refill(now)
+
+        # the first waiter, in priority order, whose endpoint bucket has a token goes next
+        for candidate in sorted(self._waiters):
+            if candidate.bucket is None or candidate.bucket.tokens >= 1:
+                break
+        else:
+            candidate = None
+
+        own_wait = waiter.bucket.time_until_token() if waiter.bucket is not None else 0.0
+        if candidate is not waiter:
+            return max(own_wait, self.global_bucket.time_until_token(), 0.001)
+        if self.global_bucket.tokens < 1:
+            return self.global_bucket.time_until_token()
+
+        self.global_bucket.tokens -= 1
+        if waiter.bucket is not None:
+            waiter.bucket.tokens -= 1
+        self._waiters.remove(waiter)
+        heapq.heapify(self._waiters)
+
+        wait = now - waiter.enqueued
+        stats = self._waits[waiter.name]
+        stats[0] += 1
+        stats[1] += wait
+        stats[2] = max(stats[2], wait)
+        return 0.0
+
+    def acquire(self, endpoint: str, req_type: str):
+        """Blocks until the request may be sent."""
+        with self._cond:
+            waiter = self._enqueue(endpoint, req_type)
+            while True:
+                wait = self._try_take(waiter)
+                if wait == 0.0:
+                    self._cond.notify_all()
+                    return
+                self._cond.wait(wait)
+
+    async def acquire_async(self, endpoint: str, req_type: str):
+        """acquire for AsyncIBClient, waits without blocking the event loop."""
+        with self._lock:
+            waiter = self._enqueue(endpoint, req_type)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(waiter)
+                    if wait == 0.0:
+                        self._cond.notify_all()
+                        return
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                self._cond.notify_all()
+            raise
+
+    def penalize(self, endpoint: str, req_type: str, seconds: float):
+        """Backs off an endpoint (or everything, for unlimited endpoints) after a 429."""
+        with self._cond:
+            bucket = self._bucket_for(endpoint, req_type)
+            (bucket if bucket is not None else self.global_bucket).drain(seconds)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            waits = {}
+            for name, (count, total, longest) in self._waits.items():
+                waits[name] = {'requests': count,
+                               'mean_wait': total / count if count else 0.0,
+                               'max_wait': longest}
+            return {'queue_depth': len(self._waiters),
+                    'max_queue_depth': self.max_queue_depth,
+                    'wait': waits}
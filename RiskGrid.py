@@ -0,0 +1,160 @@
+import numpy as np
+
+from typing import Dict
+from typing import Iterable
+from typing import Tuple
+from Campaign import Campaign
+from GreeksBook import MIN_VOL
+from GreeksBook import bs_price
+
+
+DEFAULT_PRICE_SHOCKS = np.round(np.linspace(-0.5, 0.5, 41), 4)  # 2.5% steps
+DEFAULT_VOL_SHIFTS = np.round(np.linspace(-0.2, 0.2, 5), 4)  # absolute vol points
+MARGIN_RANGE = 0.15  # price moves the margin estimate covers, like the +/-15% of a portfolio margin stock stress
+
+
+class RiskGrid:
+    """
+        Scenario revaluation of whole campaigns. Every leg is revalued under every combination of
+        an underlying price shock and a vol shift in one broadcast (legs x scenarios) NumPy pass,
+        options with Black-Scholes at their implied vol (see GreeksBook) and stock at the shocked
+        price. Legs are laid out campaign by campaign, i.e. grouped by und_conid, so a campaign's
+        P&L per scenario is one reduceat over its rows and offsetting legs net out.
+
+            grid = RiskGrid(campaigns.values())
+            grid.compute().write_back()
+            campaign.margin, campaign.implied_capital, campaign.worst_loss
+            grid.book_margin, grid.book_worst_loss
+
+        For each campaign:
+            worst_loss        the largest loss over the whole grid, with its scenario
+            implied_capital   the capital that keeps the campaign solvent in every scenario, the worst loss
+            margin            the largest loss over the price shocks within +/-margin_range
+
+        Book totals: book_margin and book_implied_capital add up the campaigns (no offsets across
+        underlyings), book_worst_loss is the worst scenario with every underlying shocked together.
+        An option leg with no implied vol keeps its current extrinsic value across scenarios. A
+        campaign with a leg missing its underlying price can't be revalued and is left as None.
+    """
+
+    def __init__(self, campaigns: Iterable[Campaign], price_shocks: Iterable[float] = DEFAULT_PRICE_SHOCKS,
+                 vol_shifts: Iterable[float] = DEFAULT_VOL_SHIFTS, margin_range: float = MARGIN_RANGE,
+                 rate: float = 0.0):
+        price_shocks = np.asarray(price_shocks, dtype=np.float64)
+        vol_shifts = np.asarray(vol_shifts, dtype=np.float64)
+        # scenario i is (price_shock[i], vol_shift[i]), every price shock under every vol shift
+        self.price_shock = np.repeat(price_shocks, len(vol_shifts))
+        self.vol_shift = np.tile(vol_shifts, len(price_shocks))
+        self.in_margin_range = np.abs(self.price_shock) <= margin_range + 1e-12
+        self.rate = rate
+
+        self.campaigns = []
+        starts, und_price, strike, dte, iv, mkt_price, is_put, is_option, quantity = [], [], [], [], [], [], [], [], []
+        for campaign in campaigns:
+            legs = list(campaign.positions.values())
+            if not legs or any(self._und_price(pos.contract) is None for pos in legs):
+                continue
+            self.campaigns.append(campaign)
+            starts.append(len(quantity))
+            for pos in legs:
+                contract = pos.contract
+                option = contract.asset_class == "OPT"
+                und_price.append(self._und_price(contract))
+                strike.append(contract.strike if option else np.nan)
+                dte.append(contract.dte if option and contract.dte is not None else -1)
+                iv.append(contract.iv if option and contract.iv is not None else np.nan)
+                mkt_price.append(contract.mkt_price if contract.mkt_price is not None else np.nan)
+                is_put.append(contract.put_or_call == "P")
+                is_option.append(option)
+                quantity.append(pos.size * (float(contract.multiplier or 1) if option else 1.0))
+
+        self.starts = np.array(starts, dtype=np.int64)
+        self.und_price = np.array(und_price, dtype=np.float64)
+        self.strike = np.array(strike, dtype=np.float64)
+        self.t = (np.array(dte, dtype=np.float64) + 1) / 365  # as in GreeksBook
+        self.iv = np.array(iv, dtype=np.float64)
+        self.mkt_price = np.array(mkt_price, dtype=np.float64)
+        self.is_put = np.array(is_put, dtype=bool)
+        self.is_option = np.array(is_option, dtype=bool)
+        self.quantity = np.array(quantity, dtype=np.float64)
+
+        self.pnl = None  # campaigns x scenarios
+        self.worst_loss = None
+        self.worst_scenario = None
+        self.margin = None
+        self.book_pnl = None
+        self.book_worst_loss = None
+        self.book_margin = None
+        self.book_implied_capital = None
+
+    @staticmethod
+    def _und_price(contract):
+        return contract.und_price if contract.asset_class == "OPT" else contract.mkt_price
+
+    def __len__(self):
+        return len(self.quantity)
+
+    @property
+    def n_scenarios(self) -> int:
+        return len(self.price_shock)
+
+    def scenario(self, index: int) -> Tuple[float, float]:
+        """(price shock, vol shift) of a scenario."""
+        return float(self.price_shock[index]), float(self.vol_shift[index])
+
+    @staticmethod
+    def _intrinsic(und_price: np.ndarray, strike: np.ndarray, is_put: np.ndarray) -> np.ndarray:
+        return np.where(is_put, np.maximum(0, strike - und_price), np.maximum(0, und_price - strike))
+
+    def _leg_values(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Value per unit of every leg now, and under every scenario (legs x scenarios)."""
+        shocked = self.und_price[:, None] * (1 + self.price_shock[None, :])
+        now = self.und_price.copy()
+        values = shocked.copy()  # stock is worth the underlying price
+
+        modelled = np.flatnonzero(self.is_option & ~np.isnan(self.iv) & (self.t > 0))
+        if len(modelled):
+            strike, t, is_put = self.strike[modelled, None], self.t[modelled, None], self.is_put[modelled, None]
+            vol = np.maximum(self.iv[modelled, None] + self.vol_shift[None, :], MIN_VOL)
+            values[modelled] = bs_price(is_put, shocked[modelled], strike, t, self.rate, vol)
+            now[modelled] = bs_price(is_put[:, 0], self.und_price[modelled], strike[:, 0], t[:, 0], self.rate,
+                                     self.iv[modelled])
+
+        frozen = np.flatnonzero(self.is_option & (np.isnan(self.iv) | (self.t <= 0)))
+        if len(frozen):
+            strike, is_put = self.strike[frozen], self.is_put[frozen]
+            intrinsic = self._intrinsic(self.und_price[frozen], strike, is_put)
+            extrinsic = np.nan_to_num(np.maximum(self.mkt_price[frozen] - intrinsic, 0))
+            values[frozen] = self._intrinsic(shocked[frozen], strike[:, None], is_put[:, None]) + extrinsic[:, None]
+            now[frozen] = intrinsic + extrinsic
+        return now, values
+
+    def compute(self):
+        n_scenarios = self.n_scenarios
+        if not len(self.campaigns):
+            self.pnl = np.zeros((0, n_scenarios))
+        else:
+            now, values = self._leg_values()
+            leg_pnl = (values - now[:, None]) * self.quantity[:, None]
+            self.pnl = np.add.reduceat(leg_pnl, self.starts, axis=0)
+
+        self.worst_scenario = np.argmin(self.pnl, axis=1) if len(self.pnl) else np.zeros(0, dtype=np.int64)
+        self.worst_loss = np.maximum(0, -self.pnl.min(axis=1, initial=0))
+        self.margin = np.maximum(0, -self.pnl[:, self.in_margin_range].min(axis=1, initial=0))
+
+        self.book_pnl = self.pnl.sum(axis=0)
+        self.book_worst_loss = float(max(0, -self.book_pnl.min(initial=0)))
+        self.book_margin = float(self.margin.sum())
+        self.book_implied_capital = float(self.worst_loss.sum())
+        return self
+
+    def results(self) -> Dict[int, Dict]:
+        """und_conid -> the risk numbers of its campaign."""
+        return {campaign.und_conid: {'margin': margin, 'implied_capital': worst_loss, 'worst_loss': worst_loss,
+                                     'worst_scenario': self.scenario(scenario)}
+                for campaign, margin, worst_loss, scenario in zip(
+                    self.campaigns, self.margin.tolist(), self.worst_loss.tolist(), self.worst_scenario.tolist())}
+
+    def write_back(self):
+        for campaign, margin, worst_loss in zip(self.campaigns, self.margin.tolist(), self.worst_loss.tolist()):
+            campaign.set_risk(margin=margin, implied_capital=worst_loss, worst_loss=worst_loss)
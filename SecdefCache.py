@@ -0,0 +1,92 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+
+
+class SecdefCache:
+    """
+        Persistent cache of /trsrv/secdef contract definitions keyed by conid.
+        A small in-memory LRU sits in front of an sqlite file. Definitions of options whose
+        expiry has passed are dropped on open and never returned.
+        Pass path=":memory:" for a cache that only lives as long as the process.
+    """
+
+    def __init__(self, path: str = "secdef_cache.sqlite", lru_size: int = 4096):
+        self.path = path
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS secdef ("
+                         "conid INTEGER PRIMARY KEY, expiry TEXT, detail TEXT NOT NULL)")
+        self.purge_expired()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().strftime("%Y%m%d")
+
+    @classmethod
+    def _is_expired(cls, detail: Dict) -> bool:
+        expiry = detail.get('expiry')
+        return expiry is not None and str(expiry) < cls._today()
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute("DELETE FROM secdef WHERE expiry IS NOT NULL AND expiry < ?", (self._today(),))
+            self._db.commit()
+            for conid in [conid for conid, detail in self._lru.items() if self._is_expired(detail)]:
+                del self._lru[conid]
+
+    def _remember(self, conid: int, detail: Dict):
+        self._lru[conid] = detail
+        self._lru.move_to_end(conid)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, conids: Iterable[int]) -> Dict[int, Dict]:
+        """Returns the cached definitions for the given conids, leaving out the ones not cached."""
+        found = {}
+        with self._lock:
+            missing = []
+            for conid in conids:
+                detail = self._lru.get(conid)
+                if detail is None:
+                    missing.append(conid)
+                elif not self._is_expired(detail):
+                    self._lru.move_to_end(conid)
+                    found[conid] = detail
+
+            # sqlite caps the number of bound parameters, so look up in chunks
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self._db.execute(
+                    "SELECT conid, detail FROM secdef WHERE conid IN ({})".format(",".join("?" * len(chunk))),
+                    chunk).fetchall()
+                for conid, text in rows:
+                    detail = json.loads(text)
+                    if not self._is_expired(detail):
+                        self._remember(conid, detail)
+                        found[conid] = detail
+
+        return found
+
+    def put_many(self, details: List[Dict]):
+        with self._lock:
+            rows = []
+            for detail in details:
+                conid = detail['conid']
+                self._remember(conid, detail)
+                expiry = detail.get('expiry')
+                rows.append((conid, str(expiry) if expiry else None, json.dumps(detail)))
+            self._db.executemany("INSERT OR REPLACE INTO secdef (conid, expiry, detail) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
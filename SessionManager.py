@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionManager:
+    """
+        Keeps the brokerage session of an IBClient alive without blocking the caller.
+
+        - A background thread calls `tickle` every keepalive_interval seconds and marks the session
+          invalid when the gateway reports it isn't authenticated any more.
+        - Authentication runs on its own thread: validate_SSO, reauthenticate and brokerage_accounts
+          are retried with exponential backoff until auth status says authenticated.
+        - Requests made while the session is being (re)authenticated are parked until it is valid
+          again, or until authentication gives up. A request answered with 401 marks the session
+          invalid, so re-authentication only happens when it is actually needed.
+
+        The client calls into the manager from _make_request; calls the manager makes itself are
+        recognised by thread and never parked.
+    """
+
+    UNKNOWN = "unknown"
+    AUTHENTICATING = "authenticating"
+    VALID = "valid"
+    FAILED = "failed"
+
+    def __init__(self, client, keepalive_interval: float = 60, backoff: float = 0.5,
+                 max_backoff: float = 30, max_attempts: int = 8):
+        self.client = client
+        self.keepalive_interval = keepalive_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+
+        self.state = self.UNKNOWN
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._local = threading.local()
+        self._keepalive_thread = None
+
+    @property
+    def is_valid(self) -> bool:
+        return self.state == self.VALID
+
+    def in_manager_thread(self) -> bool:
+        return getattr(self._local, 'manager', False)
+
+    def start(self):
+        """Starts authenticating and the keepalive timer, both in the background."""
+        self.invalidate()
+        self._keepalive_thread = threading.Thread(target=self._keepalive, name="ib-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_until_valid(self, timeout: float = None) -> bool:
+        """Parks the caller while the session is being authenticated. Returns whether it is valid."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.state in (self.UNKNOWN, self.AUTHENTICATING) and not self._stopped.is_set():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self.state == self.VALID
+
+    def invalidate(self):
+        """Marks the session invalid and starts re-authenticating, unless that is already under way."""
+        with self._cond:
+            if self.state == self.AUTHENTICATING:
+                return
+            self.state = self.AUTHENTICATING
+        threading.Thread(target=self._authenticate, name="ib-authenticate", daemon=True).start()
+
+    def _set_state(self, state: str):
+        with self._cond:
+            self.state = state
+            self._cond.notify_all()
+
+    def _authenticate(self):
+        self._local.manager = True
+        delay = self.backoff
+        for attempt in range(self.max_attempts):
+            if self._stopped.is_set():
+                break
+
+            try:
+                auth_response = self.client.authentication_status() or {}
+                if auth_response.get('authenticated') is True:
+                    self._set_state(self.VALID)
+                    return
+
+                if auth_response.get('statusCode') == 401 or auth_response.get('connected') is False:
+                    logger.warning("Server isn't connected. Authentication Failed")
+                elif auth_response.get('authenticated') is False:
+                    self.client.validate_SSO()
+                    self.client.reauthenticate()
+                    self.client.brokerage_accounts()
+            except Exception as e:  # e.g. gateway down, counts as a failed attempt and backs off
+                logger.warning("AUTHENTICATION ATTEMPT %s FAILED: %s", attempt + 1, e)
+
+            if self._stopped.wait(delay):
+                break
+            delay = min(delay * 2, self.max_backoff)
+
+        # give up for now and release the parked requests, the next 401 tries again
+        logger.warning("AUTHENTICATION FAILED, SESSION MARKED %s", self.FAILED)
+        self._set_state(self.FAILED)
+
+    def _keepalive(self):
+        self._local.manager = True
+        while not self._stopped.wait(self.keepalive_interval):
+            if self.state != self.VALID:
+                continue
+            try:
+                response = self.client.tickle() or {}
+            except Exception as e:  # a dropped connection must not kill the keepalive thread
+                logger.warning("TICKLE FAILED: %s", e)
+                continue
+            auth_status = response.get('iserver', {}).get('authStatus', {})
+            if auth_status.get('authenticated') is False:
+                logger.warning("SESSION NO LONGER AUTHENTICATED, RE-AUTHENTICATING")
+                self.invalidate()
@@ -0,0 +1,189 @@
+import gspread
+from gspread.utils import rowcol_to_a1
+from oauth2client.service_account import ServiceAccountCredentials
+
+from typing import Dict
+from typing import List
+from PositionExport import export_rows
+
+
+SCOPE = ["https://spreadsheets.google.com/feeds",
+         "https://www.googleapis.com/auth/spreadsheets",
+         "https://www.googleapis.com/auth/drive.file",
+         "https://www.googleapis.com/auth/drive"]
+
+
+class SheetSync:
+    """
+        Keeps the positions worksheet in step with the positions by writing only what changed
+        since the last sync: the cells that differ, the rows of new positions and the rows of
+        closed ones, all in a single batch_update.
+
+            sync = SheetSync()
+            sync.sync(positions)  # the first sync reads the sheet once, later ones only write
+            sync.metrics()
+
+        Every position owns one sheet row. A closed position's row is taken by a new position
+        when there is one, otherwise by the last row of the sheet, and the rows left at the tail
+        are blanked, so the data stays one contiguous block under the header and no rows ever
+        shift. The client and worksheet are opened once; pass `worksheet` to sync into anything
+        with the gspread Worksheet interface, e.g. FakeWorksheet.
+    """
+
+    def __init__(self, spread_sheet_name: str = "Options Tracker", sheet_name: str = "Positions",
+                 creds_path: str = "creds.json", worksheet=None):
+        self.spread_sheet_name = spread_sheet_name
+        self.sheet_name = sheet_name
+        self.creds_path = creds_path
+        self._worksheet = worksheet
+
+        self.headers = None
+        self._rows = None  # conid -> cells last written
+        self._slots = None  # conid -> sheet row number
+        self._stale = {}  # row number -> cells of a row no position owns, blanked or reused on sync
+        self._used = 1  # last sheet row holding a position, the header is row 1
+
+        # metrics
+        self.syncs = 0
+        self.requests = 0
+        self.cells_written = 0
+        self.rows_inserted = 0
+        self.rows_deleted = 0
+        self.rows_updated = 0
+        self.last_cells_written = 0
+
+    @property
+    def worksheet(self):
+        if self._worksheet is None:
+            credential = ServiceAccountCredentials.from_json_keyfile_name(self.creds_path, SCOPE)
+            client = gspread.authorize(credential)
+            self._worksheet = client.open(self.spread_sheet_name).worksheet(self.sheet_name)
+        return self._worksheet
+
+    def reset(self):
+        """Forgets the snapshot, the next sync reads the header and the rows from the sheet again."""
+        self.headers = None
+        self._rows = None
+        self._slots = None
+        self._stale = {}
+        self._used = 1
+
+    def _load(self):
+        values = self.worksheet.get_all_values()
+        self.requests += 1
+        self.headers = values[0] if values else []
+        if "conid" not in self.headers:
+            raise ValueError("sheet {} has no conid column in its header".format(self.sheet_name))
+        conid_col = self.headers.index("conid")
+
+        width = len(self.headers)
+        rows = [(list(row) + [""] * width)[:width] for row in values[1:]]
+        self._rows = {}
+        self._slots = {}
+        self._stale = {}
+        for row_number, row in enumerate(rows, start=2):
+            conid = row[conid_col]
+            if conid and conid not in self._slots:
+                self._rows[conid] = row
+                self._slots[conid] = row_number
+        self._used = max(self._slots.values(), default=1)
+
+        # rows no position owns: free inside the block, blanked past it
+        owned = set(self._slots.values())
+        for row_number, row in enumerate(rows, start=2):
+            if row_number not in owned and (row_number <= self._used or any(row)):
+                self._stale[row_number] = row
+
+    def _cells(self, row_number: int, old: List[str], new: List[str]) -> List[Dict]:
+        """Ranges covering the runs of cells that differ between old and new."""
+        data = []
+        col = 0
+        width = len(new)
+        while col < width:
+            if old is not None and old[col] == new[col]:
+                col += 1
+                continue
+            start = col
+            while col < width and (old is None or old[col] != new[col]):
+                col += 1
+            data.append({'range': "{}:{}".format(rowcol_to_a1(row_number, start + 1), rowcol_to_a1(row_number, col)),
+                         'values': [list(new[start:col])]})
+            self.cells_written += col - start
+            self.last_cells_written += col - start
+        return data
+
+    def sync(self, positions) -> Dict:
+        """Writes the changes since the last sync, returns the metrics of this sync."""
+        if self.headers is None:
+            self._load()
+        self.last_cells_written = 0
+        inserted = deleted = updated = 0
+
+        conid_col = self.headers.index("conid")
+        new_rows = {}
+        for row in export_rows(positions, self.headers):
+            new_rows[row[conid_col]] = list(row)
+
+        data = []
+        blank_row = [""] * len(self.headers)
+        stale = self._stale  # row number -> cells left in a row no position owns
+
+        # closed positions free their rows
+        for conid in [conid for conid in self._slots if conid not in new_rows]:
+            stale[self._slots.pop(conid)] = self._rows.pop(conid)
+            deleted += 1
+        free = sorted(stale)
+
+        # new positions take the free rows first, then go after the last row
+        for conid, row in new_rows.items():
+            old = self._rows.get(conid)
+            if old is None:
+                if free:
+                    row_number = free.pop(0)
+                    old = stale.pop(row_number)
+                else:
+                    self._used += 1
+                    row_number = self._used
+                self._slots[conid] = row_number
+                inserted += 1
+                data.extend(self._cells(row_number, old, row))
+            else:
+                cells = self._cells(self._slots[conid], old, row)
+                updated += 1 if cells else 0
+                data.extend(cells)
+            self._rows[conid] = row
+
+        # fill the rows still free with the last rows of the block, then blank the tail
+        last_rows = sorted(self._slots.items(), key=lambda item: item[1])
+        while free and last_rows and last_rows[-1][1] > free[0]:
+            conid, row_number = last_rows.pop()
+            hole = free.pop(0)
+            data.extend(self._cells(hole, stale.pop(hole), self._rows[conid]))
+            self._slots[conid] = hole
+            stale[row_number] = self._rows[conid]
+        used = max(self._slots.values(), default=1)
+        for row_number in sorted(stale):
+            data.extend(self._cells(row_number, stale.pop(row_number), blank_row))
+        self._used = used
+
+        if data:
+            if self._used > self.worksheet.row_count:
+                self.worksheet.add_rows(self._used - self.worksheet.row_count)
+                self.requests += 1
+            self.worksheet.batch_update(data, value_input_option='USER_ENTERED')
+            self.requests += 1
+
+        self.syncs += 1
+        self.rows_inserted += inserted
+        self.rows_deleted += deleted
+        self.rows_updated += updated
+        return {'cells_written': self.last_cells_written, 'ranges': len(data), 'rows_inserted': inserted,
+                'rows_deleted': deleted, 'rows_updated': updated}
+
+    def metrics(self) -> Dict:
+        return {'syncs': self.syncs,
+                'requests': self.requests,
+                'cells_written': self.cells_written,
+                'rows_inserted': self.rows_inserted,
+                'rows_deleted': self.rows_deleted,
+                'rows_updated': self.rows_updated}
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+
+def unique_conids(conids: Iterable[int]) -> List[int]:
+    """De-duplicates conids, keeping the order they first appear in."""
+    return list(dict.fromkeys(conids))
+
+
+def split_chunks(conids: List[int], chunk_size: int) -> List[List[int]]:
+    return [conids[start:start + chunk_size] for start in range(0, len(conids), chunk_size)]
+
+
+class Price:
+    """
+        A price field from a snapshot. The gateway prefixes the value with "C" when it is the
+        previous close (no trade yet today) and with "H" when trading is halted.
+    """
+
+    def __init__(self, value: float, is_close: bool = False, is_halted: bool = False):
+        self.value = value
+        self.is_close = is_close
+        self.is_halted = is_halted
+
+    @staticmethod
+    def parse(raw):
+        if raw is None or raw == "":
+            return None
+        if not isinstance(raw, str):
+            return Price(float(raw))
+        raw = raw.strip()
+        is_close = raw.startswith("C")
+        is_halted = raw.startswith("H")
+        try:
+            return Price(float(raw.lstrip("CH").replace(",", "")), is_close=is_close, is_halted=is_halted)
+        except ValueError:
+            return None
+
+    def __repr__(self):
+        flag = "C" if self.is_close else "H" if self.is_halted else ""
+        return "Price({}{})".format(flag, self.value)
+
+
+def parse_prices(snapshots: Dict[int, Dict], field: str = '31') -> Dict[int, Price]:
+    """Extracts one price field (31 is the last price) from snapshots, leaving out conids without it."""
+    prices = {}
+    for conid in snapshots.keys():
+        price = Price.parse(snapshots[conid].get(field))
+        if price is not None:
+            prices[conid] = price
+    return prices
+
+
+class SnapshotPoll:
+    """
+        Field-completeness state of one snapshot chunk. Each response is merged per conid, so a
+        field that arrives on any poll is kept, and incomplete() lists only the conids that still
+        need another request.
+    """
+
+    def __init__(self, conids: List[int], fields: List[str]):
+        self.conids = conids
+        self.fields = fields
+        self.snapshots = {}
+        self.polls = 0
+
+    def update(self, content: List[Dict]):
+        self.polls += 1
+        for snapshot in content or []:
+            if 'conid' not in snapshot:
+                continue
+            conid = int(snapshot['conid'])
+            if conid in self.snapshots:
+                self.snapshots[conid].update(snapshot)
+            else:
+                self.snapshots[conid] = dict(snapshot)
+
+    def incomplete(self) -> List[int]:
+        missing = []
+        for conid in self.conids:
+            snapshot = self.snapshots.get(conid)
+            if snapshot is None or any(field not in snapshot for field in self.fields):
+                missing.append(conid)
+        return missing
+
+
+class SnapshotFetcher:
+    """
+        Fetches market data snapshots for a large set of conids. The conids are de-duplicated
+        (many legs share an underlying), split into chunks that stay under the gateway's
+        per-request limit, and the chunks are requested concurrently.
+        Within a chunk only the conids still missing fields are polled again, with exponential
+        backoff between polls, until every field is there or the deadline passes.
+
+            snapshots, missing = SnapshotFetcher(client).fetch(conids)
+            prices = parse_prices(snapshots)
+
+        `snapshots` maps conid -> snapshot dict, `missing` lists the conids that are still
+        without all of the requested fields at the deadline.
+    """
+
+    def __init__(self, client, fields: List[str] = ('31',), chunk_size: int = 100, max_workers: int = 4,
+                 deadline: float = 5.0, backoff: float = 0.1, max_backoff: float = 1.0):
+        self.client = client
+        self.fields = list(fields)
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def _fetch_chunk(self, conids: List[int]) -> SnapshotPoll:
+        poll = SnapshotPoll(conids, self.fields)
+        deadline = time.monotonic() + self.deadline
+        delay = self.backoff
+        pending = conids
+        while True:
+            poll.update(self.client.market_data(pending, fields=self.fields))
+            pending = poll.incomplete()
+            if not pending or time.monotonic() + delay > deadline:
+                return poll
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    def _merge(self, conids: List[int], polls: List[SnapshotPoll]) -> Tuple[Dict[int, Dict], List[int]]:
+        snapshots = {}
+        missing = []
+        for poll in polls:
+            snapshots.update(poll.snapshots)
+            missing.extend(poll.incomplete())
+        return snapshots, missing
+
+    def fetch(self, conids: Iterable[int]) -> Tuple[Dict[int, Dict], List[int]]:
+        conids = unique_conids(conids)
+        chunks = split_chunks(conids, self.chunk_size)
+        if len(chunks) <= 1:
+            polls = [self._fetch_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                polls = list(executor.map(self._fetch_chunk, chunks))
+        return self._merge(conids, polls)
+
+
+class AsyncSnapshotFetcher(SnapshotFetcher):
+    """asyncio counterpart of SnapshotFetcher for AsyncIBClient, at most max_workers chunks in flight."""
+
+    async def _fetch_chunk(self, conids: List[int]) -> SnapshotPoll:
+        poll = SnapshotPoll(conids, self.fields)
+        deadline = time.monotonic() + self.deadline
+        delay = self.backoff
+        pending = conids
+        while True:
+            poll.update(await self.client.market_data(pending, fields=self.fields))
+            pending = poll.incomplete()
+            if not pending or time.monotonic() + delay > deadline:
+                return poll
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    async def fetch(self, conids: Iterable[int]) -> Tuple[Dict[int, Dict], List[int]]:
+        conids = unique_conids(conids)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def fetch_chunk(chunk):
+            async with semaphore:
+                return await self._fetch_chunk(chunk)
+
+        polls = await asyncio.gather(*[fetch_chunk(chunk) for chunk in split_chunks(conids, self.chunk_size)])
+        return self._merge(conids, polls)
@@ -0,0 +1,233 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from typing import Dict
+from typing import List
+from Contract import Contract
+from Position import Position
+from PositionBook import as_integral
+
+
+# column name -> dtype, one append-only file per column
+COLUMNS = {
+    'ts': np.float64,  # epoch seconds of the run
+    'account': np.int32,  # index into meta['accounts']
+    'conid': np.int64,
+    'und_conid': np.int64,
+    'size': np.float64,
+    'avg_price': np.float64,
+    'mkt_price': np.float64,
+    'und_price': np.float64,
+    'dte': np.int64,
+    'intrinsic': np.float64,
+    'extrinsic': np.float64,
+    'ann_extrinsic': np.float64,
+    'target': np.float64,
+}
+NO_DTE = np.iinfo(np.int64).min  # stands for None in the dte column
+
+
+def _float(value) -> float:
+    return np.nan if value is None else value
+
+
+class SnapshotStore:
+    """
+        Append-only history of every run: one row per position with its prices and moneyness,
+        stored column by column in flat files under `path` that are read back as NumPy memmaps,
+        so queries read straight from the page cache without copying or parsing.
+
+            store = SnapshotStore("snapshots")
+            store.append(accounts)  # account_id -> {conid: Position}
+            accounts = store.latest()  # Positions and Contracts as of the last run
+            store.history(conid, start, end)  # column -> array, one entry per run
+
+        Rows of a run are sorted by conid, so a conid is found in each run by binary search and a
+        time range first narrows the runs. meta.json lists the runs and the committed row count;
+        it is replaced atomically after the columns are written, so a crash mid-append leaves
+        the previous runs intact. Contract details live in contracts.jsonl, a log that only gets
+        the new or changed details of each append; details of expired contracts are dropped on
+        load, and the log is rewritten once it holds more dead lines than live ones.
+    """
+
+    def __init__(self, path: str = "snapshots"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = self._read_json("meta.json", {'rows': 0, 'accounts': [], 'runs': []})
+        self.details = self._read_details()
+        self._maps = {}
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_json(self, name: str, default):
+        try:
+            with open(self._file(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def _write_json(self, name: str, content):
+        tmp = self._file(name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp, self._file(name))
+
+    @staticmethod
+    def _expired(detail: Dict, today: str) -> bool:
+        return detail.get('expiry') is not None and detail['expiry'] < today
+
+    def _read_details(self) -> Dict[int, Dict]:
+        """conid -> detail from the log, the last line of a conid wins and expired contracts are left out."""
+        details = {}
+        lines = 0
+        try:
+            with open(self._file("contracts.jsonl")) as f:
+                for line in f:
+                    try:
+                        conid, detail = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    details[conid] = detail
+                    lines += 1
+        except FileNotFoundError:
+            pass
+        today = datetime.now().strftime("%Y%m%d")
+        details = {conid: detail for conid, detail in details.items() if not self._expired(detail, today)}
+        if lines > 2 * len(details):
+            self._rewrite_details(details)
+        return details
+
+    def _rewrite_details(self, details: Dict[int, Dict]):
+        tmp = self._file("contracts.jsonl.tmp")
+        with open(tmp, "w") as f:
+            for conid, detail in details.items():
+                f.write(json.dumps([conid, detail]) + "\n")
+        os.replace(tmp, self._file("contracts.jsonl"))
+
+    """
+        WRITE
+    """
+
+    @staticmethod
+    def _detail(contract) -> Dict:
+        """The contract detail in the shape of a secdef, so Contract.set_detail takes it back."""
+        return {'ticker': contract.ticker, 'assetClass': contract.asset_class, 'currency': contract.currency,
+                'expiry': contract.expiry, 'strike': contract.strike, 'putOrCall': contract.put_or_call,
+                'multiplier': contract.multiplier, 'undConid': contract.und_conid}
+
+    def append(self, accounts: Dict[str, Dict[int, Position]], ts: float = None) -> int:
+        """Appends one run, returns its number."""
+        ts = time.time() if ts is None else ts
+        rows = []
+        changed = {}  # conid -> detail not in the log yet
+        for account_id, positions in accounts.items():
+            if account_id not in self.meta['accounts']:
+                self.meta['accounts'].append(account_id)
+            account = self.meta['accounts'].index(account_id)
+            for pos in positions.values():
+                rows.append((account, pos))
+                detail = self._detail(pos.contract)
+                if self.details.get(pos.contract.conid) != detail:
+                    changed[pos.contract.conid] = detail
+        rows.sort(key=lambda row: row[1].contract.conid)
+
+        columns = {
+            'ts': np.full(len(rows), ts),
+            'account': np.array([account for account, _ in rows], dtype=np.int32),
+            'conid': np.array([pos.contract.conid for _, pos in rows], dtype=np.int64),
+            'und_conid': np.array([pos.contract.und_conid for _, pos in rows], dtype=np.int64),
+            'size': np.array([_float(pos.size) for _, pos in rows], dtype=np.float64),
+            'avg_price': np.array([_float(pos.avg_price) for _, pos in rows], dtype=np.float64),
+            'dte': np.array([NO_DTE if pos.contract.dte is None else pos.contract.dte for _, pos in rows],
+                            dtype=np.int64),
+        }
+        for name in ('mkt_price', 'und_price', 'intrinsic', 'extrinsic', 'ann_extrinsic', 'target'):
+            columns[name] = np.array([_float(getattr(pos.contract, name)) for _, pos in rows], dtype=np.float64)
+
+        start = self.meta['rows']
+        for name, dtype in COLUMNS.items():
+            with open(self._file(name + ".col"), "r+b" if os.path.exists(self._file(name + ".col")) else "wb") as f:
+                # anything past the committed rows is left over from a crashed append
+                f.truncate(start * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(columns[name].astype(dtype, copy=False).tobytes())
+
+        if changed:
+            with open(self._file("contracts.jsonl"), "a") as f:
+                f.write("".join(json.dumps([conid, detail]) + "\n" for conid, detail in changed.items()))
+            self.details.update(changed)
+        run = len(self.meta['runs'])
+        self.meta['runs'].append({'run': run, 'ts': ts, 'start': start, 'end': start + len(rows)})
+        self.meta['rows'] = start + len(rows)
+        self._write_json("meta.json", self.meta)
+        self._maps = {}
+        return run
+
+    """
+        READ
+    """
+
+    def column(self, name: str) -> np.ndarray:
+        """The committed rows of a column, memory-mapped."""
+        if name not in self._maps:
+            rows = self.meta['rows']
+            if rows == 0:
+                return np.empty(0, dtype=COLUMNS[name])
+            self._maps[name] = np.memmap(self._file(name + ".col"), dtype=COLUMNS[name], mode='r', shape=(rows,))
+        return self._maps[name]
+
+    def latest(self) -> Dict[str, Dict[int, Position]]:
+        """Positions and Contracts of the last run, details and moneyness included, per account."""
+        if not self.meta['runs']:
+            return {}
+        run = self.meta['runs'][-1]
+        rows = slice(run['start'], run['end'])
+        columns = {name: self.column(name)[rows].tolist() for name in COLUMNS.keys()}
+        last_update = datetime.fromtimestamp(run['ts']).strftime("%d/%m/%Y %H:%M:%S")
+
+        accounts = {account_id: {} for account_id in self.meta['accounts']}
+        for i, conid in enumerate(columns['conid']):
+            detail = self.details.get(conid)
+            if detail is None:
+                continue  # expired since the run
+            contract = Contract(conid=conid, asset_class=detail['assetClass'], currency=detail['currency'],
+                                mkt_price=_none(columns['mkt_price'][i]), last_update=last_update)
+            contract.set_detail(detail)
+            contract.und_price = _none(columns['und_price'][i])
+            contract.dte = None if columns['dte'][i] == NO_DTE else columns['dte'][i]
+            for name in ('intrinsic', 'extrinsic', 'ann_extrinsic', 'target'):
+                setattr(contract, name, _none(columns[name][i]))
+            size = _none(columns['size'][i])
+            # whole sizes back as int, as the gateway sent them, so close orders don't carry 5.0
+            size = None if size is None else as_integral(size)
+            pos = Position(contract=contract, size=size, avg_price=_none(columns['avg_price'][i]))
+            pos.set_type()
+            accounts[self.meta['accounts'][columns['account'][i]]][conid] = pos
+        return {account_id: positions for account_id, positions in accounts.items() if positions}
+
+    def history(self, conid: int, start: float = None, end: float = None,
+                columns: List[str] = ('ts', 'mkt_price', 'und_price', 'dte', 'extrinsic', 'ann_extrinsic',
+                                      'target')) -> Dict[str, np.ndarray]:
+        """Every row of conid with start <= ts < end, across accounts, as column -> array."""
+        runs = self.meta['runs']
+        run_ts = np.array([run['ts'] for run in runs])
+        first = 0 if start is None else int(np.searchsorted(run_ts, start, side='left'))
+        last = len(runs) if end is None else int(np.searchsorted(run_ts, end, side='left'))
+
+        conids = self.column('conid')
+        rows = []
+        for run in runs[first:last]:
+            lo = run['start'] + int(np.searchsorted(conids[run['start']:run['end']], conid, side='left'))
+            hi = run['start'] + int(np.searchsorted(conids[run['start']:run['end']], conid, side='right'))
+            rows.extend(range(lo, hi))
+        index = np.array(rows, dtype=np.int64)
+        return {name: np.asarray(self.column(name)[index]) for name in columns}
+
+
+def _none(value):
+    return None if value != value else value  # NaN is None
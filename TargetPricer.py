@@ -0,0 +1,182 @@
+import numpy as np
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+
+MAX_DTE = 1100  # lookup tables cover 0..MAX_DTE, longer-dated legs take the last entry
+
+
+class TargetCurve:
+    """
+        Annualized target (the share of the strike per year a short leg is closed at) as a
+        function of dte. The curve is given by (dte, ann_target) points and precomputed into a
+        table indexed by integer dte, linearly interpolated between points, or stepped (each
+        point holds until the next) with interpolate=False. It is flat beyond the first and
+        last points.
+
+            curve = TargetCurve([(0, 0.05), (30, 0.1), (90, 0.15)])
+            curve.ann_target(45), curve.lookup(dte_array)
+    """
+
+    def __init__(self, points: Sequence[Tuple[int, float]], interpolate: bool = True, max_dte: int = MAX_DTE):
+        points = sorted(points)
+        if not points:
+            raise ValueError("a target curve needs at least one (dte, ann_target) point")
+        self.points = points
+        self.interpolate = interpolate
+        dte = np.arange(max_dte + 1)
+        xs = np.array([x for x, _ in points], dtype=np.float64)
+        ys = np.array([y for _, y in points], dtype=np.float64)
+        if interpolate:
+            self.table = np.interp(dte, xs, ys)
+        else:
+            self.table = ys[np.clip(np.searchsorted(xs, dte, side='right') - 1, 0, len(ys) - 1)]
+
+    def ann_target(self, dte: int) -> float:
+        return float(self.table[min(max(dte, 0), len(self.table) - 1)])
+
+    def lookup(self, dte: np.ndarray) -> np.ndarray:
+        return self.table[np.clip(dte, 0, len(self.table) - 1)]
+
+
+class TickRule:
+    """
+        Minimum price increments by price band: `bands` are (from price, tick) pairs, sorted by
+        price. The default is the usual US option rule, 0.01 under 3.00 and 0.05 from 3.00 up;
+        penny-pilot underlyings trade in 0.01 throughout, TickRule([(0, 0.01)]).
+    """
+
+    def __init__(self, bands: Sequence[Tuple[float, float]] = ((0, 0.01), (3, 0.05))):
+        self.bands = sorted(bands)
+        self._starts = np.array([start for start, _ in self.bands], dtype=np.float64)
+        self._ticks = np.array([tick for _, tick in self.bands], dtype=np.float64)
+
+    def ticks(self, prices: np.ndarray) -> np.ndarray:
+        return self._ticks[np.clip(np.searchsorted(self._starts, prices, side='right') - 1, 0, len(self._ticks) - 1)]
+
+    def round_down(self, prices: np.ndarray) -> np.ndarray:
+        """Down to the tick, never below the smallest tick, so a buy limit stays a valid order."""
+        ticks = self.ticks(prices)
+        rounded = np.floor(prices / ticks + 1e-9) * ticks
+        return np.round(np.maximum(rounded, self._ticks[0]), 2)
+
+
+DEFAULT_CURVE = TargetCurve([(0, 0.1)])  # a flat 10% a year
+DEFAULT_TICKS = TickRule()
+
+
+class TargetPricer:
+    """
+        Prices the closing target of every short option leg of a set of campaigns in one pass.
+        The curve of a leg is the one set for its underlying, else for its campaign type, else
+        the default; the tick rule likewise per underlying, else the default.
+
+            pricer = TargetPricer()
+            pricer.set_curve(TargetCurve([(0, 0.05), (60, 0.12)]), campaign_type="SHORT PUT&CALL")
+            pricer.set_curve(TargetCurve([(0, 0.2)]), und_conid=265598)
+            pricer.set_ticks(TickRule([(0, 0.01)]), und_conid=756733)
+            pricer.price(campaigns.values())
+
+        The tables of all curves are stacked into one 2D array, so each leg's annualized target is
+        a single fancy-indexing lookup by (curve, dte). Targets are rounded down to the tick, as
+        they are the limit prices the legs are bought back at.
+    """
+
+    def __init__(self, default: TargetCurve = DEFAULT_CURVE, ticks: TickRule = DEFAULT_TICKS):
+        self.default = default
+        self.ticks = ticks
+        self.curves_by_underlying = {}  # und_conid -> TargetCurve
+        self.curves_by_type = {}  # campaign type -> TargetCurve
+        self.ticks_by_underlying = {}  # und_conid -> TickRule
+        self._stacked = None  # (curves, table) cache, dropped when a curve is set
+
+    def set_curve(self, curve: TargetCurve, und_conid: int = None, campaign_type: str = None):
+        if und_conid is not None:
+            self.curves_by_underlying[und_conid] = curve
+        elif campaign_type is not None:
+            self.curves_by_type[campaign_type] = curve
+        else:
+            self.default = curve
+        self._stacked = None
+
+    def set_ticks(self, ticks: TickRule, und_conid: int = None):
+        if und_conid is not None:
+            self.ticks_by_underlying[und_conid] = ticks
+        else:
+            self.ticks = ticks
+
+    def curve_for(self, und_conid: int, campaign_type: str = None) -> TargetCurve:
+        curve = self.curves_by_underlying.get(und_conid)
+        if curve is None:
+            curve = self.curves_by_type.get(campaign_type, self.default)
+        return curve
+
+    def _stack(self) -> Tuple[Dict[int, int], np.ndarray]:
+        """id(curve) -> row, and every curve's table as one row of a 2D array padded with its last value."""
+        if self._stacked is None:
+            curves = [self.default] + list(self.curves_by_type.values()) + list(self.curves_by_underlying.values())
+            rows = {}
+            for curve in curves:
+                rows.setdefault(id(curve), len(rows))
+            unique = {id(curve): curve for curve in curves}
+            width = max(len(curve.table) for curve in curves)
+            table = np.empty((len(rows), width))
+            for key, row in rows.items():
+                curve_table = unique[key].table
+                table[row, :len(curve_table)] = curve_table
+                table[row, len(curve_table):] = curve_table[-1]
+            self._stacked = (rows, table)
+        return self._stacked
+
+    def targets(self, strike: np.ndarray, dte: np.ndarray, curve_rows: np.ndarray,
+                tick_rules: List[TickRule] = None, tick_rows: np.ndarray = None) -> np.ndarray:
+        """Bulk evaluation: ann_target(curve, dte) * strike * dte / 365, rounded down to the tick."""
+        rows, table = self._stack()
+        ann_target = table[curve_rows, np.clip(dte, 0, table.shape[1] - 1)]
+        raw = ann_target * strike * dte / 365
+        if tick_rules is None or len(tick_rules) == 1:
+            return (tick_rules[0] if tick_rules else self.ticks).round_down(raw)
+        targets = np.empty(len(raw))
+        for i, rule in enumerate(tick_rules):
+            legs = tick_rows == i
+            targets[legs] = rule.round_down(raw[legs])
+        return targets
+
+    def price(self, campaigns: Iterable) -> int:
+        """
+            Sets contract.target on the short option legs of the campaigns that have a dte, and marks
+            it target_priced so later moneyness updates keep it. Returns the legs priced.
+        """
+        rows, _ = self._stack()
+        tick_rules = [self.ticks]
+        tick_index = {id(self.ticks): 0}
+        contracts, strike, dte, curve_rows, tick_rows = [], [], [], [], []
+        for campaign in campaigns:
+            curve_row = rows[id(self.curve_for(campaign.und_conid, campaign.type))]
+            rule = self.ticks_by_underlying.get(campaign.und_conid, self.ticks)
+            if id(rule) not in tick_index:
+                tick_index[id(rule)] = len(tick_rules)
+                tick_rules.append(rule)
+            for pos in campaign.positions.values():
+                contract = pos.contract
+                if pos.size >= 0 or contract.asset_class != "OPT" or contract.dte is None or contract.strike is None:
+                    continue
+                contracts.append(contract)
+                strike.append(contract.strike)
+                dte.append(contract.dte)
+                curve_rows.append(curve_row)
+                tick_rows.append(tick_index[id(rule)])
+        if not contracts:
+            return 0
+
+        targets = self.targets(np.array(strike, dtype=np.float64), np.array(dte, dtype=np.int64),
+                               np.array(curve_rows, dtype=np.int64), tick_rules,
+                               np.array(tick_rows, dtype=np.int64))
+        for contract, target in zip(contracts, targets.tolist()):
+            contract.target = target
+            contract.target_priced = True
+        return len(contracts)
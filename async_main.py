@@ -0,0 +1,102 @@
+import asyncio
+
+from AsyncIBClient import AsyncIBClient
+from Campaign import Campaign
+from Metrics import Metrics
+from OrderReconciler import AsyncOrderReconciler
+from Position import Position
+from PositionPager import AsyncPositionPager
+from RequestScheduler import RequestScheduler
+from SecdefCache import SecdefCache
+from SnapshotFetcher import AsyncSnapshotFetcher
+from main import apply_positions_detail
+from main import apply_positions_mkt_price
+from main import TARGET_PRICER
+from main import get_campaigns
+from main import get_priced_target_orders
+from main import without_conids
+
+import argparse
+from pprint import pprint
+from typing import Dict
+
+
+async def get_account_id(client: AsyncIBClient) -> str:
+    response = await client.portfolio_accounts()
+    account_id = response[0]["accountId"]
+    return account_id
+
+
+async def get_positions(client: AsyncIBClient, account_id) -> Dict[int, Position]:
+    positions = {}
+    async for pos in AsyncPositionPager(client, account_id):
+        positions[pos.contract.conid] = pos
+
+    return positions
+
+
+async def get_positions_with_detail(client: AsyncIBClient, account_id) -> Dict[int, Position]:
+    """Pages the positions in and requests the contract details of each page as soon as it lands."""
+    positions = {}
+    detail_tasks = []
+    async for page in AsyncPositionPager(client, account_id).pages():
+        page_positions = {pos.contract.conid: pos for pos in page}
+        positions.update(page_positions)
+        if page_positions:
+            detail_tasks.append(asyncio.ensure_future(set_positions_detail(client, page_positions)))
+    await asyncio.gather(*detail_tasks)
+
+    return positions
+
+
+async def set_positions_detail(client: AsyncIBClient, positions: Dict[int, Position]):
+    detail_list = await client.contracts_definitions(list(positions.keys()))
+    apply_positions_detail(positions, detail_list)
+
+
+async def update_positions_mkt_price(client: AsyncIBClient, positions: Dict[int, Position]):
+    conids = positions.keys()
+    und_conids = [positions[conid].contract.und_conid for conid in conids]
+    snapshots, missing = await AsyncSnapshotFetcher(client).fetch(und_conids + list(conids))
+    apply_positions_mkt_price(positions, snapshots, missing)
+
+
+async def reconcile_target_orders(client: AsyncIBClient, account_id: str, campaigns: Dict[int, Campaign],
+                                  live_orders: Dict):
+    # underlyings with a target not priced yet keep their live orders as they are
+    target_orders, deferred = get_priced_target_orders(campaigns)
+    if deferred:
+        live_orders = without_conids(live_orders, deferred)
+    # orders that still match are kept, the rest are modified, cancelled or placed concurrently
+    result = await AsyncOrderReconciler(client, account_id).reconcile(target_orders, live_orders)
+    pprint(result)
+    return result
+
+
+async def main(metrics_path: str = None):
+    metrics = Metrics()
+    async with AsyncIBClient(secdef_cache=SecdefCache(), scheduler=RequestScheduler(), metrics=metrics) as client:
+        # live orders don't depend on the account lookup, so fetch them alongside it
+        with metrics.span("positions"):  # secdefs are fetched per page while paging
+            account_id, live_orders = await asyncio.gather(get_account_id(client), client.get_live_orders())
+            positions = await get_positions_with_detail(client, account_id)
+
+        with metrics.span("prices"):
+            await update_positions_mkt_price(client, positions)
+        with metrics.span("campaigns"):
+            campaigns = get_campaigns(positions)
+            # closing targets of the short legs, by the curve of their underlying or campaign type
+            TARGET_PRICER.price(campaigns.values())
+
+        with metrics.span("orders"):
+            await reconcile_target_orders(client, account_id, campaigns, live_orders)
+
+    if metrics_path:
+        with open(metrics_path, "w") as f:
+            f.write(metrics.to_json())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metrics', metavar='PATH', help="write the request and phase metrics of the run as json")
+    asyncio.run(main(metrics_path=parser.parse_args().metrics))
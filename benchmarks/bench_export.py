@@ -0,0 +1,59 @@
+"""
+    Export of the sheet rows: to_json_dict per Position plus a str() per cell, as
+    write_google_sheet used to do, against export_rows over the rows of a PositionBook.
+
+    Run from the repository root:
+        python -m benchmarks.bench_export [n_positions ...]
+"""
+import sys
+import time
+
+from PositionBook import PositionBook
+from PositionExport import export_rows
+from benchmarks.bench_memory import build_objects
+
+HEADER = ["lastUpdate", "conid", "ticker", "undConid", "expiry", "putOrCall", "strike", "multiplier", "currency",
+          "mktPrice", "undPrice", "size", "avgPrice", "dte", "extrinsic", "intrinsic", "ann_extrinsic", "target",
+          "notes"]
+
+
+def per_position_rows(positions, header):
+    rows = []
+    for pos in positions.values():
+        pos_json_dict = pos.to_json_dict(header)
+        rows.append([str(pos_json_dict[h]) if h in pos_json_dict else "" for h in header])
+    return rows
+
+
+def _cell(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000]
+    for n in sizes:
+        objects = build_objects(n)
+        book = PositionBook.from_positions(objects.values())
+        views = book.to_dict()
+
+        expected, per_position = timed(per_position_rows, objects, HEADER)
+        _, objects_bulk = timed(export_rows, objects, HEADER)
+        rows, book_bulk = timed(export_rows, views, HEADER)
+        # the book keeps numbers in float columns, so "-5" comes out as "-5.0"
+        assert [list(map(_cell, row)) for row in rows] == [list(map(_cell, row)) for row in expected]
+
+        print("{:>7} rows: to_json_dict {:7.1f}ms  export_rows(objects) {:7.1f}ms  export_rows(book) {:7.1f}ms".format(
+            n, per_position * 1000, objects_bulk * 1000, book_bulk * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+    Solves implied volatility and greeks for a synthetic book with GreeksBook, at 10k and 100k
+    legs. Option prices are generated from Black-Scholes with a known vol per leg, which the solver
+    must recover. Reports a cold solve, a refresh with nothing moved (all cache hits) and a refresh
+    with 10% of the legs repriced.
+
+    Run from the repository root:
+        python -m benchmarks.bench_greeks [n_legs ...]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from GreeksBook import GreeksBook
+from GreeksBook import bs_price
+from MoneynessBook import MoneynessBook
+from benchmarks.bench_moneyness import make_contracts
+
+
+def price_contracts(contracts, rng):
+    MoneynessBook(contracts).compute().write_back()  # sets dte
+    vols = np.array([rng.uniform(0.1, 1.0) for _ in contracts])
+    is_put = np.array([c.put_or_call == "P" for c in contracts])
+    und_price = np.array([c.und_price for c in contracts])
+    strike = np.array([c.strike for c in contracts])
+    t = (np.array([c.dte for c in contracts], dtype=np.float64) + 1) / 365
+    prices = bs_price(is_put, und_price, strike, t, 0.0, vols)
+    for contract, price in zip(contracts, prices.tolist()):
+        contract.mkt_price = price
+    return vols
+
+
+def bench(n_legs):
+    rng = random.Random(1)
+    contracts = make_contracts(n_legs)
+    vols = price_contracts(contracts, rng)
+    cache = {}
+
+    start = time.perf_counter()
+    book = GreeksBook(contracts, cache=cache).compute()
+    book.write_back()
+    cold = time.perf_counter() - start
+
+    solved = np.array([np.nan if c.iv is None else c.iv for c in contracts])
+    ok = ~np.isnan(solved)  # far out-of-the-money legs price below what a float can tell apart
+    error = np.max(np.abs(solved[ok] - vols[ok]))
+    assert ok.mean() > 0.95 and error < 1e-3, (ok.mean(), error)
+
+    start = time.perf_counter()
+    GreeksBook(contracts, cache=cache).compute().write_back()
+    warm = time.perf_counter() - start
+
+    for contract in rng.sample(contracts, n_legs // 10):
+        contract.mkt_price *= 1.01
+    start = time.perf_counter()
+    moved = GreeksBook(contracts, cache=cache).compute()
+    moved.write_back()
+    partial = time.perf_counter() - start
+
+    print("{:>7} legs  cold {:7.1f} ms ({:>9,.0f} legs/s, {:.1%} solved, max iv error {:.1e}) | "
+          "unchanged {:6.1f} ms | 10% moved {:6.1f} ms ({} solved)".format(
+              n_legs, cold * 1e3, n_legs / cold, ok.mean(), error, warm * 1e3, partial * 1e3, moved.solved))
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000]
+    for n_legs in sizes:
+        bench(n_legs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+    Bytes per position for slotted Position/Contract objects against the column-wise PositionBook.
+
+    Run from the repository root:
+        python -m benchmarks.bench_memory [n_positions ...]
+"""
+import gc
+import random
+import sys
+import tracemalloc
+
+from Position import Position
+from PositionBook import PositionBook
+
+
+def make_position_json(n):
+    rng = random.Random(0)
+    expiries = ['2099{:02d}15'.format(month) for month in range(1, 13)]
+    for i in range(n):
+        pos_json = {'conid': 1000000 + i, 'assetClass': 'OPT', 'currency': 'USD',
+                    'mktPrice': rng.uniform(0.5, 10), 'position': -rng.randint(1, 10), 'avgPrice': rng.uniform(0.5, 10)}
+        detail = {'ticker': 'T{}'.format(i % 200), 'expiry': rng.choice(expiries), 'strike': float(rng.randint(50, 150)),
+                  'putOrCall': rng.choice('PC'), 'multiplier': '100', 'undConid': i % 200 + 1}
+        yield pos_json, detail
+
+
+def build_objects(n):
+    positions = {}
+    for pos_json, detail in make_position_json(n):
+        pos = Position.parse_json_dict(pos_json)
+        pos.contract.set_detail(detail)
+        pos.contract.set_prices(pos.contract.mkt_price, 100.0)
+        pos.set_type()
+        positions[pos.contract.conid] = pos
+    return positions
+
+
+def build_book(n):
+    book = PositionBook()
+    for pos_json, detail in make_position_json(n):
+        pos = Position.parse_json_dict(pos_json)
+        pos.contract.set_detail(detail)
+        pos.contract.set_prices(pos.contract.mkt_price, 100.0)
+        pos.set_type()
+        book.add(pos)  # the Position is dropped right after being copied in
+    return book
+
+
+def measure(build, n):
+    gc.collect()
+    tracemalloc.start()
+    result = build(n)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / n
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000]
+    for n in sizes:
+        print("{:>8} positions  objects {:7.0f} B/position | PositionBook {:7.0f} B/position"
+              .format(n, measure(build_objects, n), measure(build_book, n)))
+
+
+if __name__ == '__main__':
+    main()
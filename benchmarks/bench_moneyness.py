@@ -0,0 +1,63 @@
+"""
+    Compares the per-Contract moneyness path (Contract._set_moneyness for every leg) against the
+    vectorized MoneynessBook, at 10k and 100k legs.
+
+    Run from the repository root:
+        python -m benchmarks.bench_moneyness [n_legs ...]
+"""
+import random
+import sys
+import time
+
+from Contract import Contract
+from MoneynessBook import MoneynessBook
+
+
+def make_contracts(n_legs):
+    rng = random.Random(0)
+    expiries = ['2099{:02d}{:02d}'.format(month, 15) for month in range(1, 13)]
+    contracts = []
+    for i in range(n_legs):
+        contract = Contract(conid=i, asset_class="OPT", currency="USD", mkt_price=None)
+        contract.set_detail({'ticker': 'T', 'expiry': rng.choice(expiries), 'strike': float(rng.randint(50, 150)),
+                             'putOrCall': rng.choice('PC'), 'multiplier': 100, 'undConid': 1})
+        contract.mkt_price = rng.uniform(0.5, 10)
+        contract.und_price = rng.uniform(50, 150)
+        contracts.append(contract)
+    return contracts
+
+
+def bench(n_legs):
+    contracts = make_contracts(n_legs)
+
+    start = time.perf_counter()
+    for contract in contracts:
+        contract._set_moneyness()
+    per_object = time.perf_counter() - start
+    expected = [c.target for c in contracts]
+
+    start = time.perf_counter()
+    book = MoneynessBook(contracts)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    book.compute()
+    compute = time.perf_counter() - start
+
+    start = time.perf_counter()
+    book.write_back()
+    write_back = time.perf_counter() - start
+    assert [c.target for c in contracts] == expected
+
+    print("{:>7} legs  per-object {:8.1f} ms | book build {:7.1f} ms  compute {:6.2f} ms  write back {:7.1f} ms"
+          .format(n_legs, per_object * 1e3, build * 1e3, compute * 1e3, write_back * 1e3))
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000]
+    for n_legs in sizes:
+        bench(n_legs)
+
+
+if __name__ == '__main__':
+    main()
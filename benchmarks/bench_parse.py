@@ -0,0 +1,67 @@
+"""
+    Decoding and parsing of recorded position pages: stdlib json plus a Position per row (with a
+    timestamp per row, as before) against the fast path, orjson when installed and rows loaded
+    straight into a PositionBook with one timestamp per page.
+
+    Run from the repository root:
+        python -m benchmarks.bench_parse [n_positions ...]
+"""
+import json
+import sys
+import time
+
+from Contract import Contract
+from GatewaySimulator import SyntheticPortfolio
+from IBClient import json_loads
+from Position import Position
+from PositionBook import PositionBook
+from PositionPager import valid_rows
+
+PAGE_SIZE = 30
+
+
+def record_pages(n):
+    rows = SyntheticPortfolio(n).positions['U1000000']
+    return [json.dumps(rows[start:start + PAGE_SIZE]).encode() for start in range(0, len(rows), PAGE_SIZE)]
+
+
+def parse_objects(pages):
+    positions = {}
+    for payload in pages:
+        for pos_json in json.loads(payload):
+            pos = Position.parse_json_dict(pos_json)
+            if pos is not None:
+                positions[pos.contract.conid] = pos
+    return positions
+
+
+def parse_book(pages):
+    book = PositionBook()
+    for payload in pages:
+        book.add_json_rows(valid_rows(json_loads(payload)), Contract._date_and_time())
+    return book
+
+
+def best_of(fn, pages, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(pages)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print("decoder: {}".format(json_loads.__module__ or json_loads))
+    for n in sizes:
+        pages = record_pages(n)
+        megabytes = sum(len(page) for page in pages) / 1e6
+        before = best_of(parse_objects, pages)
+        after = best_of(parse_book, pages)
+        print("{:>7} positions ({:.1f} MB): objects {:7.3f}s  book {:7.3f}s  speedup {:5.2f}x".format(
+            n, megabytes, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
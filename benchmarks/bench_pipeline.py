@@ -0,0 +1,62 @@
+"""
+    Runs the main.main() pipeline end to end against the local GatewaySimulator at 10, 1k and 10k
+    legs and reports the time spent in each phase, plus request counts by endpoint.
+
+    Run from the repository root:
+        python -m benchmarks.bench_pipeline [n_legs ...] [--latency SECONDS] [--paced] [--accounts N]
+
+    --paced puts the RequestScheduler in front of the client, as main.main() does against a real
+    gateway, and has the simulator enforce the same global rate limit. --accounts runs that many
+    sub-accounts, each holding every leg.
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import main as pipeline
+from GatewaySimulator import GatewaySimulator
+from GatewaySimulator import SyntheticPortfolio
+from IBClient import IBClient
+from Metrics import Metrics
+from RequestScheduler import RequestScheduler
+from SecdefCache import SecdefCache
+
+PHASES = ("accounts", "positions", "secdefs", "prices", "campaigns", "orders")
+
+
+def bench(n_legs, latency, paced, n_accounts=1):
+    accounts = ['U{}'.format(1000000 + i) for i in range(n_accounts)]
+    portfolio = SyntheticPortfolio(n_legs, accounts=accounts, shared_legs=True)
+    sim = GatewaySimulator(portfolio, latency=latency, rate_limit=10 if paced else None).start()
+    metrics = Metrics()
+    client = IBClient(base_url=sim.base_url, secdef_cache=SecdefCache(path=":memory:"),
+                      scheduler=RequestScheduler() if paced else None, metrics=metrics)
+    client.session_manager.wait_until_valid(5)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the pipeline pprints every order
+        pipeline.main(client=client, metrics=metrics, metrics_path=None)
+    total = time.perf_counter() - start
+
+    client.close()
+    sim.stop()
+
+    data = metrics.to_dict()
+    print("{:>6} legs x {} accounts  total {:8.3f}s  requests {:6}  rejected {}".format(
+        n_legs, n_accounts, total, sim.requests, sim.rejected))
+    for phase in PHASES:
+        print("    {:<10} {:8.3f}s".format(phase, data['spans'].get(phase, {}).get('seconds', 0.0)))
+    for e in data['endpoints']:
+        print("    {:>6} x {:<6} {}".format(e['count'], e['method'], e['endpoint']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('legs', type=int, nargs='*', default=[10, 1000, 10000])
+    parser.add_argument('--latency', type=float, default=0.002)
+    parser.add_argument('--paced', action='store_true')
+    parser.add_argument('--accounts', type=int, default=1)
+    args = parser.parse_args()
+    for n_legs in args.legs:
+        bench(n_legs, args.latency, args.paced, args.accounts)
@@ -0,0 +1,51 @@
+"""
+    Compares requests/sec of the old per-call `requests.get` transport against the pooled
+    keep-alive session owned by IBClient, using the local GatewaySimulator.
+
+    Run from the repository root:
+        python -m benchmarks.bench_session [n_requests]
+"""
+import sys
+import time
+
+import requests
+
+from GatewaySimulator import GatewaySimulator
+from GatewaySimulator import SyntheticPortfolio
+from IBClient import IBClient
+
+
+def bench_per_call(base_url, n):
+    url = base_url + 'portfolio/U1/positions/0'
+    start = time.perf_counter()
+    for _ in range(n):
+        requests.get(url, headers={'Content-Type': 'application/json'}, verify=False).json()
+    return n / (time.perf_counter() - start)
+
+
+def bench_pooled(base_url, n):
+    client = IBClient(base_url=base_url)
+    start = time.perf_counter()
+    for _ in range(n):
+        client.portfolio_account_positions(account_id='U1', page_id=0)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return n / elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sim = GatewaySimulator(SyntheticPortfolio(1, accounts=['U1'])).start()
+    base_url = sim.base_url
+
+    before = bench_per_call(base_url, n)
+    after = bench_pooled(base_url, n)
+    print("requests per call : {:8.1f} req/s".format(before))
+    print("pooled session    : {:8.1f} req/s".format(after))
+    print("speedup           : {:8.2f}x".format(after / before))
+    print("(plain HTTP on loopback; against the real TLS gateway the handshake saved per call is larger)")
+    sim.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+    Cells written per sync by SheetSync against a FakeWorksheet, over a run of syncs where a few
+    positions open, close and reprice between syncs, next to what clear + append writes every time.
+    Each sync is checked against the positions it was given.
+
+    Run from the repository root:
+        python -m benchmarks.bench_sheet [n_positions] [n_syncs]
+"""
+import random
+import sys
+
+from FakeWorksheet import FakeWorksheet
+from PositionExport import export_rows
+from SheetSync import SheetSync
+from benchmarks.bench_memory import build_objects
+
+HEADER = ["lastUpdate", "conid", "ticker", "undConid", "expiry", "putOrCall", "strike", "multiplier", "currency",
+          "mktPrice", "undPrice", "size", "avgPrice", "dte", "extrinsic", "intrinsic", "ann_extrinsic", "target"]
+
+
+def check(sheet, positions):
+    body = [tuple((row + [""] * len(HEADER))[:len(HEADER)]) for row in sheet.get_all_values()[1:]]
+    assert all(any(row) for row in body), "gap in the data block"
+    assert sorted(body) == sorted(tuple(row) for row in export_rows(positions, HEADER)), "sheet out of sync"
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_syncs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = random.Random(0)
+    pool = build_objects(n * 2)
+    conids = list(pool)
+    positions = {conid: pool[conid] for conid in conids[:n]}
+
+    sheet = FakeWorksheet([HEADER])
+    sync = SheetSync(worksheet=sheet)
+    full = 0
+    for i in range(n_syncs):
+        if i:
+            for conid in rng.sample(list(positions), n // 100):
+                del positions[conid]
+            for conid in rng.sample(conids, n // 100):
+                positions.setdefault(conid, pool[conid])
+            for conid in rng.sample(list(positions), n // 20):
+                positions[conid].contract.mkt_price = round(rng.uniform(0.5, 10), 2)
+        stats = sync.sync(positions)
+        check(sheet, positions)
+        full += (len(positions) + 1) * len(HEADER)  # clear + header + every row
+        print("sync {:>3}: {:>6} cells in {:>5} ranges, +{} -{} ~{} rows".format(
+            i, stats['cells_written'], stats['ranges'], stats['rows_inserted'], stats['rows_deleted'],
+            stats['rows_updated']))
+
+    print("incremental: {} cells in {} requests".format(sync.cells_written, sync.requests))
+    print("clear+append: {} cells in {} requests".format(full, n_syncs * 4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+    Measures how many ticks/sec MarketDataStream can absorb into Contracts. A local stand-in for the
+    gateway websocket replays recorded ticks (a JSONL file of smd messages, or synthetic ones) to the
+    conids the stream subscribed to, and drops the connection once halfway to exercise reconnects.
+
+    Run from the repository root:
+        python -m benchmarks.bench_stream [n_legs] [n_ticks] [recorded_ticks.jsonl]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+
+from aiohttp import web
+
+from Contract import Contract
+from MarketDataStream import MarketDataStream
+from Position import Position
+
+
+def make_positions(n_legs, n_underlyings=50):
+    positions = {}
+    for i in range(n_legs):
+        conid = 1000000 + i
+        contract = Contract(conid=conid, asset_class="OPT", currency="USD", mkt_price=1.0)
+        contract.set_detail({'ticker': 'T{}'.format(i % n_underlyings),
+                             'expiry': '20991217',
+                             'strike': 100.0 + i % 20,
+                             'putOrCall': 'P' if i % 2 else 'C',
+                             'multiplier': 100,
+                             'undConid': i % n_underlyings + 1})
+        positions[conid] = Position(contract=contract, size=-1, avg_price=1.0)
+    return positions
+
+
+def synthetic_ticks(conids, n_ticks):
+    rng = random.Random(0)
+    return [{'topic': 'smd+{}'.format(conid), 'conid': conid, '31': "{:.2f}".format(rng.uniform(1, 200))}
+            for conid in (rng.choice(conids) for _ in range(n_ticks))]
+
+
+def load_ticks(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class StandInWebsocket:
+    def __init__(self, ticks):
+        self.ticks = ticks
+        self.sent = 0
+        self.delivered = 0
+        self.started = None
+        self.dropped = False
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subscribed = set()
+        # start replaying once the subscriptions stop arriving
+        while True:
+            try:
+                msg = await asyncio.wait_for(ws.receive(), timeout=0.2 if subscribed else None)
+            except asyncio.TimeoutError:
+                break
+            if msg.type != web.WSMsgType.TEXT:
+                return ws
+            if msg.data.startswith('smd+'):
+                subscribed.add(int(msg.data.split('+')[1]))
+            elif msg.data.startswith('umd+'):
+                subscribed.discard(int(msg.data.split('+')[1]))
+        if self.started is None:
+            self.started = time.perf_counter()
+        while self.sent < len(self.ticks):
+            if not self.dropped and self.sent >= len(self.ticks) // 2:
+                self.dropped = True
+                await ws.close()
+                return ws
+            tick = self.ticks[self.sent]
+            if tick['conid'] in subscribed:
+                await ws.send_str(json.dumps(tick))
+                self.delivered += 1
+            self.sent += 1
+        await ws.close()
+        return ws
+
+
+async def bench(n_legs, n_ticks, path=None):
+    positions = make_positions(n_legs)
+    stream = MarketDataStream(reconnect_backoff=0.01)
+    stream.track_positions(positions)
+    conids = sorted(stream._wanted)
+    ticks = load_ticks(path) if path else synthetic_ticks(conids, n_ticks)
+
+    server = StandInWebsocket(ticks)
+    app = web.Application()
+    app.router.add_get('/v1/api/ws', server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    stream.url = "http://127.0.0.1:{}/v1/api/ws".format(port)
+
+    task = asyncio.ensure_future(stream.run())
+    while server.sent < len(ticks) or stream.ticks_received < server.delivered:
+        await asyncio.sleep(0.001)
+    while stream._pending:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - server.started
+    await stream.stop()
+    await task
+    await runner.cleanup()
+
+    print("legs {:>8}  subscriptions {:>8}".format(n_legs, len(conids)))
+    print("ticks received  {:>10}  ({:10.0f} ticks/s)".format(stream.ticks_received, stream.ticks_received / elapsed))
+    print("ticks applied   {:>10}  ({:10.0f} ticks/s)".format(stream.ticks_applied, stream.ticks_applied / elapsed))
+    print("ticks conflated {:>10}".format(stream.ticks_conflated))
+    print("reconnects      {:>10}".format(stream.reconnects))
+
+
+def main():
+    n_legs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    path = sys.argv[3] if len(sys.argv) > 3 else None
+    asyncio.run(bench(n_legs, n_ticks, path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+    Prices the closing target of every short leg of a large book with TargetPricer, at 10k and
+    100k legs. Curves are set per campaign type and for a slice of the underlyings, with a
+    penny tick rule on some of them. Compares against pricing leg by leg (curve_for, ann_target,
+    round to the tick per contract) and checks both agree.
+
+    Run from the repository root:
+        python -m benchmarks.bench_targets [n_legs ...]
+"""
+import math
+import sys
+import time
+
+import numpy as np
+
+from TargetPricer import TargetCurve
+from TargetPricer import TargetPricer
+from TargetPricer import TickRule
+from benchmarks.bench_risk import make_campaigns
+
+
+def make_pricer(campaigns):
+    pricer = TargetPricer()
+    pricer.set_curve(TargetCurve([(0, 0.05), (30, 0.1), (90, 0.15), (365, 0.2)]), campaign_type="SHORT PUT")
+    pricer.set_curve(TargetCurve([(0, 0.08), (45, 0.12)], interpolate=False), campaign_type="SHORT PUT&CALL")
+    penny = TickRule([(0, 0.01)])
+    for campaign in campaigns[::50]:
+        pricer.set_curve(TargetCurve([(0, 0.3)]), und_conid=campaign.und_conid)
+        pricer.set_ticks(penny, und_conid=campaign.und_conid)
+    return pricer
+
+
+def per_leg(pricer, campaigns):
+    targets = {}
+    for campaign in campaigns:
+        curve = pricer.curve_for(campaign.und_conid, campaign.type)
+        rule = pricer.ticks_by_underlying.get(campaign.und_conid, pricer.ticks)
+        for pos in campaign.positions.values():
+            contract = pos.contract
+            if pos.size >= 0:
+                continue
+            raw = curve.ann_target(contract.dte) * contract.strike * contract.dte / 365
+            tick = next(tick for start, tick in reversed(rule.bands) if raw >= start) if raw >= rule.bands[0][0] \
+                else rule.bands[0][1]
+            targets[contract.conid] = round(max(math.floor(raw / tick + 1e-9) * tick, rule.bands[0][1]), 2)
+    return targets
+
+
+def bench(n_legs):
+    campaigns, contracts = make_campaigns(n_legs)
+    pricer = make_pricer(campaigns)
+
+    start = time.perf_counter()
+    expected = per_leg(pricer, campaigns)
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    priced = pricer.price(campaigns)
+    bulk = time.perf_counter() - start
+
+    got = {c.conid: c.target for c in contracts if c.conid in expected}
+    assert priced == len(expected) and np.allclose([got[k] for k in expected], list(expected.values()))
+    print("{:>7} legs, {:>6} short  per leg {:7.1f} ms | bulk {:6.1f} ms".format(
+        len(contracts), priced, scalar * 1e3, bulk * 1e3))
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000]
+    for n_legs in sizes:
+        bench(n_legs)
+
+
+if __name__ == '__main__':
+    main()
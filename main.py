@@ -1,11 +1,30 @@
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from IBClient import IBClient
+from MarketDataStream import MarketDataStream
 from Position import Position
+from PositionPager import PositionPager
 from Campaign import Campaign
-
+from GreeksBook import GreeksBook
+from Metrics import Metrics
+from MoneynessBook import MoneynessBook
+from OrderReconciler import OrderReconciler
+from PortfolioDaemon import PortfolioDaemon
+from RequestScheduler import RequestScheduler
+from RiskGrid import RiskGrid
+from SecdefCache import SecdefCache
+from SheetSync import SheetSync
+from SnapshotFetcher import SnapshotFetcher
+from SnapshotFetcher import parse_prices
+from SnapshotStore import SnapshotStore
+from TargetPricer import TargetPricer
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
+from urllib.parse import urlparse
 from typing import Dict
+from typing import List
+from typing import Set
+from typing import Tuple
 
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
@@ -15,6 +34,10 @@ urllib3.disable_warnings(category=InsecureRequestWarning)
 def set_positions_detail(client, positions: Dict[int, Position]):
     conids = positions.keys()
     detail_list = client.contracts_definitions(list(conids))
+    apply_positions_detail(positions, detail_list)
+
+
+def apply_positions_detail(positions: Dict[int, Position], detail_list: List[Dict]):
     detail_dict = {}
     for detail in detail_list:
         detail_dict[detail['conid']] = detail
@@ -28,16 +51,23 @@ def set_positions_detail(client, positions: Dict[int, Position]):
 def update_positions_mkt_price(client, positions: Dict[int, Position]):
     conids = positions.keys()
     und_conids = [positions[conid].contract.und_conid for conid in conids]
-    all_conids = und_conids + list(conids)
-    prices_list = client.market_data(all_conids)
-    prices_dict = {}
-    for json in prices_list:
-        price = float(json['31'].strip("C")) # 31 is the last price in ib api
-        prices_dict[json["conid"]] = price
+    snapshots, missing = SnapshotFetcher(client).fetch(und_conids + list(conids))
+    apply_positions_mkt_price(positions, snapshots, missing)
+
+
+def apply_positions_mkt_price(positions: Dict[int, Position], snapshots: Dict[int, Dict], missing: List[int]):
+    if missing:
+        print("NO MARKET DATA FOR CONIDS: {}".format(missing))
+    prices_dict = parse_prices(snapshots, '31')  # 31 is the last price in ib api
     for conid in positions.keys():
         contract = positions[conid].contract
-        contract.set_mkt_price(prices_dict[contract.conid])
-        contract.set_und_price(prices_dict[contract.und_conid])
+        mkt_price = prices_dict[contract.conid].value if contract.conid in prices_dict else contract.mkt_price
+        und_price = prices_dict[contract.und_conid].value if contract.und_conid in prices_dict else contract.und_price
+        contract.set_prices(mkt_price, und_price, update_moneyness=False)
+    # moneyness, then greeks, for the whole book in one pass each
+    contracts = [positions[conid].contract for conid in positions.keys()]
+    MoneynessBook(contracts).compute().write_back()
+    GreeksBook(contracts).compute().write_back()
 
 
 def get_campaigns(positions: Dict[int, Position]) -> Dict[int, Campaign]:
@@ -61,127 +91,202 @@ def get_account_id(client: IBClient) -> str:
     return account_id
 
 
+def get_account_ids(client: IBClient) -> List[str]:
+    """Every account the session can see, the subaccounts of a tiered structure included."""
+    account_ids = []
+    for response in (client.portfolio_accounts(), client.portfolio_subaccounts()):
+        if not isinstance(response, list):  # subaccounts answers with an error outside tiered structures
+            continue
+        for account in response:
+            account_id = account.get("accountId") or account.get("id")
+            if account_id and account_id not in account_ids:
+                account_ids.append(account_id)
+    return account_ids
+
+
 def get_positions(client: IBClient, account_id) -> Dict[int, Position]:
-    page_id = 0
-    positions = {}
-    while True:
-        response = client.portfolio_account_positions(account_id=account_id, page_id=page_id)
-        for pos_json in response:
-            pos = Position.parse_json_dict(pos_json)
-            if pos is not None:
-                positions[pos.contract.conid] = pos
-        if len(response) == 30:
-            page_id += 1
-        else:
-            break
-
-    return positions
-
-
-def write_google_sheet(positions: Dict[int, Position]):
-    spread_sheet_name = "Options Tracker"
-    sheet_name = "Positions"
-    scope = ["https://spreadsheets.google.com/feeds",
-             "https://www.googleapis.com/auth/spreadsheets",
-             "https://www.googleapis.com/auth/drive.file",
-             "https://www.googleapis.com/auth/drive"]
-    credential = ServiceAccountCredentials.from_json_keyfile_name("creds.json", scope)
-    client = gspread.authorize(credential)
-    spreadsheet = client.open(spread_sheet_name)
-    sheet = spreadsheet.worksheet(sheet_name)
-    headers = sheet.row_values(1)
-    sheet.clear()
-    sheet.append_row(headers)
-    rows = []
-    for conid in positions.keys():
-        pos = positions[conid]
-        pos_json_dict = pos.to_json_dict(headers)
-        row = []
-        for h in headers:
-            value = str(pos_json_dict[h]) if h in pos_json_dict.keys() else ""
-            row.append(value)
-        rows.append(row)
-    spreadsheet.values_append(sheet_name, {'valueInputOption': 'USER_ENTERED'}, {'values': rows})
-
-
-def clear_orders(client, account_id: str):
-    orders = client.get_live_orders()
-    for order in orders["orders"]:
-        if order["status"] not in {"Cancelled", "Inactive"}:
-            order_id = order["orderId"]
-            response = client.delete_order(account_id=account_id, order_id=order_id)
-
-
-def place_order_with_confirm(client, account_id, order):
-    # look if order_ref is occupied.
-    # order_ref = order['cOID']
-    # occupied = False
-    # orders = client.get_live_orders()
-    # for live_order in orders["orders"]:
-    #     if live_order["order_ref"] == order_ref:
-    #         occupied = True
-    #         print(live_order)
-    #         live_order_id = live_order['orderId']
-    #         client.delete_order(account_id, live_order_id)
-    #         break
-    #
-    # # if order_ref is occupied, use the order_id to modify order, otherwise place a new order
-    # if occupied:
-    #     content = client.modify_order(account_id=account_id, local_order_id=order_ref, order=order)
-    # else:
-    #     content = client.place_order(account_id=account_id, order=order)
-    #
-    # if content is None:
-    #     print(occupied)
-
-    content = client.place_order(account_id=account_id, order=order)
-    while True:
-        question = content[0]  # TODO: add check
-        if 'id' in question:
-            reply_id = question['id']
-            content = client.place_order_reply(reply_id, True)
-        else:
-            break
-    return content
-
-
-def clear_and_place_target_orders(client, account_id: str, campaigns: Dict[int, Campaign]):
-    clear_orders(client, account_id)
-    target_orders = []
-    for und_conid in campaigns.keys():
-        camp = campaigns[und_conid]
-        target_orders.extend(camp.get_target_orders())
+    # rows of a PositionBook, which take Position's place everywhere downstream
+    return PositionPager(client, account_id).book().to_dict()
 
-    for order in target_orders:
-        response = place_order_with_confirm(client, account_id, order)
-        pprint(response)
 
-    #orders = client.get_live_orders()
-    #pprint(orders["orders"])
+# opened on the first write and reused by every write after it
+SHEET_SYNC = SheetSync(spread_sheet_name="Options Tracker", sheet_name="Positions", creds_path="creds.json")
 
 
-def main():
-    client = IBClient()
+def write_google_sheet(positions: Dict[int, Position], sheet_sync: SheetSync = None) -> Dict:
+    sheet_sync = SHEET_SYNC if sheet_sync is None else sheet_sync
+    return sheet_sync.sync(positions)
 
-    account_id = get_account_id(client)
-    positions = get_positions(client, account_id)
 
-    set_positions_detail(client, positions)
-    update_positions_mkt_price(client, positions)
-    campaigns = get_campaigns(positions)
+# curves per underlying or campaign type are set on it, see TargetPricer
+TARGET_PRICER = TargetPricer()
 
-    # clear_orders(client, account_id)
-    # orders = client.get_live_orders()
-    # for order in orders['orders']:
-    #     if order['status'] not in {"Cancelled", "Inactive"}:
-    #         pprint(order)
-    #     else:
-    #         pprint(order['order_ref'])
-    clear_and_place_target_orders(client, account_id, campaigns)
 
+def get_target_orders(campaigns: Dict[int, Campaign]) -> List[Dict]:
+    target_orders = []
+    for und_conid in campaigns.keys():
+        camp = campaigns[und_conid]
+        target_orders.extend(camp.get_target_orders())
+    return target_orders
+
+
+def get_priced_target_orders(campaigns: Dict[int, Campaign]) -> Tuple[List[Dict], Set[int]]:
+    """
+        The target orders of the campaigns whose targets all have a price, and the conids of the
+        campaigns held back because one of theirs has none. Their live orders are left as they
+        are, like the daemon does.
+    """
+    target_orders = []
+    deferred = set()  # conids of underlyings with a target not priced yet
+    for und_conid in campaigns.keys():
+        targets = campaigns[und_conid].get_target_orders()
+        if any(order.get('price') is None for order in targets):
+            deferred.update(campaigns[und_conid].positions.keys())
+            continue
+        target_orders.extend(targets)
+    if deferred:
+        print("NO TARGET PRICE, ORDERS LEFT AS THEY ARE FOR CONIDS: {}".format(sorted(deferred)))
+    return target_orders, deferred
+
+
+def without_conids(live_orders: Dict, conids: Set[int]) -> Dict:
+    """The live orders response without the orders for conids, so reconciling leaves those alone."""
+    return dict(live_orders or {}, orders=[order for order in (live_orders or {}).get('orders', [])
+                                           if int(order['conid']) not in conids])
+
+
+def reconcile_target_orders(client, account_id: str, campaigns: Dict[int, Campaign], live_orders: Dict = None):
+    target_orders, deferred = get_priced_target_orders(campaigns)
+    if deferred:
+        live_orders = client.get_live_orders() if live_orders is None else live_orders
+        live_orders = without_conids(live_orders, deferred)
+    result = OrderReconciler(client, account_id).reconcile(target_orders, live_orders)
+    pprint(result)
+    return result
+
+
+def process_accounts(client, account_ids: List[str], metrics: Metrics, max_workers: int = 4,
+                     store: SnapshotStore = None, target_pricer: TargetPricer = None) -> Dict[str, Dict]:
+    """
+        Runs the pipeline for several accounts at once. Positions are paged in and orders
+        reconciled for up to max_workers accounts concurrently, while the contract details and
+        prices are requested once for the conids of all accounts together, so a conid held in
+        ten accounts is fetched once. With a store the run is appended to it. Positions and
+        prices are always requested fresh, a one-shot run has nothing to hydrate from the store
+        that it wouldn't request again; contract details come from the client's SecdefCache.
+        Only PortfolioDaemon hydrates from the store. Returns the positions, campaigns and
+        reconcile result of every account.
+    """
+    accounts = {account_id: {} for account_id in account_ids}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(account_ids)))) as executor:
+        with metrics.span("positions"):
+            books = executor.map(lambda account_id: get_positions(client, account_id), account_ids)
+            for account_id, positions in zip(account_ids, books):
+                accounts[account_id]['positions'] = positions
+
+        # one position per conid stands in for all the accounts holding it
+        all_positions = {}
+        for account in accounts.values():
+            for conid, pos in account['positions'].items():
+                all_positions.setdefault(conid, pos)
+
+        with metrics.span("secdefs"):
+            detail_list = client.contracts_definitions(list(all_positions.keys()))
+            for account in accounts.values():
+                apply_positions_detail(account['positions'], detail_list)
+        with metrics.span("prices"):
+            und_conids = [pos.contract.und_conid for pos in all_positions.values()]
+            snapshots, missing = SnapshotFetcher(client).fetch(und_conids + list(all_positions.keys()))
+            if missing:
+                print("NO MARKET DATA FOR CONIDS: {}".format(missing))
+            for account in accounts.values():
+                apply_positions_mkt_price(account['positions'], snapshots, [])
+        with metrics.span("campaigns"):
+            for account in accounts.values():
+                account['campaigns'] = get_campaigns(account['positions'])
+            campaigns = [campaign for account in accounts.values() for campaign in account['campaigns'].values()]
+            # closing targets of the short legs, by the curve of their underlying or campaign type
+            (TARGET_PRICER if target_pricer is None else target_pricer).price(campaigns)
+            # margin and implied capital of every campaign, revalued over the scenario grid in one pass
+            RiskGrid(campaigns).compute().write_back()
+
+        with metrics.span("orders"):
+            live_orders = client.get_live_orders()  # the orders of every account
+            results = executor.map(lambda account_id: reconcile_target_orders(
+                client, account_id, accounts[account_id]['campaigns'], live_orders), account_ids)
+            for account_id, result in zip(account_ids, results):
+                accounts[account_id]['orders'] = result
+
+    if store is not None:
+        with metrics.span("snapshot"):
+            store.append({account_id: account['positions'] for account_id, account in accounts.items()})
+    return accounts
+
+
+def main(client: IBClient = None, metrics: Metrics = None, metrics_path: str = None,
+         max_workers: int = 4, store: SnapshotStore = None):
+    if metrics is None:
+        metrics = Metrics()
+    if client is None:
+        client = IBClient(secdef_cache=SecdefCache(), scheduler=RequestScheduler(), metrics=metrics)
+        store = SnapshotStore() if store is None else store
+
+    with metrics.span("accounts"):
+        account_ids = get_account_ids(client)
+    accounts = process_accounts(client, account_ids, metrics, max_workers=max_workers, store=store)
 
     #write_google_sheet(positions)
 
+    if metrics_path:
+        with open(metrics_path, "w") as f:
+            f.write(metrics.to_json())
+
+    return accounts
+
+
+def stream_url(client: IBClient) -> str:
+    """The websocket of the gateway the client talks to."""
+    url = urlparse(client.baseUrl)
+    return "{}://{}/v1/api/ws".format("wss" if url.scheme == "https" else "ws", url.netloc)
+
+
+def run_daemon(client: IBClient = None, interval: float = 60, positions_every: int = 5, cycles: int = None,
+               store: SnapshotStore = None, stream: bool = True):
+    """
+        Keeps the portfolio in memory and re-runs only what changed every `interval` seconds,
+        starting from the last snapshot in the store. Prices stream in over the gateway websocket;
+        snapshots are only polled for conids the stream hasn't priced yet, or for everything
+        with stream=False.
+    """
+    if client is None:
+        client = IBClient(secdef_cache=SecdefCache(), scheduler=RequestScheduler(), metrics=Metrics())
+        store = SnapshotStore() if store is None else store
+    market_data = None
+    if stream:
+        market_data = MarketDataStream(url=stream_url(client), session_id=(client.tickle() or {}).get('session'))
+    daemon = PortfolioDaemon(client, get_account_ids(client), interval=interval, positions_every=positions_every,
+                             poll_prices=not stream, store=store, target_pricer=TARGET_PRICER, stream=market_data)
+    if store is not None:
+        daemon.hydrate(store.latest())
+    if market_data is not None:
+        market_data.start()
+    try:
+        daemon.run(cycles=cycles)
+    finally:
+        if market_data is not None:
+            market_data.close()
+    return daemon
+
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--daemon', action='store_true', help="keep running, one cycle every --interval seconds")
+    parser.add_argument('--interval', type=float, default=60)
+    parser.add_argument('--poll-prices', action='store_true',
+                        help="with --daemon, poll price snapshots every cycle instead of streaming them")
+    parser.add_argument('--metrics', metavar='PATH', help="write the request and phase metrics of the run as json")
+    args = parser.parse_args()
+    if args.daemon:
+        run_daemon(interval=args.interval, stream=not args.poll_prices)
+    else:
+        main(metrics_path=args.metrics)